@@ -0,0 +1,63 @@
+"""
+Per-turn budgets for the tool loop in run_turn_stream.
+
+    - max_model_calls: model calls per turn, including the final answer
+    - max_tool_calls: tool calls per turn; calls beyond it get a BUDGET_EXHAUSTED result instead of running
+    - max_wall_s: turn wall time, checked before each model call and enforced while one streams (the
+      stream is closed and the turn ends with an error: there is no time left for an answer)
+    - max_input_tokens: provider-reported input tokens summed over the turn's model calls
+
+When one runs out, the runner emits a "budget_exhausted" event and makes one last model call with
+tool_choice="none" (same tools block, so the prompt cache still hits), asking the model to answer with
+what it already has. Defaults come from TURN_MAX_MODEL_CALLS / TURN_MAX_TOOL_CALLS / TURN_MAX_WALL_S /
+TURN_MAX_INPUT_TOKENS.
+"""
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+BUDGET_NOTE = (
+    "The tool budget for this turn is used up. Do not call tools. Answer with the information "
+    "already gathered, and say briefly what could not be checked."
+)
+
+BUDGET_TOOL_OUTPUT: Dict[str, Any] = {
+    "ok": False,
+    "error": {"code": "BUDGET_EXHAUSTED", "message": "Tool call budget for this turn is used up."},
+}
+
+
+@dataclass(frozen=True)
+class TurnBudget:
+    max_model_calls: int = 8
+    max_tool_calls: int = 16
+    max_wall_s: float = 90.0
+    max_input_tokens: int = 100_000
+
+    @classmethod
+    def from_env(cls) -> "TurnBudget":
+        return cls(
+            max_model_calls=int(os.getenv("TURN_MAX_MODEL_CALLS", "8")),
+            max_tool_calls=int(os.getenv("TURN_MAX_TOOL_CALLS", "16")),
+            max_wall_s=float(os.getenv("TURN_MAX_WALL_S", "90")),
+            max_input_tokens=int(os.getenv("TURN_MAX_INPUT_TOKENS", "100000")),
+        )
+
+    def exhausted(self, metrics: Any, elapsed_s: float) -> Optional[Dict[str, Any]]:
+        """Before a model call: the first budget that leaves no room for another tool round, else None."""
+        checks = (
+            # the next call is the last one allowed, so it has to be the answer
+            ("model_calls", metrics.model_calls + 1, self.max_model_calls),
+            ("tool_calls", metrics.tool_calls, self.max_tool_calls),
+            ("wall_s", round(elapsed_s, 2), self.max_wall_s),
+            ("input_tokens", metrics.input_tokens, self.max_input_tokens),
+        )
+        for budget, used, limit in checks:
+            if used >= limit:
+                return {"budget": budget, "used": used, "limit": limit}
+        return None
+
+
+TURN_BUDGET = TurnBudget.from_env()
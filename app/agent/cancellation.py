@@ -0,0 +1,69 @@
+"""
+Cross-thread cancellation for a running turn.
+
+The web layer (event loop) cancels; the runner (threadpool thread, usually blocked reading the model
+stream) observes it. Callbacks registered with on_cancel run immediately in the cancelling thread,
+which is how the runner gets its blocked upstream stream closed instead of waiting for the next event.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional
+
+logger = logging.getLogger("pharmacy_agent.agent")
+
+
+class CancelToken:
+    def __init__(self) -> None:
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        self.reason: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for cb in callbacks:
+            try:
+                cb()
+            except Exception:
+                logger.debug("cancel callback failed", exc_info=True)
+
+    def on_cancel(self, cb: Callable[[], None]) -> Callable[[], None]:
+        """Run cb on cancel (now, if already cancelled). Returns an unregister function."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(cb)
+                return lambda: self._remove(cb)
+        cb()
+        return lambda: None
+
+    def _remove(self, cb: Callable[[], None]) -> None:
+        with self._lock:
+            if cb in self._callbacks:
+                self._callbacks.remove(cb)
+
+
+def wait_for(future: "Future[Any]", cancel: Optional[CancelToken], timeout_s: float) -> bool:
+    """
+    Wait until future is done, at most timeout_s, returning early when cancel is set.
+    True if the future finished (successfully or not).
+    """
+    woken = threading.Event()
+    future.add_done_callback(lambda _: woken.set())
+    unregister = cancel.on_cancel(woken.set) if cancel is not None else (lambda: None)
+    try:
+        woken.wait(timeout_s)
+    finally:
+        unregister()
+    return future.done()
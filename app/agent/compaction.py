@@ -0,0 +1,146 @@
+"""
+Compaction of tool outputs before they are fed back to the model.
+
+The client still receives the full dispatch_tool output (tool_result event); only the
+function_call_output string sent to the model is compacted:
+    - nulls and known default values are dropped
+    - fields identical across every item of a list are hoisted once into "<list>_common"
+    - compact JSON (no spaces, raw UTF-8 instead of \\uXXXX escapes for Hebrew)
+    - a per-tool token budget: trailing list items are cut and "<list>_omitted": n is added;
+      for paged tools next_cursor is moved back to right after the last item kept, so the cut
+      items come on the next page instead of being skipped
+    - next_cursor is only shown to the model while has_more is true
+    - interaction pairs are ordered by severity before the cut, and "avoid" pairs are never cut
+      (there is no cursor to fetch them again)
+Token counts are estimates (~4 bytes per token); no tokenizer dependency.
+"""
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Tuple
+
+from app.tools.inventory import PAGED_LISTS
+from app.tools.paging import rekey_cursor
+
+DEFAULT_TOOL_TOKEN_BUDGET = int(os.getenv("PHARMACY_TOOL_TOKEN_BUDGET", "1200"))
+TOOL_TOKEN_BUDGETS: Dict[str, int] = {
+    "inventory_check": DEFAULT_TOOL_TOKEN_BUDGET,
+    "inventory_find_equivalent": DEFAULT_TOOL_TOKEN_BUDGET,
+    "prescription_verify": 400,
+    "interaction_check": DEFAULT_TOOL_TOKEN_BUDGET,
+}
+
+# key -> value that carries no information for the model
+_DROP_DEFAULTS: Dict[str, Any] = {
+    "has_more": False,
+}
+
+_BYTES_PER_TOKEN = 4
+
+_SEVERITY = {"avoid": 0, "caution": 1, "none": 2}
+
+# tool -> (list field, rank of an item: lower is kept longer, items that must never be cut)
+_RANKED_LISTS: Dict[str, Tuple[str, Callable[[Dict[str, Any]], int], Callable[[Dict[str, Any]], bool]]] = {
+    "interaction_check": (
+        "pairs",
+        lambda p: _SEVERITY.get(p.get("level"), len(_SEVERITY)),
+        lambda p: p.get("level") == "avoid",
+    ),
+}
+
+
+@dataclass
+class CompactionResult:
+    text: str
+    raw_tokens: int
+    sent_tokens: int
+    omitted_items: int = 0
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text.encode("utf-8")) + _BYTES_PER_TOKEN - 1) // _BYTES_PER_TOKEN
+
+
+def _dumps(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def _prune(value: Any) -> Any:
+    if isinstance(value, dict):
+        out = {}
+        for k, v in value.items():
+            if v is None or (k in _DROP_DEFAULTS and v == _DROP_DEFAULTS[k]):
+                continue
+            out[k] = _prune(v)
+        return out
+    if isinstance(value, list):
+        return [_prune(v) for v in value]
+    return value
+
+
+def _hoist_common(obj: Dict[str, Any]) -> Dict[str, Any]:
+    """Move fields shared by every item of a list of dicts into "<key>_common"."""
+    out: Dict[str, Any] = {}
+    for key, value in obj.items():
+        out[key] = value
+        if not (isinstance(value, list) and len(value) > 1 and all(isinstance(v, dict) for v in value)):
+            continue
+        first = value[0]
+        common = {k: v for k, v in first.items() if all(k in item and item[k] == v for item in value[1:])}
+        # ids always stay on the item
+        common.pop("med_id", None)
+        if common:
+            out[key] = [{k: v for k, v in item.items() if k not in common} for item in value]
+            out[f"{key}_common"] = common
+    return out
+
+
+def compact_tool_output(name: str, output: Dict[str, Any], budget_tokens: int = 0) -> CompactionResult:
+    """Compact one dispatch_tool output for the model; budget_tokens=0 uses the per-tool default."""
+    budget = budget_tokens or TOOL_TOKEN_BUDGETS.get(name, DEFAULT_TOOL_TOKEN_BUDGET)
+    raw_tokens = estimate_tokens(json.dumps(output))  # what was sent before compaction
+
+    compact = _hoist_common(_prune(output))
+    if not output.get("has_more"):
+        compact.pop("next_cursor", None)  # points at an empty page
+    text = _dumps(compact)
+    omitted = 0
+
+    paged, item_key = PAGED_LISTS.get(name, (None, None))
+    cursor = output.get("next_cursor")
+
+    ranked, rank, keep = _RANKED_LISTS.get(name, (None, None, None))
+    ranked_items: List[Dict[str, Any]] = []  # uncut items in the order sent (hoisting may drop fields)
+    if ranked is not None and isinstance(compact.get(ranked), list):
+        order = sorted(range(len(compact[ranked])), key=lambda i: rank(output[ranked][i]))
+        compact[ranked] = [compact[ranked][i] for i in order]
+        ranked_items = [output[ranked][i] for i in order]
+
+    def cuttable(key: str, items: List[Any]) -> bool:
+        if key == paged and cursor:
+            return len(items) > 1  # keep one item to resume after
+        if key == ranked:
+            return not keep(ranked_items[len(items) - 1])
+        return True
+
+    # over budget: drop trailing items (results are already ranked) from the longest list
+    while estimate_tokens(text) > budget:
+        lists: List[Tuple[int, str]] = [
+            (len(v), k) for k, v in compact.items() if isinstance(v, list) and v and cuttable(k, v)
+        ]
+        if not lists:
+            break
+        _, key = max(lists)
+        compact[key] = compact[key][:-1]
+        compact[f"{key}_omitted"] = compact.get(f"{key}_omitted", 0) + 1
+        omitted += 1
+        if key == paged and cursor:
+            # the hoisted items may lack key fields: take them from the uncut output
+            compact["has_more"] = True
+            compact["next_cursor"] = rekey_cursor(cursor, item_key(output[paged][len(compact[key]) - 1]))
+        text = _dumps(compact)
+
+    return CompactionResult(text=text, raw_tokens=raw_tokens, sent_tokens=estimate_tokens(text),
+                            omitted_items=omitted)
@@ -0,0 +1,130 @@
+"""
+Early tool dispatch: start a tool call as soon as its arguments are complete in the model stream.
+
+A response with several function calls streams each call's arguments and finishes it
+(response.function_call_arguments.done) long before response.completed. The runner hands each finished
+call to EarlyDispatch, which runs it on a background worker while the stream goes on. After completion
+the runner still processes calls in their original order, and only the plain dispatch step uses the
+early result: memo and prefetch hits and the tool budget run first, and an early result they make
+unnecessary is dropped (counted as wasted), as is one computed before a data change (app.db.changes).
+Only read-only tools start early, so a dropped result has no side effects. The rate-limit gate is asked
+before a call starts: a throttled call never reaches the DB, and its verdict is the one the in-order pass
+reports (the runner takes the gate's token once per call).
+The worker pool is shared by every turn: a call still queued when the in-order pass reaches it is
+cancelled and run inline, and a running one is waited for at most EARLY_TOOL_WAIT_S (less if the turn
+is cancelled). Both count as late.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.agent.cancellation import CancelToken, wait_for
+from app.agent.speculation import READ_ONLY_TOOLS
+from app.db.changes import current_version
+from app.db.database import QueryStats, collect_queries
+from app.tools.dispatcher import dispatch_tool
+
+EARLY_TOOL_DISPATCH = os.getenv("EARLY_TOOL_DISPATCH", "1") == "1"
+# longest wait for a running early call before it is dispatched inline instead
+EARLY_TOOL_WAIT_S = float(os.getenv("EARLY_TOOL_WAIT_S", "2"))
+
+logger = logging.getLogger("pharmacy_agent.agent")
+
+# (tool_name, call_id, args) -> None if the call may run, else the error envelope it gets instead
+Gate = Callable[[str, str, Dict[str, Any]], Optional[Dict[str, Any]]]
+
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("EARLY_TOOL_THREADS", "4")), thread_name_prefix="early-tool")
+
+
+@dataclass
+class EarlyResult:
+    output: Dict[str, Any]
+    version: int  # data version read before the call (for the per-turn memo)
+    db: QueryStats
+    seconds: float
+
+
+def _run(name: str, args: Dict[str, Any]) -> EarlyResult:
+    version = current_version()
+    started = time.perf_counter()
+    with collect_queries() as db:
+        output = dispatch_tool(name, args)
+    return EarlyResult(output, version, db, time.perf_counter() - started)
+
+
+class EarlyDispatch:
+    """Per-turn early-start state; counters feed TurnMetrics."""
+
+    def __init__(
+        self,
+        enabled: Optional[bool] = None,
+        gate: Optional[Gate] = None,
+        covered: Optional[Callable[[str, Dict[str, Any]], bool]] = None,
+        cancel: Optional[CancelToken] = None,
+        wait_s: float = EARLY_TOOL_WAIT_S,
+    ) -> None:
+        self.enabled = EARLY_TOOL_DISPATCH if enabled is None else enabled
+        self._gate = gate
+        self._covered = covered  # calls something else already answers (a scheduled prefetch)
+        self._cancel = cancel
+        self._wait_s = wait_s
+        self._pending: Dict[str, Tuple[str, Dict[str, Any], "Future[EarlyResult]"]] = {}
+        self.started = 0
+        self.used = 0
+        self.wasted = 0
+        self.late = 0  # not ready in time: the call was dispatched inline
+
+    def start(self, name: str, call_id: str, arguments: str) -> bool:
+        """A call's arguments are complete: run it now if it is read-only, parses and passes the gate."""
+        if not self.enabled or name not in READ_ONLY_TOOLS or not call_id or call_id in self._pending:
+            return False
+        try:
+            args = json.loads(arguments or "{}")
+        except json.JSONDecodeError:
+            return False  # the in-order pass reports it
+        if not isinstance(args, dict) or (self._covered is not None and self._covered(name, args)):
+            return False
+        if self._gate is not None and self._gate(name, call_id, args) is not None:
+            return False  # throttled: the in-order pass reports the refusal
+        self._pending[call_id] = (name, args, _executor.submit(_run, name, args))
+        self.started += 1
+        return True
+
+    def take(self, name: str, call_id: str, args: Dict[str, Any]) -> Optional[EarlyResult]:
+        """The early result for exactly this call, or None (caller dispatches normally)."""
+        entry = self._pending.pop(call_id, None)
+        if entry is None:
+            return None
+        started_name, started_args, future = entry
+        if (started_name, started_args) != (name, args):
+            future.cancel()
+            self.wasted += 1
+            return None
+        if future.cancel() or not wait_for(future, self._cancel, self._wait_s):
+            # still queued behind other turns' calls, or running too long: not worth waiting for
+            self.late += 1
+            return None
+        try:
+            result = future.result()
+        except Exception:
+            logger.exception("Early tool call failed", extra={"tool_name": name})
+            self.wasted += 1
+            return None
+        if current_version() != result.version:
+            self.wasted += 1  # data changed since: a fresh call might answer differently
+            return None
+        self.used += 1
+        return result
+
+    def close(self) -> None:
+        """Drop whatever was started but not used (refused, memo/prefetch hit, over budget, cancelled)."""
+        for _, _, future in self._pending.values():
+            future.cancel()
+        self.wasted += len(self._pending)
+        self._pending.clear()
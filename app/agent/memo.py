@@ -0,0 +1,67 @@
+"""
+Per-turn memo of tool results, so a repeated call (same tool, same canonical args) is answered without
+running dispatch_tool again.
+
+Stock and prescriptions change while a turn runs, so every entry remembers the data version
+(app.db.changes) read *before* its result was computed; a lookup only hits while the version is still
+the same, i.e. when a fresh call would return the same thing. Stock results also report qty_available,
+which a reservation's expiry raises without any write (so without a new version): those entries only hit
+until the earliest active reservation lapses. Only read-only tools are memoized, and transient failures
+never are.
+"""
+from __future__ import annotations
+
+import math
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from app.agent.speculation import READ_ONLY_TOOLS
+from app.db.changes import current_version
+from app.tools.dispatcher import canonical_tool_args
+from app.tools.reservations import next_expiry
+
+# errors that a retry might not repeat
+TRANSIENT_ERRORS = frozenset({"DB_ERROR", "TOOL_RUNTIME_ERROR", "INVALID_TOOL_OUTPUT"})
+# tools whose results include qty_available (net of active reservations)
+STOCK_TOOLS = frozenset({"inventory_check", "inventory_find_equivalent"})
+
+
+class ToolMemo:
+    def __init__(self) -> None:
+        self._entries: Dict[str, Tuple[int, float, Dict[str, Any]]] = {}  # (version, valid until, output)
+        self.hits = 0
+        self.stale = 0
+
+    def version(self) -> int:
+        """Read before computing a result you intend to put()."""
+        return current_version()
+
+    def get(self, name: str, args: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if name not in READ_ONLY_TOOLS or not self._entries:
+            return None
+        key = canonical_tool_args(name, args)
+        entry = self._entries.get(key) if key is not None else None
+        if entry is None:
+            return None
+        version, valid_until, output = entry
+        if current_version() != version or time.time() >= valid_until:
+            del self._entries[key]
+            self.stale += 1
+            return None
+        self.hits += 1
+        return output
+
+    def put(self, name: str, args: Dict[str, Any], output: Dict[str, Any], version: int) -> None:
+        if name not in READ_ONLY_TOOLS:
+            return
+        error = output.get("error") or {}
+        if not output.get("ok") and error.get("code") in TRANSIENT_ERRORS:
+            return
+        key = canonical_tool_args(name, args)
+        if key is None:
+            return
+        valid_until = math.inf
+        if name in STOCK_TOOLS:
+            # a hold created since the result was computed is a write: the version check covers it
+            valid_until = next_expiry() or math.inf
+        self._entries[key] = (version, valid_until, output)
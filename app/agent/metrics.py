@@ -0,0 +1,152 @@
+"""
+Per-turn counters reported by run_turn_stream (as a "metrics" event just before "done"), and the
+optional latency breakdown (a "perf" event, after "metrics").
+"""
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+
+@dataclass
+class TurnMetrics:
+    model_calls: int = 0
+    tool_calls: int = 0
+    # request size: input items sent over all model calls; chained = sent with previous_response_id
+    input_items_sent: int = 0
+    chained_calls: int = 0
+    chain_fallbacks: int = 0
+    # tool outputs fed back to the model (estimated tokens, see app/agent/compaction.py)
+    tool_tokens_raw: int = 0
+    tool_tokens_sent: int = 0
+    tool_items_omitted: int = 0
+    # provider usage summed over the turn's model calls; cached = served from the prompt cache
+    input_tokens: int = 0
+    cached_input_tokens: int = 0
+    output_tokens: int = 0
+    prompt_cache_key: Optional[str] = None
+    # speculative prefetch (app/agent/speculation.py): hits were served without a dispatch
+    prefetch_submitted: int = 0
+    prefetch_hits: int = 0
+    prefetch_stale: int = 0
+    prefetch_wasted: int = 0
+    prefetch_refused: int = 0  # predictions the rate-limit gate did not allow
+    prefetch_late: int = 0  # claimed but not ready in time (queued or slow): dispatched inline
+    # tool calls started while the model was still streaming (app/agent/early.py); wasted = not needed
+    early_started: int = 0
+    early_used: int = 0
+    early_wasted: int = 0
+    early_late: int = 0  # not ready in time (queued or slow): dispatched inline
+    # repeats of an earlier call in the turn answered from the per-turn memo (app/agent/memo.py)
+    tool_calls_deduped: int = 0
+    # tool calls answered with an error envelope by the caller's tool_gate (e.g. rate limits)
+    tool_calls_refused: int = 0
+    # per-turn budget (app/agent/budget.py): which one ran out, and tool calls not run because of it
+    budget_exhausted: Optional[str] = None
+    tool_calls_skipped: int = 0
+    # turn abandoned (client went away): work done for nobody
+    cancelled: bool = False
+    wasted_model_calls: int = 0
+    wasted_tool_calls: int = 0
+
+    @property
+    def tool_tokens_saved(self) -> int:
+        return self.tool_tokens_raw - self.tool_tokens_sent
+
+    @property
+    def cached_ratio(self) -> float:
+        return round(self.cached_input_tokens / self.input_tokens, 3) if self.input_tokens else 0.0
+
+    def add_usage(self, usage: Any) -> None:
+        """Accumulate a Responses API usage object (missing fields count as 0)."""
+        if usage is None:
+            return
+        details = getattr(usage, "input_tokens_details", None)
+        self.input_tokens += getattr(usage, "input_tokens", 0) or 0
+        self.cached_input_tokens += getattr(details, "cached_tokens", 0) or 0
+        self.output_tokens += getattr(usage, "output_tokens", 0) or 0
+
+    def add_speculation(self, speculator: Any) -> None:
+        self.prefetch_submitted += speculator.submitted
+        self.prefetch_hits += speculator.hits
+        self.prefetch_stale += speculator.stale
+        self.prefetch_wasted += speculator.wasted
+        self.prefetch_refused += speculator.refused
+        self.prefetch_late += speculator.late
+
+    def add_early(self, early: Any) -> None:
+        self.early_started += early.started
+        self.early_used += early.used
+        self.early_wasted += early.wasted
+        self.early_late += early.late
+
+    def as_event(self) -> Dict[str, Any]:
+        return {
+            "type": "metrics",
+            **asdict(self),
+            "tool_tokens_saved": self.tool_tokens_saved,
+            "cached_ratio": self.cached_ratio,
+        }
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+@dataclass
+class TurnPerf:
+    """
+    Where a turn's time went, for diagnosing slow turns from the client:
+    - iterations: one per model call (latency to response.completed, time to first delta, usage)
+    - tools: one per tool call (wall time, DB statements and time; prefetched calls ran in the background,
+      deduped ones were answered from the turn's memo; early ones ran while the model was still
+      streaming, and ms is their own run time)
+    """
+    iterations: List[Dict[str, Any]] = field(default_factory=list)
+    tools: List[Dict[str, Any]] = field(default_factory=list)
+
+    def add_iteration(self, latency_s: float, ttft_s: Optional[float], usage: Any) -> None:
+        details = getattr(usage, "input_tokens_details", None)
+        self.iterations.append({
+            "model_ms": _ms(latency_s),
+            "ttft_ms": _ms(ttft_s),
+            "input_tokens": getattr(usage, "input_tokens", 0) or 0,
+            "cached_input_tokens": getattr(details, "cached_tokens", 0) or 0,
+            "output_tokens": getattr(usage, "output_tokens", 0) or 0,
+        })
+
+    def add_tool(
+        self,
+        name: str,
+        call_id: str,
+        seconds: float,
+        db: Any = None,
+        prefetched: bool = False,
+        deduped: bool = False,
+        early: bool = False,
+    ) -> None:
+        self.tools.append({
+            "name": name,
+            "call_id": call_id,
+            "ms": _ms(seconds),
+            "db_queries": db.count if db is not None else 0,
+            "db_ms": db.ms if db is not None else 0.0,
+            "prefetched": prefetched,
+            "deduped": deduped,
+            "early": early,
+        })
+
+    def as_event(self, turn_s: float) -> Dict[str, Any]:
+        return {
+            "type": "perf",
+            "turn_ms": _ms(turn_s),
+            "model_iterations": len(self.iterations),
+            "model_ms": round(sum(it["model_ms"] for it in self.iterations), 1),
+            "tool_ms": round(sum(t["ms"] for t in self.tools), 1),
+            "db_queries": sum(t["db_queries"] for t in self.tools),
+            "db_ms": round(sum(t["db_ms"] for t in self.tools), 2),
+            "input_tokens": sum(it["input_tokens"] for it in self.iterations),
+            "output_tokens": sum(it["output_tokens"] for it in self.iterations),
+            "iterations": self.iterations,
+            "tools": self.tools,
+        }
@@ -0,0 +1,55 @@
+"""
+Stable request prefix for provider-side prompt caching.
+
+Every responses.create call starts with the same instructions + tools block. Caching only hits when
+that prefix is byte-identical, so it is built once per process from deterministic parts (sorted
+tools, key-sorted schemas) and fingerprinted; the fingerprint is sent as prompt_cache_key so
+requests from every worker land on the same cache.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
+
+from app.agent.system_prompt import SYSTEM_PROMPT
+from app.agent.tool_schemas import build_openai_function_tools
+
+
+@dataclass(frozen=True)
+class RequestPrefix:
+    instructions: str
+    tools: Tuple[Dict[str, Any], ...]
+    cache_key: str
+
+
+_PREFIXES: Dict[str, RequestPrefix] = {}
+
+
+def get_request_prefix(model: str) -> RequestPrefix:
+    prefix = _PREFIXES.get(model)
+    if prefix is None:
+        tools = tuple(build_openai_function_tools())
+        canonical = json.dumps(
+            {"model": model, "instructions": SYSTEM_PROMPT, "tools": tools},
+            sort_keys=True,
+            separators=(",", ":"),
+            ensure_ascii=False,
+        )
+        digest = hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+        prefix = RequestPrefix(SYSTEM_PROMPT, tools, f"pharmacy-agent-{digest}")
+        _PREFIXES[model] = prefix
+    return prefix
+
+
+def canonical_history(history: List[Any]) -> List[Any]:
+    """Client history with a fixed key order (role, content first), so resent turns stay byte-identical."""
+    out: List[Any] = []
+    for item in history:
+        if isinstance(item, dict):
+            head = {k: item[k] for k in ("role", "content") if k in item}
+            out.append({**head, **{k: item[k] for k in sorted(item) if k not in head}})
+        else:
+            out.append(item)
+    return out
@@ -0,0 +1,167 @@
+"""
+Offline replay backend for the runner: a scripted stand-in for the OpenAI client.
+
+    client = ReplayClient([
+        [function_call("inventory_check", {"query": "PainAway"})],
+        [message("PainAway is out of stock.")],
+    ])
+    run_turn_stream(user_text="...", client=client)
+
+Each responses.create call consumes the next scripted response and streams it back as Responses API
+events (per function call: output_item.added, argument deltas, function_call_arguments.done,
+output_item.done; per message: output_text deltas; then response.completed; a stream_error item ends
+the stream with an "error" event instead, and the response never completes). event_delay_s sleeps
+before every event, to stand in for generation time. Every request is recorded (client.requests),
+and previous_response_id is checked the way the provider does it: it must name a response this
+client produced, and the chained input may only carry items the model has not seen yet.
+"""
+from __future__ import annotations
+
+import json
+import re
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class ReplayError(RuntimeError):
+    pass
+
+
+def function_call(name: str, arguments: Dict[str, Any], call_id: Optional[str] = None) -> Dict[str, Any]:
+    return {"type": "function_call", "name": name, "arguments": json.dumps(arguments), "call_id": call_id}
+
+
+def message(text: str) -> Dict[str, Any]:
+    return {"type": "message", "text": text}
+
+
+def stream_error(message: str, code: str = "server_error") -> Dict[str, Any]:
+    return {"type": "error", "message": message, "code": code}
+
+
+def _item_json(item: Any) -> Any:
+    if isinstance(item, SimpleNamespace):
+        return {k: _item_json(v) for k, v in vars(item).items()}
+    if isinstance(item, list):
+        return [_item_json(v) for v in item]
+    return item
+
+
+def request_bytes(request: Dict[str, Any]) -> int:
+    """Serialized size of a recorded request's input (what would go over the wire)."""
+    return len(json.dumps(_item_json(request.get("input", [])), ensure_ascii=False).encode("utf-8"))
+
+
+class _Responses:
+    def __init__(self, owner: "ReplayClient") -> None:
+        self._owner = owner
+
+    def create(self, **kwargs: Any) -> Iterator[Any]:
+        return self._owner._create(kwargs)
+
+
+class ReplayClient:
+    def __init__(
+        self,
+        script: List[List[Dict[str, Any]]],
+        *,
+        reject_chaining: bool = False,
+        rejection: str = "raise",
+        event_delay_s: float = 0.0,
+    ) -> None:
+        self.script = list(script)
+        self.reject_chaining = reject_chaining  # simulate a provider/store that lost the response
+        # how an unknown previous_response_id is reported: "raise" from create(), or "event" in the stream
+        self.rejection = rejection
+        self.event_delay_s = event_delay_s
+        self.requests: List[Dict[str, Any]] = []
+        self.responses = _Responses(self)
+        self._issued: Dict[str, List[str]] = {}  # response id -> call_ids it asked for
+
+    @classmethod
+    def from_file(cls, path: Path, **kwargs: Any) -> "ReplayClient":
+        """JSON: a list of responses, each a list of {"type": "function_call"|"message", ...} items."""
+        return cls(json.loads(Path(path).read_text(encoding="utf-8")), **kwargs)
+
+    def _create(self, kwargs: Dict[str, Any]) -> Iterator[Any]:
+        self.requests.append(kwargs)
+        previous = kwargs.get("previous_response_id")
+        if previous is not None:
+            if self.reject_chaining or previous not in self._issued:
+                error = f"Previous response with id '{previous}' not found."
+                if self.rejection == "event":
+                    return self._paced(iter([
+                        SimpleNamespace(type="response.created", response=SimpleNamespace(id=None, output=[])),
+                        SimpleNamespace(type="error", code="previous_response_not_found", message=error,
+                                        param="previous_response_id"),
+                    ]))
+                raise ReplayError(error)
+            outputs = [i for i in kwargs["input"] if isinstance(i, dict)]
+            if {i.get("call_id") for i in outputs} != set(self._issued[previous]) or any(
+                i.get("type") != "function_call_output" for i in outputs
+            ):
+                raise ReplayError("Chained input must be exactly the outputs of the previous response's calls.")
+        if not self.script:
+            raise ReplayError("Replay script exhausted.")
+
+        n = len(self._issued) + 1
+        response_id = f"resp_replay_{n}"
+        output: List[Any] = []
+        call_ids: List[str] = []
+        for k, spec in enumerate(self.script.pop(0)):
+            if spec["type"] == "error":
+                output.append(SimpleNamespace(type="error", code=spec["code"], message=spec["message"]))
+            elif spec["type"] == "function_call":
+                call_id = spec.get("call_id") or f"call_{n}_{k}"
+                call_ids.append(call_id)
+                output.append(SimpleNamespace(
+                    type="function_call", id=f"fc_{n}_{k}", call_id=call_id,
+                    name=spec["name"], arguments=spec["arguments"], status="completed",
+                ))
+            else:
+                output.append(SimpleNamespace(
+                    type="message", id=f"msg_{n}_{k}", role="assistant", status="completed",
+                    content=[SimpleNamespace(type="output_text", text=spec["text"], annotations=[])],
+                ))
+        self._issued[response_id] = call_ids
+
+        usage = SimpleNamespace(
+            input_tokens=request_bytes(kwargs) // 4,
+            input_tokens_details=SimpleNamespace(cached_tokens=0),
+            output_tokens=0,
+        )
+        response = SimpleNamespace(id=response_id, output=output, usage=usage)
+        return self._paced(self._stream(response))
+
+    def _paced(self, events: Iterator[Any]) -> Iterator[Any]:
+        for event in events:
+            if self.event_delay_s:
+                time.sleep(self.event_delay_s)
+            yield event
+
+    @staticmethod
+    def _stream(response: Any) -> Iterator[Any]:
+        for index, item in enumerate(response.output):
+            if item.type == "error":
+                yield SimpleNamespace(type="error", code=item.code, message=item.message, param=None)
+                return
+            if item.type == "message":
+                for part in item.content:
+                    for chunk in re.findall(r"\s*\S+", part.text):
+                        yield SimpleNamespace(type="response.output_text.delta", delta=chunk)
+            elif item.type == "function_call":
+                added = SimpleNamespace(**{**vars(item), "arguments": "", "status": "in_progress"})
+                yield SimpleNamespace(type="response.output_item.added", output_index=index, item=added)
+                for k in range(0, len(item.arguments), 16):
+                    yield SimpleNamespace(
+                        type="response.function_call_arguments.delta", item_id=item.id, output_index=index,
+                        delta=item.arguments[k:k + 16],
+                    )
+                yield SimpleNamespace(
+                    type="response.function_call_arguments.done", item_id=item.id, output_index=index,
+                    arguments=item.arguments,
+                )
+                yield SimpleNamespace(type="response.output_item.done", output_index=index, item=item)
+        yield SimpleNamespace(type="response.completed", response=response)
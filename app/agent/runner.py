@@ -1,18 +1,30 @@
 from __future__ import annotations
 
 import json
-from typing import Any, Dict, Generator, List, Optional
+import logging
+import os
+from typing import Any, Callable, Dict, Generator, Iterator, List, Optional, Tuple
 import re
-
-from openai import OpenAI
-
-from app.agent.system_prompt import SYSTEM_PROMPT
-from app.agent.tool_schemas import build_openai_function_tools
+import threading
+import time
+
+from app.agent.budget import BUDGET_NOTE, BUDGET_TOOL_OUTPUT, TURN_BUDGET, TurnBudget
+from app.agent.cancellation import CancelToken
+from app.agent.compaction import compact_tool_output
+from app.agent.early import EarlyDispatch
+from app.agent.memo import ToolMemo
+from app.agent.metrics import TurnMetrics, TurnPerf
+from app.agent.prompt_cache import canonical_history, get_request_prefix
+from app.agent.speculation import Speculator
+from app.db.database import collect_queries
 from app.tools.dispatcher import dispatch_tool
 
 AgentEvent = Dict[str, Any]
 InputItem = Dict[str, Any]
 
+# chain tool-loop iterations with previous_response_id (responses must be stored provider-side)
+CHAIN_RESPONSES = os.getenv("CHAIN_RESPONSES", "0") == "1"
+
 HEBREW_CHARS_RE = re.compile(r"[\u0590-\u05FF]")
 HEBREW_ADVICE_RE = re.compile(
     r"(מה\s*(כדאי|מומלץ)\s*לקחת|מה\s*לקחת|כאב|כאבים|בחזה|תסמינים|כואב)",
@@ -24,6 +36,27 @@ HEBREW_REFUSAL_TEXT = (
     "פנה/י לאיש מקצוע רפואי או לרופא/ה לקבלת הנחיה מתאימה."
 )
 
+logger = logging.getLogger("pharmacy_agent.agent")
+
+_client: Any = None
+_client_lock = threading.Lock()
+
+
+def default_client() -> Any:
+    """
+    Process-wide OpenAI client, built on first use.
+    The SDK import is most of our import time, so the CLI, evals and replay runs that never
+    call the model don't pay for it; the server pays it during warm-up (app/web/warmup.py).
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import OpenAI
+
+                _client = OpenAI()
+    return _client
+
 
 def _extract_function_calls(response_obj: Any) -> List[Dict[str, Any]]:
     calls: List[Dict[str, Any]] = []
@@ -39,11 +72,32 @@ def _extract_function_calls(response_obj: Any) -> List[Dict[str, Any]]:
     return calls
 
 
+def _function_call_output(name: str, call_id: str, tool_out: Dict[str, Any], metrics: TurnMetrics) -> InputItem:
+    """Model-facing copy of a tool result: compacted and budgeted (the client gets tool_out as-is)."""
+    compacted = compact_tool_output(name, tool_out)
+    metrics.tool_calls += 1
+    metrics.tool_tokens_raw += compacted.raw_tokens
+    metrics.tool_tokens_sent += compacted.sent_tokens
+    metrics.tool_items_omitted += compacted.omitted_items
+    return {
+        "type": "function_call_output",
+        "call_id": call_id,
+        "output": compacted.text,
+    }
+
+
 def run_turn_stream(
     *,
     user_text: str,
     history: Optional[List[InputItem]] = None,  # JSON-safe history ONLY
     model: str = "gpt-5",
+    client: Any = None,
+    chain_responses: Optional[bool] = None,
+    cancel: Optional[CancelToken] = None,
+    perf: bool = False,
+    tool_gate: Optional[Callable[[str, Dict[str, Any]], Optional[Dict[str, Any]]]] = None,
+    budget: Optional[TurnBudget] = None,
+    early_dispatch: Optional[bool] = None,
 ) -> Generator[AgentEvent, None, List[InputItem]]:
     """
     Multi-step tool calling with streaming (Responses API), while keeping returned history JSON-serializable.
@@ -52,9 +106,34 @@ def run_turn_stream(
     - client_history: returned to UI; must remain JSON-safe (role/content only)
 
     Includes a deterministic Hebrew safety gate for advice-like symptom requests.
+    Emits a "metrics" event (TurnMetrics) right before "done" (or before "error" when a model call fails).
+
+    - client: OpenAI-compatible client (default default_client(); see app/agent/replay.py for offline runs)
+    - chain_responses: after the first model call, send only the new function_call_output items with
+      previous_response_id instead of the whole runtime_input (default: CHAIN_RESPONSES env).
+      If a chained call is rejected (on create, or by an "error" event before any output), the turn
+      falls back to full resend.
+    - cancel: set by the caller when nobody is listening any more (client disconnected). The upstream
+      model stream is closed right away, remaining tool calls and prefetches are dropped, and the turn
+      ends without further events (its wasted work is logged).
+    - perf: also emit a "perf" event (TurnPerf: per-iteration model latency / time to first delta /
+      usage, per-tool time with DB statement count and time) between "metrics" and "done".
+    - tool_gate: called before each tool call with (name, args); a returned envelope is used as the
+      tool result instead of running the tool (rate limits, see app/web/ratelimit.py). If it also has
+      allows(name, args) -> bool (a check that takes nothing), predicted prefetches are scheduled only
+      while it returns True; they are charged through tool_gate when the model asks for them.
+    - budget: per-turn limits on model calls, tool calls, wall time and input tokens (default TURN_BUDGET).
+      When one runs out, a "budget_exhausted" event is emitted and a last model call without tools
+      answers with what the turn has gathered (see app/agent/budget.py). If the wall time runs out while
+      a model call is streaming, that call is closed and the turn ends with "budget_exhausted",
+      "metrics" and "error".
+    - early_dispatch: start read-only tool calls as soon as their arguments are complete in the stream,
+      before response.completed (default EARLY_TOOL_DISPATCH env; see app/agent/early.py). Results are
+      still consumed and fed back in call order.
     """
-    # JSON-safe history from client
-    client_history: List[InputItem] = list(history or [])
+    started = time.perf_counter()
+    # JSON-safe history from client (canonical key order keeps the resent prefix cacheable)
+    client_history: List[InputItem] = canonical_history(list(history or []))
     client_history.append({"role": "user", "content": user_text})
 
     if HEBREW_CHARS_RE.search(user_text) and HEBREW_ADVICE_RE.search(user_text):
@@ -63,62 +142,248 @@ def run_turn_stream(
         yield {"type": "done"}
         return client_history
 
-    client = OpenAI()
-    tools = build_openai_function_tools()
+    if client is None:
+        client = default_client()
+    if chain_responses is None:
+        chain_responses = CHAIN_RESPONSES
+    if cancel is None:
+        cancel = CancelToken()
+    if budget is None:
+        budget = TURN_BUDGET
+    prefix = get_request_prefix(model)
+    tools = list(prefix.tools)
 
     runtime_input: List[Any] = list(client_history)
 
     assistant_text_accum = ""
+    metrics = TurnMetrics(prompt_cache_key=prefix.cache_key)
+    turn_perf = TurnPerf()
+    speculator = Speculator(user_text, allows=getattr(tool_gate, "allows", None), cancel=cancel)
+    memo = ToolMemo()  # repeats of a call within this turn (while the data is unchanged)
+    gate_verdicts: Dict[str, Tuple[str, Dict[str, Any], Optional[Dict[str, Any]]]] = {}
+
+    def gate(name: str, call_id: str, args: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """tool_gate's verdict, asked once per call (an early start asks before the in-order pass)."""
+        if tool_gate is None:
+            return None
+        seen = gate_verdicts.get(call_id)
+        if seen is not None and seen[:2] == (name, args):
+            return seen[2]
+        verdict = tool_gate(name, args)
+        gate_verdicts[call_id] = (name, args, verdict)
+        return verdict
+
+    early = EarlyDispatch(early_dispatch, gate=gate, covered=speculator.pending, cancel=cancel)
+
+    previous_response_id: Optional[str] = None
+    pending: List[Any] = []  # items the model has not seen yet (chained mode)
+    final = False  # over budget: this model call answers without tools
+
+    def unchain(request: Dict[str, Any], reason: Any) -> None:
+        """A chained call was rejected (e.g. stored response expired / store disabled): resend everything, stop chaining."""
+        nonlocal chain_responses
+        logger.warning("Response chaining failed, resending full input: %s", reason)
+        metrics.chain_fallbacks += 1
+        chain_responses = False
+        metrics.input_items_sent += len(runtime_input) - len(pending)
+        request.pop("previous_response_id")
+        request["input"] = runtime_input
+
+    def wind_down() -> None:
+        """Stop background tool work and count it; every way a turn ends goes through here."""
+        watchdog.cancel()
+        speculator.close()
+        metrics.add_speculation(speculator)
+        early.close()
+        metrics.add_early(early)
+
+    def abandon() -> List[InputItem]:
+        wind_down()
+        metrics.cancelled = True
+        metrics.wasted_tool_calls += len(pending)  # computed, never seen by a model
+        logger.info("Turn cancelled", extra={"reason": cancel.reason, **metrics.as_event()})
+        return client_history
+
+    def fail(message: str) -> Iterator[AgentEvent]:
+        """
+        End the turn on a model-call error: "metrics", then "error" (callers stop reading at "error",
+        so everything else happens before it is yielded).
+        """
+        wind_down()
+        logger.warning("Turn failed: %s", message, extra=metrics.as_event())
+        yield metrics.as_event()
+        yield {"type": "error", "message": message}
+
+    def out_of_time() -> Iterator[AgentEvent]:
+        """max_wall_s passed while a model call was streaming: no time is left for an answer."""
+        exhausted = {"budget": "wall_s", "used": round(time.perf_counter() - started, 2), "limit": budget.max_wall_s}
+        metrics.budget_exhausted = "wall_s"
+        metrics.wasted_model_calls += 1
+        logger.info("Turn budget exhausted", extra=exhausted)
+        yield {"type": "budget_exhausted", **exhausted}
+        yield from fail("Turn wall time budget exhausted.")
+
+    # max_wall_s also bounds a model call in flight: when it passes, the stream is closed like on a cancel
+    # (except for the last, tool-free answer, which is what a turn out of budget gets)
+    overdue = CancelToken()
+    watchdog = threading.Timer(max(0.0, budget.max_wall_s - (time.perf_counter() - started)), overdue.cancel, ("wall_s",))
+    watchdog.daemon = True
+    watchdog.start()
+
+    def stopped() -> bool:
+        return cancel.cancelled or (overdue.cancelled and not final)
 
     while True:
+        if cancel.cancelled:
+            return abandon()
+        exhausted = None if final else budget.exhausted(metrics, time.perf_counter() - started)
+        if exhausted is not None:
+            final = True
+            metrics.budget_exhausted = exhausted["budget"]
+            logger.info("Turn budget exhausted", extra=exhausted)
+            yield {"type": "budget_exhausted", **exhausted}
+            note = {"role": "developer", "content": BUDGET_NOTE}
+            runtime_input.append(note)
+            pending.append(note)
         response_obj = None
+        chained = chain_responses and previous_response_id is not None
+        request: Dict[str, Any] = {
+            "model": model,
+            "instructions": prefix.instructions,
+            "tools": tools,
+            "input": pending if chained else runtime_input,
+            "prompt_cache_key": prefix.cache_key,
+            "stream": True,
+        }
+        if chained:
+            request["previous_response_id"] = previous_response_id
+        if final:
+            request["tool_choice"] = "none"  # tools block stays: same cacheable prefix
+        metrics.model_calls += 1
+        metrics.input_items_sent += len(request["input"])
+        call_started = time.perf_counter()
+        first_delta_s: Optional[float] = None
+        streaming_calls: Dict[str, Any] = {}  # output item id -> function_call item (name, call_id)
+        early_room = 0 if final else budget.max_tool_calls - metrics.tool_calls
         try:
-            stream = client.responses.create(
-                model=model,
-                instructions=SYSTEM_PROMPT,
-                tools=tools,
-                input=runtime_input,
-                stream=True,
-            )
-
-            for event in stream:
-                etype = getattr(event, "type", None)
-
-                if etype == "response.output_text.delta":
-                    assistant_text_accum += event.delta
-                    yield {"type": "text_delta", "delta": event.delta}
-
-                elif etype == "response.refusal.delta":
-                    assistant_text_accum += event.delta
-                    yield {"type": "text_delta", "delta": event.delta}
-
-                elif etype == "response.completed":
-                    response_obj = event.response
-
-                elif etype == "error":
-                    yield {"type": "error", "message": str(getattr(event, "error", event))}
-                    return client_history
+            try:
+                stream = client.responses.create(**request)
+            except Exception as e:
+                if not chained:
+                    raise
+                unchain(request, e)
+                chained = False
+                stream = client.responses.create(**request)
+
+            while True:
+                # a blocked read on the upstream stream ends as soon as the turn is cancelled
+                close = getattr(stream, "close", lambda: None)
+                unregister = cancel.on_cancel(close)
+                unwatch = overdue.on_cancel(close) if not final else (lambda: None)
+                rejected: Optional[str] = None
+                started_output = False
+                try:
+                    for event in stream:
+                        if stopped():
+                            break
+                        etype = getattr(event, "type", None)
+                        if first_delta_s is None and etype and etype.endswith(".delta"):
+                            first_delta_s = time.perf_counter() - call_started
+
+                        if etype == "response.output_text.delta":
+                            started_output = True
+                            assistant_text_accum += event.delta
+                            yield {"type": "text_delta", "delta": event.delta}
+
+                        elif etype == "response.refusal.delta":
+                            started_output = True
+                            assistant_text_accum += event.delta
+                            yield {"type": "text_delta", "delta": event.delta}
+
+                        elif etype == "response.output_item.added":
+                            started_output = True
+                            if getattr(event.item, "type", None) == "function_call":
+                                streaming_calls[event.item.id] = event.item
+
+                        elif etype == "response.function_call_arguments.done":
+                            item = streaming_calls.get(event.item_id)
+                            if item is not None:
+                                if early_room > 0 and not cancel.cancelled:
+                                    early.start(item.name, item.call_id, event.arguments)
+                                early_room -= 1  # every call takes a budget slot, started early or not
+
+                        elif etype == "response.completed":
+                            response_obj = event.response
+
+                        elif etype == "error":
+                            message = str(getattr(event, "message", None) or getattr(event, "error", event))
+                            if chained and not started_output:
+                                # the chained call was refused in the stream (e.g. previous_response_not_found)
+                                rejected = message
+                                break
+                            yield from fail(message)
+                            return client_history
+                finally:
+                    unregister()
+                    unwatch()
+                if rejected is None or stopped():
+                    break
+                getattr(stream, "close", lambda: None)()
+                unchain(request, rejected)
+                chained = False
+                stream = client.responses.create(**request)
+
+            if cancel.cancelled:
+                metrics.wasted_model_calls += 1
+                return abandon()
+            if stopped():
+                yield from out_of_time()
+                return client_history
 
             if response_obj is None:
-                yield {"type": "error", "message": "No completed response received."}
+                yield from fail("No completed response received.")
                 return client_history
+            metrics.chained_calls += int(chained)
+            metrics.add_usage(getattr(response_obj, "usage", None))
+            turn_perf.add_iteration(time.perf_counter() - call_started, first_delta_s, getattr(response_obj, "usage", None))
 
         except Exception as e:
-            yield {"type": "error", "message": f"OpenAI call failed: {e}"}
+            if cancel.cancelled:  # the stream was closed under us
+                metrics.wasted_model_calls += 1
+                return abandon()
+            if stopped():
+                yield from out_of_time()
+                return client_history
+            yield from fail(f"OpenAI call failed: {e}")
             return client_history
 
         runtime_input += response_obj.output
+        previous_response_id = getattr(response_obj, "id", None)
+        pending = []
 
         calls = _extract_function_calls(response_obj)
-        if not calls:
+        if not calls or final:
             client_history.append({"role": "assistant", "content": assistant_text_accum})
+            wind_down()
+            yield metrics.as_event()
+            if perf:
+                yield turn_perf.as_event(time.perf_counter() - started)
             yield {"type": "done"}
             return client_history
 
         # Execute each function call in order
         for call in calls:
+            if cancel.cancelled:
+                return abandon()
             name = call["name"]
             call_id = call["call_id"]
+            if metrics.tool_calls >= budget.max_tool_calls:
+                # every function_call needs an output; this one is answered without running
+                metrics.tool_calls_skipped += 1
+                item = {"type": "function_call_output", "call_id": call_id, "output": json.dumps(BUDGET_TOOL_OUTPUT)}
+                runtime_input.append(item)
+                pending.append(item)
+                continue
             args_json = call["arguments"] or "{}"
 
             # Parse args JSON
@@ -132,26 +397,54 @@ def run_turn_stream(
                 yield {"type": "tool_call", "name": name, "call_id": call_id, "arguments": args_json}
                 yield {"type": "tool_result", "name": name, "call_id": call_id, "output": tool_out}
 
-                runtime_input.append(
-                    {
-                        "type": "function_call_output",
-                        "call_id": call_id,
-                        "output": json.dumps(tool_out),
-                    }
-                )
+                item = _function_call_output(name, call_id, tool_out, metrics)
+                runtime_input.append(item)
+                pending.append(item)
                 continue
 
             yield {"type": "tool_call", "name": name, "call_id": call_id, "arguments": args}
 
-            tool_out = dispatch_tool(name, args)
-
-            yield {"type": "tool_result", "name": name, "call_id": call_id, "output": tool_out}
-
-            # Feed tool output back to the model (canonical tool flow)
-            runtime_input.append(
-                {
-                    "type": "function_call_output",
-                    "call_id": call_id,
-                    "output": json.dumps(tool_out),
-                }
-            )
\ No newline at end of file
+            tool_started = time.perf_counter()
+            prefetch = speculator.claim(name, args)
+            refused = gate(name, call_id, args)  # charged here, prefetched or not
+            remembered = memo.get(name, args) if refused is None else None
+            if refused is not None:
+                if prefetch is not None:
+                    speculator.discard(prefetch)
+                tool_out = refused
+                metrics.tool_calls_refused += 1
+                yield {"type": "tool_result", "name": name, "call_id": call_id, "output": tool_out}
+            elif remembered is not None:
+                if prefetch is not None:
+                    speculator.discard(prefetch)
+                tool_out = remembered
+                metrics.tool_calls_deduped += 1
+                turn_perf.add_tool(name, call_id, time.perf_counter() - tool_started, deduped=True)
+                yield {"type": "tool_result", "name": name, "call_id": call_id, "output": tool_out, "deduped": True}
+            else:
+                version = memo.version()
+                prefetched = speculator.result(name, prefetch) if prefetch is not None else None
+                started_early = early.take(name, call_id, args) if prefetched is None else None
+                if cancel.cancelled:  # stopped waiting for a background call because nobody is listening
+                    return abandon()
+                if prefetched is not None:
+                    tool_out = prefetched
+                    turn_perf.add_tool(name, call_id, time.perf_counter() - tool_started, prefetched=True)
+                    yield {"type": "tool_result", "name": name, "call_id": call_id, "output": tool_out, "prefetched": True}
+                elif started_early is not None:
+                    tool_out, version = started_early.output, started_early.version
+                    turn_perf.add_tool(name, call_id, started_early.seconds, started_early.db, early=True)
+                    yield {"type": "tool_result", "name": name, "call_id": call_id, "output": tool_out}
+                else:
+                    with collect_queries() as db:
+                        tool_out = dispatch_tool(name, args)
+                    turn_perf.add_tool(name, call_id, time.perf_counter() - tool_started, db)
+                    yield {"type": "tool_result", "name": name, "call_id": call_id, "output": tool_out}
+                memo.put(name, args, tool_out, version)
+            # predictable follow-ups run in the background while the model reads this result
+            speculator.observe(name, args, tool_out)
+
+            # Feed tool output back to the model (canonical tool flow), compacted
+            item = _function_call_output(name, call_id, tool_out, metrics)
+            runtime_input.append(item)
+            pending.append(item)
\ No newline at end of file
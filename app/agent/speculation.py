@@ -0,0 +1,159 @@
+"""
+Speculative tool prefetch.
+
+The documented multi-step flows make the second tool call predictable from the first result:
+    inventory_check (qty_on_hand == 0)   -> inventory_find_equivalent(med_id)
+    inventory_check (rx_required, patient id in the user message) -> prescription_verify
+While the model is still deciding, the predicted call runs on a background worker. If the model then
+asks for exactly that call (same canonical args), the prefetched result is used instead of a fresh
+dispatch. Only read-only tools are ever prefetched, and a result is discarded if any tracked table
+changed after it was computed (app.db.changes), so a hit is always what a fresh call would return.
+A prediction is scheduled only if the rate limits would allow it right now (a check that takes no
+token); the call is charged when the model asks for it, like any other, so a prediction the model never
+uses costs the client nothing.
+The worker pool is shared by every turn, so a claimed prefetch that has not started yet is cancelled
+and the call runs inline instead of queueing behind other turns' work; one that is running is waited
+for at most SPECULATIVE_WAIT_S (less if the turn is cancelled). Both count as late.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import re
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.agent.cancellation import CancelToken, wait_for
+from app.db.changes import current_version
+from app.tools.dispatcher import canonical_tool_args, dispatch_tool
+
+SPECULATIVE_PREFETCH = os.getenv("SPECULATIVE_PREFETCH", "1") == "1"
+# longest wait for a running prefetch before the call is dispatched inline instead
+SPECULATIVE_WAIT_S = float(os.getenv("SPECULATIVE_WAIT_S", "2"))
+
+# tools without side effects (safe to run even if the model never asks)
+READ_ONLY_TOOLS = frozenset({
+    "inventory_check",
+    "inventory_find_equivalent",
+    "prescription_verify",
+    "interaction_check",
+})
+
+MAX_PREDICTIONS_PER_RESULT = 2
+
+PATIENT_ID_RE = re.compile(r"\bP\d{3,}\b", re.IGNORECASE)
+REFILL_RE = re.compile(r"(refill|renew|חידוש)", re.IGNORECASE | re.UNICODE)
+
+logger = logging.getLogger("pharmacy_agent.speculation")
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="speculate")
+
+Prediction = Tuple[str, Dict[str, Any]]
+Prefetch = Tuple[int, "Future[Dict[str, Any]]"]  # (data version read before the call, result)
+
+
+def predict_follow_ups(user_text: str, name: str, args: Dict[str, Any], output: Dict[str, Any]) -> List[Prediction]:
+    """Likely next calls after (name, args) returned output, most likely first."""
+    if name != "inventory_check" or not output.get("ok"):
+        return []
+    language = args.get("language", "he")
+    patient = PATIENT_ID_RE.search(user_text)
+    intent = "refill" if REFILL_RE.search(user_text) else "new"
+
+    out: List[Prediction] = []
+    for m in output.get("matches") or []:
+        if m.get("qty_on_hand") == 0:
+            out.append(("inventory_find_equivalent", {"med_id": m["med_id"], "language": language}))
+        if m.get("rx_required") and patient:
+            out.append(("prescription_verify", {
+                "patient_id": patient.group(0).upper(), "med_id": m["med_id"], "intent": intent, "language": language,
+            }))
+        if len(out) >= MAX_PREDICTIONS_PER_RESULT:
+            break
+    return out[:MAX_PREDICTIONS_PER_RESULT]
+
+
+class Speculator:
+    """Per-turn prefetch state; counters feed TurnMetrics."""
+
+    def __init__(
+        self,
+        user_text: str,
+        *,
+        enabled: Optional[bool] = None,
+        dispatch: Callable[[str, Dict[str, Any]], Dict[str, Any]] = dispatch_tool,
+        allows: Optional[Callable[[str, Dict[str, Any]], bool]] = None,
+        cancel: Optional[CancelToken] = None,
+        wait_s: float = SPECULATIVE_WAIT_S,
+    ) -> None:
+        self.user_text = user_text
+        self.enabled = SPECULATIVE_PREFETCH if enabled is None else enabled
+        self._dispatch = dispatch
+        self._allows = allows
+        self._cancel = cancel
+        self._wait_s = wait_s
+        self._pending: Dict[str, Prefetch] = {}
+        self.submitted = 0
+        self.refused = 0
+        self.hits = 0
+        self.stale = 0
+        self.wasted = 0
+        self.late = 0  # not ready in time: the call was dispatched inline
+
+    def observe(self, name: str, args: Dict[str, Any], output: Dict[str, Any]) -> None:
+        """Feed a real tool result; starts prefetching its predicted follow-ups."""
+        if not self.enabled:
+            return
+        for next_name, next_args in predict_follow_ups(self.user_text, name, args, output):
+            key = canonical_tool_args(next_name, next_args)
+            if next_name not in READ_ONLY_TOOLS or key is None or key in self._pending:
+                continue
+            if self._allows is not None and not self._allows(next_name, next_args):
+                self.refused += 1  # throttled: the model's own call would be refused anyway
+                continue
+            version = current_version()  # read before the call: any later change invalidates the result
+            self._pending[key] = (version, _executor.submit(self._dispatch, next_name, next_args))
+            self.submitted += 1
+
+    def pending(self, name: str, args: Dict[str, Any]) -> bool:
+        """A prefetch for exactly this call is scheduled."""
+        key = canonical_tool_args(name, args) if self._pending else None
+        return key is not None and key in self._pending
+
+    def claim(self, name: str, args: Dict[str, Any]) -> Optional[Prefetch]:
+        """Take the prefetch for exactly this call, if one was scheduled (the caller still charges the call)."""
+        if not self._pending:
+            return None
+        key = canonical_tool_args(name, args)
+        return self._pending.pop(key, None) if key is not None else None
+
+    def result(self, name: str, prefetch: Prefetch) -> Optional[Dict[str, Any]]:
+        """A claimed prefetch's result, or None if it failed or is stale (caller dispatches normally)."""
+        version, future = prefetch
+        if future.cancel() or not wait_for(future, self._cancel, self._wait_s):
+            # still queued behind other turns' prefetches, or running too long: not worth waiting for
+            self.late += 1
+            return None
+        try:
+            result = future.result()
+        except Exception:
+            logger.exception("Speculative tool call failed", extra={"tool_name": name})
+            self.wasted += 1
+            return None
+        if current_version() != version:
+            self.stale += 1
+            return None
+        self.hits += 1
+        return result
+
+    def discard(self, prefetch: Prefetch) -> None:
+        """A claimed prefetch the call did not need after all (refused by the gate, or a memo hit)."""
+        prefetch[1].cancel()
+        self.wasted += 1
+
+    def close(self) -> None:
+        """End of turn: whatever was prefetched but never asked for is wasted work."""
+        for _, future in self._pending.values():
+            future.cancel()
+        self.wasted += len(self._pending)
+        self._pending.clear()
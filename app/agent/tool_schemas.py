@@ -1,5 +1,6 @@
 from __future__ import annotations
-from typing import Any, Dict, List, Type
+import json
+from typing import Any, Dict, List, Tuple, Type
 from pydantic import BaseModel
 from app.tools.contracts import TOOL_REGISTRY
 
@@ -22,22 +23,31 @@ TOOL_DESCRIPTIONS: Dict[str, str] = {
 def _pydantic_to_json_schema(model: Type[BaseModel]) -> Dict[str, Any]:
     """
     Convert a pydantic model to a json schem.
+    Keys are sorted so the serialized schema is byte-identical across processes (prompt caching).
     """
     schema = model.model_json_schema()
-    return schema
+    return json.loads(json.dumps(schema, sort_keys=True))
 
-def build_openai_function_tools() -> List[Dict[str, Any]]:
-    """Build OpenAI Responses API function tools list from TOOL_REGISTRY."""
-    tools: List[Dict[str, Any]] = []
+_TOOLS_CACHE: Tuple[Dict[str, Any], ...] = ()
 
-    for tool_name, (InputModel, _OutputModel) in TOOL_REGISTRY.items():
-        tools.append(
-            {
-                "type": "function",
-                "name": tool_name,
-                "description": TOOL_DESCRIPTIONS.get(tool_name, ""),
-                "parameters": _pydantic_to_json_schema(InputModel),
-            }
-        )
+def build_openai_function_tools() -> List[Dict[str, Any]]:
+    """
+    Build OpenAI Responses API function tools list from TOOL_REGISTRY.
+    Deterministic: tools sorted by name, schemas key-sorted; built once per process.
+    """
+    global _TOOLS_CACHE
+    if not _TOOLS_CACHE:
+        tools: List[Dict[str, Any]] = []
+        for tool_name in sorted(TOOL_REGISTRY):
+            InputModel, _OutputModel = TOOL_REGISTRY[tool_name]
+            tools.append(
+                {
+                    "type": "function",
+                    "name": tool_name,
+                    "description": TOOL_DESCRIPTIONS.get(tool_name, ""),
+                    "parameters": _pydantic_to_json_schema(InputModel),
+                }
+            )
+        _TOOLS_CACHE = tuple(tools)
 
-    return tools
\ No newline at end of file
+    return list(_TOOLS_CACHE)
\ No newline at end of file
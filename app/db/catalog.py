@@ -0,0 +1,337 @@
+"""
+Read-only catalog snapshot shared by all workers through one memory-mapped file.
+
+Holds the slow-changing data (medications, equivalence groups, interaction index) in a compact
+binary layout; workers mmap it and read records in place, so the OS page cache keeps one copy no
+matter how many workers run. Stock is NOT in the catalog (it changes constantly) and is always read
+from SQLite.
+
+Layout (little-endian):
+    header   magic, counts, section offsets
+    meta     JSON: table versions + DB generation at export time
+    strings  (offset u32, length u32) index + UTF-8 blob; every text field is a string id
+    meds     fixed-size records sorted by med_id (binary search)
+    groups   (start u32, count u32) into members; a group = same ingredients/form/normalized strength
+    members  med indexes (u32)
+    pairs    (a u32, b u32, level u8, message u32) sorted by (a, b) with a < b
+"""
+from __future__ import annotations
+
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.db.database import db_generation, get_conn
+
+CATALOG_PATH = Path(os.getenv("PHARMACY_CATALOG_PATH", "app/db/catalog.bin"))
+
+_MAGIC = b"TWCAT\x00\x01\x00"
+_HEADER = struct.Struct("<8sIIIIII7Q")  # magic, n_strings, n_meds, n_groups, n_members, n_pairs, meta_len, offsets
+_STR = struct.Struct("<II")
+_MED = struct.Struct("<IIIIIIIdBI")  # med_id brand generic ingredients form strength unit value rx group
+_GROUP = struct.Struct("<II")
+_MEMBER = struct.Struct("<I")
+_PAIR = struct.Struct("<IIBI")
+
+_NONE = 0xFFFFFFFF
+_LEVELS = ("none", "caution", "avoid")
+
+# tables whose changes make a snapshot stale
+CATALOG_TABLES = ("medications", "interaction_rules")
+
+
+@dataclass(frozen=True)
+class CatalogMed:
+    med_id: str
+    brand_name: str
+    generic_name: str
+    active_ingredients_json: str
+    form: str
+    strength: str
+    strength_unit: Optional[str]
+    strength_value: Optional[float]
+    rx_required: bool
+    group: int
+
+
+##################### export #####################
+def export_catalog(path: Path = CATALOG_PATH) -> Path:
+    """Snapshot the catalog tables into path (written to a temp file, then renamed atomically)."""
+    conn = get_conn()
+    try:
+        versions = {
+            r["table_name"]: int(r["version"])
+            for r in conn.execute("SELECT table_name, version FROM table_versions").fetchall()
+        }
+        meds = conn.execute(
+            """
+            SELECT med_id, brand_name, generic_name, active_ingredients, form, strength,
+                   strength_unit, strength_value, rx_required
+            FROM medications
+            ORDER BY med_id
+            """
+        ).fetchall()
+        rules = conn.execute("SELECT med_id_a, med_id_b, level, message FROM interaction_rules").fetchall()
+    finally:
+        conn.close()
+
+    strings: List[str] = []
+    string_ids: Dict[str, int] = {}
+
+    def sid(s: Optional[str]) -> int:
+        if s is None:
+            return _NONE
+        if s not in string_ids:
+            string_ids[s] = len(strings)
+            strings.append(s)
+        return string_ids[s]
+
+    # equivalence groups: same ingredients + form + strength (normalized when parsed, raw text otherwise)
+    group_ids: Dict[Tuple, int] = {}
+    members: List[List[int]] = []
+    med_index: Dict[str, int] = {}
+    med_records: List[bytes] = []
+    for i, m in enumerate(meds):
+        med_index[m["med_id"]] = i
+        if m["strength_value"] is not None:
+            strength_key: Tuple = (m["strength_unit"], round(m["strength_value"], 9))
+        else:
+            strength_key = ("raw", m["strength"])
+        key = (m["active_ingredients"], m["form"], strength_key)
+        if key not in group_ids:
+            group_ids[key] = len(members)
+            members.append([])
+        g = group_ids[key]
+        members[g].append(i)
+        med_records.append(_MED.pack(
+            sid(m["med_id"]), sid(m["brand_name"]), sid(m["generic_name"]), sid(m["active_ingredients"]),
+            sid(m["form"]), sid(m["strength"]), sid(m["strength_unit"]),
+            m["strength_value"] if m["strength_value"] is not None else math.nan,
+            int(m["rx_required"]), g,
+        ))
+
+    pairs = sorted(
+        (
+            tuple(sorted((med_index[r["med_id_a"]], med_index[r["med_id_b"]])))
+            + (_LEVELS.index(r["level"]), sid(r["message"]))
+        )
+        for r in rules
+        if r["med_id_a"] in med_index and r["med_id_b"] in med_index
+    )
+
+    meta = json.dumps({
+        "table_versions": versions,
+        "db_generation": db_generation(),
+        "exported_at": time.time(),
+    }).encode("utf-8")
+
+    blob = bytearray()
+    str_index = bytearray()
+    for s in strings:
+        b = s.encode("utf-8")
+        str_index += _STR.pack(len(blob), len(b))
+        blob += b
+
+    group_bytes = bytearray()
+    member_bytes = bytearray()
+    n_members = 0
+    for g in members:
+        group_bytes += _GROUP.pack(n_members, len(g))
+        for i in g:
+            member_bytes += _MEMBER.pack(i)
+        n_members += len(g)
+    pair_bytes = b"".join(_PAIR.pack(*p) for p in pairs)
+
+    sections = [meta, bytes(str_index), bytes(blob), b"".join(med_records), bytes(group_bytes),
+                bytes(member_bytes), pair_bytes]
+    offsets = []
+    pos = _HEADER.size
+    for sec in sections:
+        offsets.append(pos)
+        pos += len(sec)
+
+    header = _HEADER.pack(_MAGIC, len(strings), len(meds), len(members), n_members, len(pairs), len(meta),
+                          *offsets)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.tmp-{os.getpid()}")
+    with open(tmp, "wb") as f:
+        f.write(header)
+        for sec in sections:
+            f.write(sec)
+    os.replace(tmp, path)
+    return path
+
+
+##################### reader #####################
+class Catalog:
+    """Zero-copy view over an exported catalog file. Thread-safe (read-only)."""
+
+    def __init__(self, path: Path = CATALOG_PATH) -> None:
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.n_strings, self.n_meds, self.n_groups, self.n_members, self.n_pairs, meta_len,
+         self._meta_off, self._str_index_off, self._str_data_off, self._meds_off, self._groups_off,
+         self._members_off, self._pairs_off) = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"{self.path} is not a catalog file")
+        self.meta = json.loads(self._mm[self._meta_off:self._meta_off + meta_len].decode("utf-8"))
+
+    @property
+    def age_s(self) -> float:
+        return time.time() - float(self.meta["exported_at"])
+
+    def close(self) -> None:
+        self._mm.close()
+
+    def _str(self, i: int) -> Optional[str]:
+        if i == _NONE:
+            return None
+        off, n = _STR.unpack_from(self._mm, self._str_index_off + i * _STR.size)
+        start = self._str_data_off + off
+        return self._mm[start:start + n].decode("utf-8")
+
+    def _med_at(self, idx: int) -> CatalogMed:
+        (mid, brand, generic, ingr, form, strength, unit, value, rx, group) = _MED.unpack_from(
+            self._mm, self._meds_off + idx * _MED.size
+        )
+        return CatalogMed(
+            med_id=self._str(mid),
+            brand_name=self._str(brand),
+            generic_name=self._str(generic),
+            active_ingredients_json=self._str(ingr),
+            form=self._str(form),
+            strength=self._str(strength),
+            strength_unit=self._str(unit),
+            strength_value=None if math.isnan(value) else value,
+            rx_required=bool(rx),
+            group=group,
+        )
+
+    def _med_id_at(self, idx: int) -> str:
+        return self._str(_MED.unpack_from(self._mm, self._meds_off + idx * _MED.size)[0])
+
+    def index_of(self, med_id: str) -> Optional[int]:
+        lo, hi = 0, self.n_meds
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._med_id_at(mid) < med_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.n_meds and self._med_id_at(lo) == med_id:
+            return lo
+        return None
+
+    def medication(self, med_id: str) -> Optional[CatalogMed]:
+        idx = self.index_of(med_id)
+        return None if idx is None else self._med_at(idx)
+
+    def equivalent_ids(self, med_id: str) -> Optional[List[str]]:
+        """med_ids with the same ingredients, form and strength (excluding med_id); None if unknown."""
+        idx = self.index_of(med_id)
+        if idx is None:
+            return None
+        group = _MED.unpack_from(self._mm, self._meds_off + idx * _MED.size)[9]
+        start, count = _GROUP.unpack_from(self._mm, self._groups_off + group * _GROUP.size)
+        out: List[str] = []
+        for k in range(start, start + count):
+            (i,) = _MEMBER.unpack_from(self._mm, self._members_off + k * _MEMBER.size)
+            if i != idx:
+                out.append(self._med_id_at(i))
+        return out
+
+    def interaction(self, idx_a: int, idx_b: int) -> Optional[Tuple[str, str]]:
+        """(level, message) for a pair of med indexes, or None if no rule."""
+        key = (idx_a, idx_b) if idx_a < idx_b else (idx_b, idx_a)
+        lo, hi = 0, self.n_pairs
+        while lo < hi:
+            mid = (lo + hi) // 2
+            a, b, level, msg = _PAIR.unpack_from(self._mm, self._pairs_off + mid * _PAIR.size)
+            if (a, b) < key:
+                lo = mid + 1
+            elif (a, b) > key:
+                hi = mid
+            else:
+                return _LEVELS[level], self._str(msg)
+        return None
+
+    def iter_med_ids(self) -> Iterator[str]:
+        for i in range(self.n_meds):
+            yield self._med_id_at(i)
+
+
+##################### process-wide handle #####################
+_catalog: Optional[Catalog] = None
+_stale = False
+_rejected_inode: Optional[int] = None  # file already found stale; don't re-check until it is replaced
+_lock = threading.Lock()
+_subscribed = False
+
+
+def _mark_stale(_ev) -> None:
+    global _stale
+    _stale = True
+
+
+def _is_current(cat: Catalog) -> bool:
+    from app.db.changes import get_change_feed
+
+    if cat.meta.get("db_generation") != db_generation():
+        return False
+    live = get_change_feed().table_versions()
+    return all(live.get(t) == cat.meta["table_versions"].get(t) for t in CATALOG_TABLES)
+
+
+def get_catalog() -> Optional[Catalog]:
+    """
+    The shared snapshot if one was exported (see app.web.launcher) and still matches the DB, else None.
+    Callers fall back to SQL on None. Staleness is tracked through the change feed, so the steady-state
+    cost is one feed poll; a re-exported file is picked up automatically.
+    """
+    global _catalog, _stale, _rejected_inode, _subscribed
+    from app.db.changes import get_change_feed
+
+    feed = get_change_feed()
+    feed.poll()
+    if _catalog is not None and not _stale:
+        return _catalog
+
+    with _lock:
+        if _catalog is not None and not _stale:
+            return _catalog
+        try:
+            inode = os.stat(CATALOG_PATH).st_ino
+        except FileNotFoundError:
+            return None
+        if inode == _rejected_inode:
+            return None
+
+        if not _subscribed:
+            feed.subscribe(_mark_stale, tables=CATALOG_TABLES)
+            _subscribed = True
+        _stale = False  # a change from here on invalidates the file we are about to check
+        try:
+            cat = Catalog(CATALOG_PATH)
+        except (OSError, ValueError):
+            _rejected_inode = inode
+            return None
+        if not _is_current(cat):
+            cat.close()
+            _rejected_inode = inode
+            return None
+        # the previous snapshot is not closed: other threads may still be reading it
+        _catalog = cat
+        return cat
+
+
+if __name__ == "__main__":
+    out = export_catalog()
+    print(f"Catalog exported: {out} ({out.stat().st_size} bytes)")
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import logging
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional
+
+from app.db.database import db_generation, get_conn
+
+logger = logging.getLogger("pharmacy_agent.db.changes")
+
+# tables with change triggers (see app/db/schema.sql)
+TRACKED_TABLES = ("medications", "inventory", "inventory_reservations", "prescriptions", "interaction_rules")
+
+# max change_log rows fetched per poll; a bigger backlog is reported as a reset
+MAX_EVENTS_PER_POLL = 5000
+
+
+@dataclass(frozen=True)
+class ChangeEvent:
+    """
+    One invalidation event.
+    op == "reset" means "everything may have changed" (DB reseeded, or the backlog was too large):
+    subscribers should drop all cached state for the table(s).
+    """
+    change_id: int
+    table: str
+    op: str
+    med_id: Optional[str] = None
+    patient_id: Optional[str] = None
+
+
+Subscriber = Callable[[ChangeEvent], None]
+
+
+class ChangeFeed:
+    """
+    In-process reader over change_log.
+    - poll() is cheap: every tool call polls (memo, early dispatch and prefetch checks), so while nothing
+      was committed it only reads PRAGMA data_version (no table access) and the DB file identity; the
+      indexed MAX(change_id) read (plus the schema cookie, to notice reseeds) runs once per commit
+    - when the head moved, new rows are fetched once and fanned out to subscribers
+    - subscribers can filter by table so e.g. an inventory cache never sees prescription events
+    """
+
+    def __init__(self) -> None:
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._subs: List[tuple[Optional[FrozenSet[str]], Subscriber]] = []
+        self._last_seen: Optional[int] = None
+        self._schema: Optional[int] = None
+        self._gen: Optional[str] = None
+        self._data_version: Optional[int] = None  # PRAGMA data_version at the last head read
+
+    @property
+    def version(self) -> int:
+        """Last change_id observed by poll() (0 before the first poll)."""
+        return self._last_seen or 0
+
+    def subscribe(self, callback: Subscriber, tables: Optional[Iterable[str]] = None) -> Callable[[], None]:
+        """Register callback for events on tables (all tracked tables if None). Returns an unsubscribe fn."""
+        entry = (frozenset(tables) if tables is not None else None, callback)
+        with self._lock:
+            self._subs.append(entry)
+
+        def _unsubscribe() -> None:
+            with self._lock:
+                if entry in self._subs:
+                    self._subs.remove(entry)
+
+        return _unsubscribe
+
+    def table_versions(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._connection().execute("SELECT table_name, version FROM table_versions").fetchall()
+        return {r["table_name"]: int(r["version"]) for r in rows}
+
+    def poll(self) -> int:
+        """Check for new changes, dispatch them, and return the current global version."""
+        with self._lock:
+            swapped = self._conn is not None and db_generation() != self._gen
+            if swapped:
+                # online reseed swapped the file under us: reconnect and flush everything
+                self._conn.close()
+                self._conn = None
+            conn = self._connection()
+            # bumped on this connection by every commit from any other connection (and this one never writes)
+            data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self._data_version and self._last_seen is not None:
+                return self._last_seen
+            head, schema = conn.execute(
+                "SELECT (SELECT COALESCE(MAX(change_id), 0) FROM change_log), schema_version FROM pragma_schema_version"
+            ).fetchone()
+            last = self._last_seen
+            self._data_version = data_version
+            if head == last and schema == self._schema and not swapped:
+                return head
+
+            if last is None:
+                # first poll: start from now; nothing cached yet so nothing to invalidate
+                events: List[ChangeEvent] = []
+            elif swapped or schema != self._schema or head < last or head - last > MAX_EVENTS_PER_POLL:
+                # new DB file / tables recreated (reseed) or we are too far behind: flush everything
+                events = [ChangeEvent(change_id=head, table=t, op="reset") for t in TRACKED_TABLES]
+            else:
+                rows = conn.execute(
+                    """
+                    SELECT change_id, table_name, op, med_id, patient_id
+                    FROM change_log
+                    WHERE change_id > ? AND change_id <= ?
+                    ORDER BY change_id
+                    """,
+                    (last, head),
+                ).fetchall()
+                events = [
+                    ChangeEvent(
+                        change_id=int(r["change_id"]),
+                        table=r["table_name"],
+                        op=r["op"],
+                        med_id=r["med_id"],
+                        patient_id=r["patient_id"],
+                    )
+                    for r in rows
+                ]
+
+            self._last_seen = head
+            self._schema = schema
+            subs = list(self._subs)
+
+        # dispatch outside the lock so callbacks may poll/subscribe themselves
+        for ev in events:
+            for tables, cb in subs:
+                if tables is not None and ev.table not in tables:
+                    continue
+                try:
+                    cb(ev)
+                except Exception:
+                    logger.exception("Change subscriber failed", extra={"table": ev.table, "op": ev.op})
+        return head
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # one long-lived connection per feed, shared across threads; callers hold self._lock
+        if self._conn is None:
+            self._gen = db_generation()
+            self._data_version = None
+            self._conn = get_conn(check_same_thread=False)
+        return self._conn
+
+
+_feed: Optional[ChangeFeed] = None
+_feed_lock = threading.Lock()
+
+
+def get_change_feed() -> ChangeFeed:
+    """Process-wide feed shared by all caches."""
+    global _feed
+    if _feed is None:
+        with _feed_lock:
+            if _feed is None:
+                _feed = ChangeFeed()
+    return _feed
+
+
+def current_version() -> int:
+    """Global data version (latest change_id); changes whenever any tracked row changes."""
+    return get_change_feed().poll()
+
+
+def prune_change_log(keep_last: int = 100_000, conn: Optional[sqlite3.Connection] = None) -> int:
+    """
+    Trim old change_log rows. Returns rows deleted.
+    Never keeps fewer than MAX_EVENTS_PER_POLL: a feed further behind than that gets a reset anyway,
+    so pruning can never make poll() skip events silently.
+    """
+    keep_last = max(keep_last, MAX_EVENTS_PER_POLL)
+    own_conn = conn is None
+    if own_conn:
+        conn = get_conn()
+    try:
+        cur = conn.execute(
+            "DELETE FROM change_log WHERE change_id <= (SELECT COALESCE(MAX(change_id), 0) FROM change_log) - ?",
+            (keep_last,),
+        )
+        conn.commit()
+        return cur.rowcount
+    finally:
+        if own_conn:
+            conn.close()
@@ -1,14 +1,232 @@
 from __future__ import annotations
 
 import os
+import random
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Any, Callable, Iterator, List, Optional, TypeVar
 
 DB_PATH = Path(os.getenv("PHARMACY_DB_PATH", "app/db/pharmacy.db"))
 
-def get_conn() -> sqlite3.Connection:
-    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
+# how long a connection waits on a locked database before raising "database is locked"
+BUSY_TIMEOUT_S = float(os.getenv("PHARMACY_DB_BUSY_TIMEOUT_S", "10"))
+WRITE_RETRIES = 8
+
+T = TypeVar("T")
+
+##################### query stats #####################
+class QueryStats:
+    def __init__(self) -> None:
+        self.count = 0
+        self.seconds = 0.0
+
+    @property
+    def ms(self) -> float:
+        return round(self.seconds * 1000, 2)
+
+
+_query_stats = threading.local()
+
+
+@contextmanager
+def collect_queries() -> Iterator[QueryStats]:
+    """
+    Count and time the statements this thread runs on get_conn() connections inside the block
+    (execute + fetch calls; rows pulled by plain iteration are not timed). Blocks may nest.
+    """
+    stats = QueryStats()
+    outer = getattr(_query_stats, "current", None)
+    _query_stats.current = stats
+    try:
+        yield stats
+    finally:
+        _query_stats.current = outer
+        if outer is not None:
+            outer.count += stats.count
+            outer.seconds += stats.seconds
+
+
+class _TimedCursor(sqlite3.Cursor):
+    def _timed(self, fn: Callable[..., Any], *args: Any, statement: bool = False) -> Any:
+        stats = getattr(_query_stats, "current", None)
+        if stats is None:
+            return fn(*args)
+        t0 = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            stats.seconds += time.perf_counter() - t0
+            stats.count += statement
+
+    def execute(self, *args: Any) -> "_TimedCursor":
+        return self._timed(super().execute, *args, statement=True)
+
+    def executemany(self, *args: Any) -> "_TimedCursor":
+        return self._timed(super().executemany, *args, statement=True)
+
+    def fetchone(self) -> Any:
+        return self._timed(super().fetchone)
+
+    def fetchmany(self, *args: Any) -> List[Any]:
+        return self._timed(super().fetchmany, *args)
+
+    def fetchall(self) -> List[Any]:
+        return self._timed(super().fetchall)
+
+
+class _TimedConnection(sqlite3.Connection):
+    def cursor(self, factory: Any = _TimedCursor) -> sqlite3.Cursor:
+        return super().cursor(factory)
+
+    # the C shortcuts build a plain Cursor; only route them through ours while collecting
+    def execute(self, *args: Any) -> sqlite3.Cursor:
+        if getattr(_query_stats, "current", None) is None:
+            return super().execute(*args)
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args: Any) -> sqlite3.Cursor:
+        if getattr(_query_stats, "current", None) is None:
+            return super().executemany(*args)
+        return self.cursor().executemany(*args)
+
+
+def get_conn(path: Optional[Path] = None, *, check_same_thread: bool = True) -> sqlite3.Connection:
+    path = path or DB_PATH
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(
+        path, timeout=BUSY_TIMEOUT_S, check_same_thread=check_same_thread, factory=_TimedConnection
+    )
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA foreign_keys = ON;")
-    return conn
\ No newline at end of file
+    conn.execute("PRAGMA synchronous = NORMAL;")  # durable enough under WAL (set in schema.sql)
+    return conn
+
+def db_generation() -> str:
+    """
+    Identity of the database file currently behind DB_PATH.
+    Changes when an online reseed swaps in a new file; long-lived connections compare it to reconnect.
+    """
+    return os.path.realpath(DB_PATH)
+
+_swap_listeners: List[Callable[[], None]] = []
+
+def on_swap(fn: Callable[[], None]) -> None:
+    """Call fn after every swap_db_file (e.g. to close pooled connections to the old file)."""
+    _swap_listeners.append(fn)
+
+def _retire(conn: sqlite3.Connection, schema: str) -> None:
+    """Make every table in schema refuse writes: a connection still open on a swapped-out file errors."""
+    tables = [r[0] for r in conn.execute(
+        f"SELECT name FROM {schema}.sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+    )]
+    for table in tables:
+        for op in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(
+                f"CREATE TRIGGER {schema}.trg_retired_{table}_{op.lower()} BEFORE {op} ON {table} BEGIN "
+                "SELECT RAISE(ABORT, 'database file was swapped out by an online reseed; reconnect'); END"
+            )
+
+def swap_db_file(
+    new_path: Path,
+    keep_generations: int = 2,
+    carry: Optional[Callable[[sqlite3.Connection], T]] = None,
+) -> Optional[T]:
+    """
+    Atomically point DB_PATH at new_path (a fully built database in the same directory).
+    DB_PATH becomes a symlink replaced with os.replace, so every new connection sees either the old or
+    the new file, never a half-loaded one. SQLite resolves the symlink, so each generation keeps its own
+    -wal/-shm files.
+    - the live file is attached as "live" to a connection on new_path and both are write-locked
+      (BEGIN IMMEDIATE) until the swap: carry(conn) moves live state over (returns swap_db_file's
+      result), and no write to the live file can land after it has been read
+    - the live file is then retired: its tables refuse writes, so a connection still open on it fails
+      loudly instead of committing to a file nobody reads
+    - idle pooled connections are closed (on_swap); the live file's WAL is checkpointed, and the first
+      swap, which replaces a plain pharmacy.db, removes its now orphaned -wal/-shm
+    """
+    new_path = Path(new_path)
+    if new_path.parent.resolve() != DB_PATH.parent.resolve():
+        raise ValueError("new database must live next to DB_PATH")
+
+    live = os.path.realpath(DB_PATH) if DB_PATH.exists() else None
+    plain_file = live is not None and not DB_PATH.is_symlink()
+    result: Optional[T] = None
+    conn = get_conn(new_path)
+    conn.isolation_level = None  # manual transaction control
+    try:
+        if live is not None:
+            conn.execute("ATTACH DATABASE ? AS live", (live,))
+            conn.execute("BEGIN IMMEDIATE")  # locks both files: writers on the live file wait
+            try:
+                result = carry(conn) if carry is not None else None
+                _retire(conn, "live")
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        # the new file is self-contained
+        conn.execute("PRAGMA main.wal_checkpoint(TRUNCATE)")
+
+        tmp_link = DB_PATH.with_name(f".{DB_PATH.name}.swap")
+        if tmp_link.is_symlink() or tmp_link.exists():
+            tmp_link.unlink()
+        os.symlink(new_path.name, tmp_link)
+        os.replace(tmp_link, DB_PATH)
+
+        if live is not None:
+            conn.execute("PRAGMA live.wal_checkpoint(TRUNCATE)")
+            conn.execute("DETACH DATABASE live")
+    finally:
+        conn.close()
+
+    for listener in _swap_listeners:
+        listener()
+    if plain_file:
+        for suffix in ("-wal", "-shm"):
+            DB_PATH.with_name(DB_PATH.name + suffix).unlink(missing_ok=True)
+
+    # keep the newest generations (stale connections may still read the previous one)
+    gens: List[Path] = sorted(DB_PATH.parent.glob(f"{DB_PATH.name}.gen-*"))
+    gens = [g for g in gens if not g.name.endswith(("-wal", "-shm"))]
+    for old in gens[:-keep_generations]:
+        for p in (old, old.with_name(old.name + "-wal"), old.with_name(old.name + "-shm")):
+            p.unlink(missing_ok=True)
+    return result
+
+def _is_busy(e: sqlite3.OperationalError) -> bool:
+    msg = str(e).lower()
+    return "locked" in msg or "busy" in msg
+
+def run_write(fn: Callable[[sqlite3.Connection], T]) -> T:
+    """
+    Run fn(conn) inside one short BEGIN IMMEDIATE transaction.
+    - the write lock is taken up front, so read-then-write logic cannot race another writer
+    - lock contention waits busy_timeout, then retries with jittered backoff
+    - fn must not commit; it is committed here (or rolled back if fn raises)
+    """
+    conn = get_conn()
+    conn.isolation_level = None  # manual transaction control
+    try:
+        for attempt in range(WRITE_RETRIES + 1):
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+            except sqlite3.OperationalError as e:
+                if not _is_busy(e) or attempt == WRITE_RETRIES:
+                    raise
+                time.sleep(random.uniform(0, 0.01 * (2 ** attempt)))
+                continue
+
+            try:
+                result = fn(conn)
+                conn.execute("COMMIT")
+                return result
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+        raise AssertionError("unreachable")
+    finally:
+        conn.close()
@@ -0,0 +1,346 @@
+"""
+Streaming bulk import for nightly formulary/stock feeds.
+
+    python -m app.db.import_feed medications formulary.csv
+    python -m app.db.import_feed inventory stock.jsonl --chunk-size 10000
+
+- reads CSV or JSONL lazily, chunk by chunk (memory stays flat regardless of feed size)
+- validates each chunk against the app.db.models entities in one pydantic call; bad rows (including
+  unparseable JSONL lines and JSON list cells) are skipped and reported
+- upserts with executemany inside large BEGIN IMMEDIATE transactions (existing rows are updated, not dropped)
+- drops the table's secondary indexes for the load and rebuilds them once at the end
+- trims change_log afterwards (every upserted row logs a change, see app/db/changes.py)
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import sqlite3
+import sys
+import time
+from dataclasses import dataclass, field
+from itertools import islice
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Type, Union
+
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+from app.db.changes import prune_change_log
+from app.db.database import get_conn
+from app.db.models import InteractionRule, InventoryItem, Medication, Prescription, User
+from app.db.seed import norm_pair
+from app.db.strength import normalize_strength
+
+DEFAULT_CHUNK_SIZE = 5000
+DEFAULT_CHUNKS_PER_TX = 20  # 100k rows per transaction with the default chunk size
+MAX_REPORTED_ERRORS = 20
+
+
+@dataclass(frozen=True)
+class FeedSpec:
+    table: str
+    model: Type[BaseModel]
+    columns: Tuple[str, ...]  # DB columns, in insert order
+    key: Tuple[str, ...]  # conflict target
+    to_row: Callable[[Any], Tuple[Any, ...]]  # validated model -> DB tuple
+    aliases: Dict[str, str] = field(default_factory=dict)  # feed column -> model field
+    list_fields: Tuple[str, ...] = ()  # CSV cells holding a JSON array or "a|b|c"
+
+
+def _medication_row(m: Medication) -> Tuple[Any, ...]:
+    strength_value, strength_unit = normalize_strength(m.strength)
+    return (
+        m.med_id, m.brand_name, m.generic_name, json.dumps(m.active_ingredients),
+        m.form, m.strength, strength_value, strength_unit, int(m.rx_required),
+        m.standard_instructions, json.dumps(m.common_side_effects), json.dumps(m.warnings),
+    )
+
+
+def _interaction_row(r: InteractionRule) -> Tuple[Any, ...]:
+    a, b = norm_pair(r.med_id_a, r.med_id_b)
+    return (r.rule_id, a, b, r.level.value, r.message, r.source)
+
+
+FEEDS: Dict[str, FeedSpec] = {
+    "patients": FeedSpec(
+        table="patients",
+        model=User,
+        columns=("patient_id", "display_name", "language_preference"),
+        key=("patient_id",),
+        to_row=lambda u: (u.user_id, u.full_name, u.language_preference.value),
+        aliases={"patient_id": "user_id", "display_name": "full_name"},
+    ),
+    "medications": FeedSpec(
+        table="medications",
+        model=Medication,
+        columns=(
+            "med_id", "brand_name", "generic_name", "active_ingredients", "form", "strength",
+            "strength_value", "strength_unit", "rx_required",
+            "standard_instructions", "common_side_effects", "warnings",
+        ),
+        key=("med_id",),
+        to_row=_medication_row,
+        list_fields=("active_ingredients", "common_side_effects", "warnings"),
+    ),
+    "inventory": FeedSpec(
+        table="inventory",
+        model=InventoryItem,
+        columns=("med_id", "qty_on_hand", "reorder_threshold", "location_bin"),
+        key=("med_id",),
+        to_row=lambda i: (i.med_id, i.qty_on_hand, i.reorder_threshold, i.location_bin),
+    ),
+    "prescriptions": FeedSpec(
+        table="prescriptions",
+        model=Prescription,
+        columns=(
+            "rx_id", "patient_id", "med_id", "status", "expires_at",
+            "refills_remaining", "directions", "last_filled_at",
+        ),
+        key=("rx_id",),
+        to_row=lambda p: (
+            p.rx_id, p.user_id, p.med_id, p.status.value, p.expires_at.isoformat(),
+            p.refills_remaining, p.directions,
+            p.last_filled_at.replace(microsecond=0).isoformat() if p.last_filled_at else None,
+        ),
+        aliases={"patient_id": "user_id"},
+    ),
+    "interaction_rules": FeedSpec(
+        table="interaction_rules",
+        model=InteractionRule,
+        columns=("rule_id", "med_id_a", "med_id_b", "level", "message", "source"),
+        key=("rule_id",),
+        to_row=_interaction_row,
+    ),
+}
+
+
+@dataclass
+class ImportReport:
+    feed: str
+    rows_read: int = 0
+    rows_upserted: int = 0
+    rows_rejected: int = 0
+    elapsed_s: float = 0.0
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows_read / self.elapsed_s if self.elapsed_s else 0.0
+
+    def reject(self, message: str) -> None:
+        self.rows_rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(message)
+
+
+##################### readers #####################
+@dataclass(frozen=True)
+class _Unreadable:
+    """Stands in for a row that could not be parsed, so it is still counted (and numbered) in its chunk."""
+    reason: str
+
+
+_Record = Union[Dict[str, Any], _Unreadable]
+
+
+def _iter_records(path: Path) -> Iterator[_Record]:
+    if path.suffix.lower() in {".jsonl", ".ndjson"}:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield _Unreadable(f"invalid JSON: {e.msg} (column {e.colno})")
+                    continue
+                yield record if isinstance(record, dict) else _Unreadable("not a JSON object")
+    else:
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            yield from csv.DictReader(f)
+
+
+def _prepare(record: _Record, spec: FeedSpec) -> _Record:
+    if isinstance(record, _Unreadable):
+        return record
+    out: Dict[str, Any] = {}
+    for k, v in record.items():
+        if v == "" or v is None:
+            continue  # empty CSV cell -> model default
+        k = spec.aliases.get(k, k)
+        if k in spec.list_fields and isinstance(v, str):
+            if v.lstrip().startswith("["):
+                try:
+                    v = json.loads(v)
+                except json.JSONDecodeError as e:
+                    return _Unreadable(f"{k}: invalid JSON list: {e.msg}")
+            else:
+                v = [p.strip() for p in v.split("|") if p.strip()]
+        out[k] = v
+    return out
+
+
+def _chunks(it: Iterator[_Record], size: int) -> Iterator[List[_Record]]:
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+##################### writer #####################
+def _upsert_sql(spec: FeedSpec) -> str:
+    cols = ", ".join(spec.columns)
+    marks = ",".join("?" * len(spec.columns))
+    updates = ", ".join(f"{c} = excluded.{c}" for c in spec.columns if c not in spec.key)
+    return (
+        f"INSERT INTO {spec.table}({cols}) VALUES ({marks}) "
+        f"ON CONFLICT({', '.join(spec.key)}) DO UPDATE SET {updates}"
+    )
+
+
+def _drop_secondary_indexes(conn: sqlite3.Connection, table: str) -> List[str]:
+    """Drop non-unique indexes on table and return their CREATE statements (unique ones back the upsert)."""
+    rows = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+        (table,),
+    ).fetchall()
+    deferred = [r["sql"] for r in rows if "UNIQUE" not in r["sql"].upper()]
+    for r in rows:
+        if r["sql"] in deferred:
+            conn.execute(f"DROP INDEX {r['name']}")
+    return deferred
+
+
+def _validate(batch: List[_Record], adapter: TypeAdapter, spec: FeedSpec, report: ImportReport,
+              offset: int) -> List[Any]:
+    rows: List[int] = []  # 1-based row number of each parsed record
+    records: List[Dict[str, Any]] = []
+    for i, rec in enumerate(batch):
+        if isinstance(rec, _Unreadable):
+            report.reject(f"row {offset + i + 1}: {rec.reason}")
+        else:
+            rows.append(offset + i + 1)
+            records.append(rec)
+    try:
+        return adapter.validate_python(records)
+    except ValidationError as e:
+        bad: Dict[int, str] = {}
+        for err in e.errors():
+            idx = err["loc"][0]
+            bad.setdefault(idx, f"row {rows[idx]}: {'.'.join(map(str, err['loc'][1:]))}: {err['msg']}")
+        for idx in sorted(bad):
+            report.reject(bad[idx])
+        good = [rec for i, rec in enumerate(records) if i not in bad]
+        return adapter.validate_python(good)
+
+
+def _write(conn: sqlite3.Connection, sql: str, rows: Sequence[Tuple[Any, ...]], report: ImportReport,
+           offset: int) -> None:
+    try:
+        conn.executemany(sql, rows)
+        report.rows_upserted += len(rows)
+    except sqlite3.IntegrityError:
+        # e.g. FK to an unknown med_id: redo row by row (upserts are idempotent) and skip the offenders
+        for i, row in enumerate(rows):
+            try:
+                conn.execute(sql, row)
+                report.rows_upserted += 1
+            except sqlite3.IntegrityError as e:
+                report.reject(f"row ~{offset + i + 1}: {e}")
+
+
+def import_feed(
+    feed: str,
+    path: Path,
+    *,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    chunks_per_tx: int = DEFAULT_CHUNKS_PER_TX,
+    defer_indexes: bool = True,
+    progress: Optional[Callable[[ImportReport], None]] = None,
+) -> ImportReport:
+    spec = FEEDS[feed]
+    adapter = TypeAdapter(List[spec.model])  # type: ignore[valid-type]
+    sql = _upsert_sql(spec)
+    report = ImportReport(feed=feed)
+
+    conn = get_conn()
+    conn.isolation_level = None  # explicit transactions below
+    t0 = time.perf_counter()
+    deferred: List[str] = []
+    try:
+        if defer_indexes:
+            conn.execute("BEGIN IMMEDIATE")
+            deferred = _drop_secondary_indexes(conn, spec.table)
+            conn.execute("COMMIT")
+
+        records = (_prepare(r, spec) for r in _iter_records(path))
+        for n, batch in enumerate(_chunks(records, chunk_size)):
+            if n % chunks_per_tx == 0:
+                if conn.in_transaction:
+                    conn.execute("COMMIT")
+                conn.execute("BEGIN IMMEDIATE")
+
+            offset = report.rows_read
+            report.rows_read += len(batch)
+            models = _validate(batch, adapter, spec, report, offset)
+            _write(conn, sql, [spec.to_row(m) for m in models], report, offset)
+
+            report.elapsed_s = time.perf_counter() - t0
+            if progress is not None:
+                progress(report)
+
+        if conn.in_transaction:
+            conn.execute("COMMIT")
+        prune_change_log(conn=conn)
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        # rebuild once at the end (also after a failure, so the table is never left unindexed)
+        for create_sql in deferred:
+            conn.execute(create_sql)
+        if deferred:
+            conn.execute("PRAGMA optimize")
+        conn.close()
+
+    report.elapsed_s = time.perf_counter() - t0
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Stream a CSV/JSONL feed into the pharmacy DB (upsert).")
+    parser.add_argument("feed", choices=sorted(FEEDS))
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--chunks-per-tx", type=int, default=DEFAULT_CHUNKS_PER_TX)
+    parser.add_argument("--keep-indexes", action="store_true", help="maintain indexes during the load")
+    args = parser.parse_args(argv)
+
+    def _progress(r: ImportReport) -> None:
+        print(f"  {r.rows_read} rows read, {r.rows_upserted} upserted, {r.rows_rejected} rejected "
+              f"({r.rows_per_sec:,.0f} rows/s)", file=sys.stderr)
+
+    report = import_feed(
+        args.feed,
+        args.path,
+        chunk_size=args.chunk_size,
+        chunks_per_tx=args.chunks_per_tx,
+        defer_indexes=not args.keep_indexes,
+        progress=_progress,
+    )
+    for e in report.errors:
+        print(f"  rejected {e}")
+    print(
+        f"Import {report.feed}: {report.rows_upserted}/{report.rows_read} rows upserted, "
+        f"{report.rows_rejected} rejected in {report.elapsed_s:.2f}s ({report.rows_per_sec:,.0f} rows/s)"
+    )
+    if report.rows_rejected:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Small pool of reusable SQLite connections for long-lived worker threads.
+
+Tool calls normally open and close a connection each time (cheap, and it picks up an online reseed
+for free). A pool saves the connect + PRAGMA round trips on hot paths; to keep the reseed behaviour,
+every connection remembers the DB generation it was opened on and is closed once db_generation() has
+moved on: idle ones right after the swap (drain, registered with on_swap), busy ones at checkin.
+"""
+from __future__ import annotations
+
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Tuple
+
+from app.db.database import db_generation, get_conn, on_swap
+
+
+class ConnectionPool:
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self._idle: List[Tuple[str, sqlite3.Connection]] = []
+        self._lock = threading.Lock()
+        self.in_use = 0
+        on_swap(self.drain)
+
+    def _checkout(self) -> Tuple[str, sqlite3.Connection]:
+        generation = db_generation()
+        stale: List[sqlite3.Connection] = []
+        found = None
+        with self._lock:
+            self.in_use += 1
+            while self._idle:
+                gen, conn = self._idle.pop()
+                if gen == generation:
+                    found = (gen, conn)
+                    break
+                stale.append(conn)
+        for conn in stale:
+            conn.close()
+        if found is not None:
+            return found
+        try:
+            return generation, get_conn(check_same_thread=False)
+        except Exception:
+            with self._lock:
+                self.in_use -= 1
+            raise
+
+    def _checkin(self, gen: str, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        current = db_generation()
+        with self._lock:
+            self.in_use -= 1
+            if gen == current and len(self._idle) < self.size:
+                self._idle.append((gen, conn))
+                return
+        conn.close()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        gen, conn = self._checkout()
+        try:
+            yield conn
+        finally:
+            self._checkin(gen, conn)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"size": self.size, "in_use": self.in_use, "idle": len(self._idle)}
+
+    def drain(self) -> None:
+        """Close idle connections opened on an older DB generation (they keep the swapped-out file open)."""
+        generation = db_generation()
+        with self._lock:
+            stale = [conn for gen, conn in self._idle if gen != generation]
+            self._idle = [(gen, conn) for gen, conn in self._idle if gen == generation]
+        for conn in stale:
+            conn.close()
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for _, conn in idle:
+            conn.close()
@@ -1,10 +1,14 @@
 PRAGMA foreign_keys = ON;
+PRAGMA journal_mode = WAL; -- concurrent readers alongside a single short-lived writer
 
+DROP TABLE IF EXISTS inventory_reservations;
 DROP TABLE IF EXISTS interaction_rules;
 DROP TABLE IF EXISTS prescriptions;
 DROP TABLE IF EXISTS inventory;
 DROP TABLE IF EXISTS medications;
 DROP TABLE IF EXISTS patients;
+DROP TABLE IF EXISTS change_log;
+DROP TABLE IF EXISTS table_versions;
 
 CREATE TABLE patients (
   patient_id TEXT PRIMARY KEY,
@@ -19,6 +23,8 @@ CREATE TABLE medications (
   active_ingredients TEXT NOT NULL,
   form TEXT NOT NULL,
   strength TEXT NOT NULL,
+  strength_value REAL, -- normalized amount (mg, or mg per mL); NULL if unparseable
+  strength_unit TEXT, -- normalized unit key, e.g. 'mg', 'mg/mL'
   rx_required INTEGER NOT NULL CHECK(rx_required IN (0,1)),
   standard_instructions TEXT NOT NULL,
   common_side_effects TEXT NOT NULL,
@@ -32,6 +38,15 @@ CREATE TABLE inventory (
   location_bin TEXT
 );
 
+CREATE TABLE inventory_reservations (
+  reservation_id TEXT PRIMARY KEY,
+  med_id TEXT NOT NULL REFERENCES inventory(med_id) ON DELETE CASCADE,
+  qty INTEGER NOT NULL CHECK(qty > 0),
+  status TEXT NOT NULL CHECK(status IN ('active','released','committed','expired')),
+  created_at REAL NOT NULL, -- unix epoch seconds
+  expires_at REAL NOT NULL -- unix epoch seconds
+);
+
 CREATE TABLE prescriptions (
   rx_id TEXT PRIMARY KEY,
   patient_id TEXT NOT NULL REFERENCES patients(patient_id) ON DELETE CASCADE,
@@ -59,12 +74,120 @@ ON medications(brand_name);
 CREATE INDEX IF NOT EXISTS idx_meds_generic
 ON medications(generic_name);
 
-CREATE INDEX IF NOT EXISTS idx_rx_patient_med
-ON prescriptions(patient_id, med_id);
+CREATE INDEX IF NOT EXISTS idx_meds_strength
+ON medications(strength_unit, strength_value);
+
+CREATE INDEX IF NOT EXISTS idx_meds_equivalence
+ON medications(active_ingredients, strength_unit, strength_value);
+
+-- Latest prescription per (patient, med): prescription_verify reads the first entry, no sort
+CREATE INDEX IF NOT EXISTS idx_rx_patient_med_expiry
+ON prescriptions(patient_id, med_id, expires_at DESC);
+
+-- Active holds per med (available = on_hand - active, unexpired holds)
+CREATE INDEX IF NOT EXISTS idx_reservations_active
+ON inventory_reservations(med_id, expires_at, qty) WHERE status = 'active';
 
 -- Prevent duplicate
 CREATE UNIQUE INDEX IF NOT EXISTS idx_interaction_pair
 ON interaction_rules(med_id_a, med_id_b);
 
 CREATE INDEX IF NOT EXISTS idx_interaction_level
-ON interaction_rules(level);
\ No newline at end of file
+ON interaction_rules(level);
+
+-- Change tracking (drives cache invalidation, see app/db/changes.py)
+-- table_versions: one counter per tracked table, bumped by triggers on every row change
+-- change_log: append-only, one row per changed med/patient key; MAX(change_id) is the global version
+-- (an update that changes a key logs the old key too: whatever was cached under it is stale as well)
+CREATE TABLE table_versions (
+  table_name TEXT PRIMARY KEY,
+  version INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT INTO table_versions(table_name) VALUES
+  ('medications'), ('inventory'), ('inventory_reservations'), ('prescriptions'), ('interaction_rules');
+
+CREATE TABLE change_log (
+  change_id INTEGER PRIMARY KEY AUTOINCREMENT,
+  table_name TEXT NOT NULL,
+  op TEXT NOT NULL CHECK(op IN ('insert','update','delete')),
+  med_id TEXT,
+  patient_id TEXT,
+  changed_at REAL NOT NULL DEFAULT (CAST(strftime('%s','now') AS REAL))
+);
+
+CREATE TRIGGER trg_medications_ins AFTER INSERT ON medications BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE table_name = 'medications';
+  INSERT INTO change_log(table_name, op, med_id) VALUES ('medications', 'insert', NEW.med_id);
+END;
+CREATE TRIGGER trg_medications_upd AFTER UPDATE ON medications BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE table_name = 'medications';
+  INSERT INTO change_log(table_name, op, med_id) VALUES ('medications', 'update', NEW.med_id);
+  INSERT INTO change_log(table_name, op, med_id) SELECT 'medications', 'update', OLD.med_id WHERE OLD.med_id IS NOT NEW.med_id;
+END;
+CREATE TRIGGER trg_medications_del AFTER DELETE ON medications BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE table_name = 'medications';
+  INSERT INTO change_log(table_name, op, med_id) VALUES ('medications', 'delete', OLD.med_id);
+END;
+
+CREATE TRIGGER trg_inventory_ins AFTER INSERT ON inventory BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE table_name = 'inventory';
+  INSERT INTO change_log(table_name, op, med_id) VALUES ('inventory', 'insert', NEW.med_id);
+END;
+CREATE TRIGGER trg_inventory_upd AFTER UPDATE ON inventory BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE table_name = 'inventory';
+  INSERT INTO change_log(table_name, op, med_id) VALUES ('inventory', 'update', NEW.med_id);
+  INSERT INTO change_log(table_name, op, med_id) SELECT 'inventory', 'update', OLD.med_id WHERE OLD.med_id IS NOT NEW.med_id;
+END;
+CREATE TRIGGER trg_inventory_del AFTER DELETE ON inventory BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE table_name = 'inventory';
+  INSERT INTO change_log(table_name, op, med_id) VALUES ('inventory', 'delete', OLD.med_id);
+END;
+
+-- holds change qty_available, so they invalidate per-med stock just like inventory rows
+CREATE TRIGGER trg_reservations_ins AFTER INSERT ON inventory_reservations BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE table_name = 'inventory_reservations';
+  INSERT INTO change_log(table_name, op, med_id) VALUES ('inventory_reservations', 'insert', NEW.med_id);
+END;
+CREATE TRIGGER trg_reservations_upd AFTER UPDATE ON inventory_reservations BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE table_name = 'inventory_reservations';
+  INSERT INTO change_log(table_name, op, med_id) VALUES ('inventory_reservations', 'update', NEW.med_id);
+  INSERT INTO change_log(table_name, op, med_id) SELECT 'inventory_reservations', 'update', OLD.med_id WHERE OLD.med_id IS NOT NEW.med_id;
+END;
+CREATE TRIGGER trg_reservations_del AFTER DELETE ON inventory_reservations BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE table_name = 'inventory_reservations';
+  INSERT INTO change_log(table_name, op, med_id) VALUES ('inventory_reservations', 'delete', OLD.med_id);
+END;
+
+CREATE TRIGGER trg_prescriptions_ins AFTER INSERT ON prescriptions BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE table_name = 'prescriptions';
+  INSERT INTO change_log(table_name, op, med_id, patient_id) VALUES ('prescriptions', 'insert', NEW.med_id, NEW.patient_id);
+END;
+CREATE TRIGGER trg_prescriptions_upd AFTER UPDATE ON prescriptions BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE table_name = 'prescriptions';
+  INSERT INTO change_log(table_name, op, med_id, patient_id) VALUES ('prescriptions', 'update', NEW.med_id, NEW.patient_id);
+  INSERT INTO change_log(table_name, op, med_id, patient_id) SELECT 'prescriptions', 'update', OLD.med_id, OLD.patient_id
+    WHERE OLD.med_id IS NOT NEW.med_id OR OLD.patient_id IS NOT NEW.patient_id;
+END;
+CREATE TRIGGER trg_prescriptions_del AFTER DELETE ON prescriptions BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE table_name = 'prescriptions';
+  INSERT INTO change_log(table_name, op, med_id, patient_id) VALUES ('prescriptions', 'delete', OLD.med_id, OLD.patient_id);
+END;
+
+-- a rule concerns two meds: log one change row per endpoint
+CREATE TRIGGER trg_interaction_rules_ins AFTER INSERT ON interaction_rules BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE table_name = 'interaction_rules';
+  INSERT INTO change_log(table_name, op, med_id) VALUES ('interaction_rules', 'insert', NEW.med_id_a), ('interaction_rules', 'insert', NEW.med_id_b);
+END;
+CREATE TRIGGER trg_interaction_rules_upd AFTER UPDATE ON interaction_rules BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE table_name = 'interaction_rules';
+  INSERT INTO change_log(table_name, op, med_id) VALUES ('interaction_rules', 'update', NEW.med_id_a), ('interaction_rules', 'update', NEW.med_id_b);
+  INSERT INTO change_log(table_name, op, med_id) SELECT 'interaction_rules', 'update', OLD.med_id_a
+    WHERE OLD.med_id_a NOT IN (NEW.med_id_a, NEW.med_id_b);
+  INSERT INTO change_log(table_name, op, med_id) SELECT 'interaction_rules', 'update', OLD.med_id_b
+    WHERE OLD.med_id_b NOT IN (NEW.med_id_a, NEW.med_id_b);
+END;
+CREATE TRIGGER trg_interaction_rules_del AFTER DELETE ON interaction_rules BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE table_name = 'interaction_rules';
+  INSERT INTO change_log(table_name, op, med_id) VALUES ('interaction_rules', 'delete', OLD.med_id_a), ('interaction_rules', 'delete', OLD.med_id_b);
+END;
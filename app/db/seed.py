@@ -1,12 +1,31 @@
 from __future__ import annotations
 
+import argparse
 import json
+import logging
+import os
+import sqlite3
+import time
 from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Optional
 
+from app.db import database
 from app.db.database import get_conn
+from app.db.strength import normalize_strength
+
+logger = logging.getLogger("pharmacy_agent.db.seed")
 
 SCHEMA_PATH = "app/db/schema.sql"
 
+# table -> key column: live rows whose key the seed does not produce (e.g. imported feed rows) are lost in a reseed
+_SEEDED_KEYS = {
+    "patients": "patient_id",
+    "medications": "med_id",
+    "prescriptions": "rx_id",
+    "interaction_rules": "rule_id",
+}
+
 def iso(d: date) -> str:
     return d.isoformat()
 
@@ -16,8 +35,9 @@ def iso_dt(dt: datetime) -> str:
 def norm_pair(a: str, b: str) -> tuple[str, str]:
     return (a, b) if a < b else (b, a)
 
-def run_seed() -> None:
-    conn = get_conn()
+def run_seed(db_path: Optional[Path] = None) -> None:
+    """Drop, recreate and populate every table in db_path (default: the live DB_PATH)."""
+    conn = get_conn(db_path)
     try:
         with open(SCHEMA_PATH, "r", encoding="utf-8") as f:
             conn.executescript(f.read())
@@ -107,9 +127,10 @@ def run_seed() -> None:
             """
             INSERT INTO medications(
               med_id, brand_name, generic_name, active_ingredients, form, strength,
+              strength_value, strength_unit,
               rx_required, standard_instructions, common_side_effects, warnings
             )
-            VALUES (?,?,?,?,?,?,?,?,?,?)
+            VALUES (?,?,?,?,?,?,?,?,?,?,?,?)
             """,
             [
                 (
@@ -119,6 +140,7 @@ def run_seed() -> None:
                     json.dumps(m["active_ingredients"]),
                     m["form"],
                     m["strength"],
+                    *normalize_strength(m["strength"]),
                     m["rx_required"],
                     m["standard_instructions"],
                     json.dumps(m["common_side_effects"]),
@@ -214,5 +236,104 @@ def run_seed() -> None:
         conn.close()
 
 
+def _continue_from_live(conn: sqlite3.Connection) -> Dict[str, int]:
+    """
+    Carry live state into a freshly seeded generation (conn, with the live file attached as "live" and
+    both write-locked; see swap_db_file):
+    - the seed is deterministic, so left alone the new file would report the same MAX(change_id) and
+      table_versions as the last reseed; both are moved past the live values so every version check
+      (memo, speculation, early dispatch) sees a change across the swap
+    - active reservations are copied over (their stock stays held), like the versions
+    - returns what the swap discards from the live file: reservations for medications the seed does not
+      recreate, and rows the seed does not recreate (feed imports), by table
+    """
+    live_head = conn.execute("SELECT COALESCE(MAX(change_id), 0) FROM live.change_log").fetchone()[0]
+    own_head = conn.execute("SELECT COALESCE(MAX(change_id), 0) FROM change_log").fetchone()[0]
+    # shift by more than our own head so the renumbered ids never collide with the old ones
+    conn.execute("UPDATE change_log SET change_id = change_id + ?", (live_head + own_head,))
+    conn.execute(
+        "UPDATE sqlite_sequence SET seq = (SELECT MAX(change_id) FROM change_log) WHERE name = 'change_log'"
+    )
+    conn.execute(
+        """
+        UPDATE table_versions SET version = version + 1 + COALESCE(
+          (SELECT l.version FROM live.table_versions l WHERE l.table_name = table_versions.table_name), 0)
+        """
+    )
+
+    active = "status = 'active' AND expires_at > ?"
+    now = time.time()
+    conn.execute(
+        f"""
+        INSERT INTO inventory_reservations(reservation_id, med_id, qty, status, created_at, expires_at)
+        SELECT reservation_id, med_id, qty, status, created_at, expires_at
+        FROM live.inventory_reservations
+        WHERE {active} AND med_id IN (SELECT med_id FROM main.inventory)
+        """,
+        (now,),
+    )
+    discarded = {
+        "active reservations": conn.execute(
+            f"SELECT COUNT(*) FROM live.inventory_reservations WHERE {active} "
+            "AND med_id NOT IN (SELECT med_id FROM main.inventory)",
+            (now,),
+        ).fetchone()[0],
+    }
+    for table, key in _SEEDED_KEYS.items():
+        discarded[table] = conn.execute(
+            f"SELECT COUNT(*) FROM live.{table} WHERE {key} NOT IN (SELECT {key} FROM main.{table})"
+        ).fetchone()[0]
+    return {what: n for what, n in discarded.items() if n}
+
+
+def run_online_seed() -> Path:
+    """
+    Refresh without downtime: seed a new generation file next to DB_PATH, validate it,
+    then atomically swap it in. Live connections never see dropped or half-loaded tables.
+    The new file replaces the live data outright, except for active reservations (carried over): stock
+    changes and imported feed rows in the live file are discarded (logged as a warning); re-run imports
+    afterwards.
+    """
+    from app.db.validate_seed import validate
+
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    gen_path = database.DB_PATH.with_name(f"{database.DB_PATH.name}.gen-{stamp}")
+    try:
+        run_seed(gen_path)
+
+        conn = get_conn(gen_path)
+        try:
+            problems = validate(conn)
+        finally:
+            conn.close()
+        if problems:
+            raise RuntimeError(f"Shadow database failed validation: {problems}")
+        discarded = database.swap_db_file(gen_path, carry=_continue_from_live) or {}
+    except BaseException:
+        if database.db_generation() != os.path.realpath(gen_path):  # never swapped in
+            for p in (gen_path, gen_path.with_name(gen_path.name + "-wal"), gen_path.with_name(gen_path.name + "-shm")):
+                p.unlink(missing_ok=True)
+        raise
+
+    if discarded:
+        logger.warning(
+            "Online reseed discarded live data: %s",
+            ", ".join(f"{n} {what}" for what, n in discarded.items()),
+            extra={"discarded": discarded},
+        )
+    print(f"Online reseed completed: {database.DB_PATH} -> {gen_path.name}")
+    return gen_path
+
+
 if __name__ == "__main__":
-    run_seed()
+    parser = argparse.ArgumentParser(description="Create and populate the synthetic pharmacy DB.")
+    parser.add_argument(
+        "--online",
+        action="store_true",
+        help="build into a shadow file, validate, then atomically swap it in (no downtime)",
+    )
+    args = parser.parse_args()
+    if args.online:
+        run_online_seed()
+    else:
+        run_seed()
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import re
+from typing import NamedTuple, Optional, Tuple
+
+##################### unit tables #####################
+# amount units -> (base unit, factor to base)
+_AMOUNT_UNITS = {
+    "g": ("mg", 1000.0),
+    "gm": ("mg", 1000.0),
+    "gram": ("mg", 1000.0),
+    "grams": ("mg", 1000.0),
+    "mg": ("mg", 1.0),
+    "mcg": ("mg", 0.001),
+    "ug": ("mg", 0.001),
+    "µg": ("mg", 0.001),
+    "iu": ("IU", 1.0),
+    "unit": ("IU", 1.0),
+    "units": ("IU", 1.0),
+    "%": ("%", 1.0),
+}
+
+# volume units -> factor to mL
+_VOLUME_UNITS = {
+    "ml": 1.0,
+    "l": 1000.0,
+}
+
+# grouped thousands ("1,000 mg", "1 000 mg"; no leading zero) are tried before a decimal comma ("0,5 mg")
+_STRENGTH_RE = re.compile(
+    r"(?<![\d.,])(?:(?P<grouped>[1-9]\d{0,2}(?:[, \u00a0\u202f]\d{3})+(?:\.\d+)?)|(?P<amount>\d+(?:[.,]\d+)?))"
+    r"\s*(?P<unit>mcg|µg|ug|mg|gm|grams?|g|iu|units?|%)(?![a-zµ])"
+    r"(?:\s*/\s*(?P<vol>\d+(?:[.,]\d+)?)?\s*(?P<vunit>ml|l)\b)?",
+    re.IGNORECASE,
+)
+
+# "200-400 mg", "200 mg - 400 mg", "200 to 400 mg": a dose range, not one strength
+_RANGE_BEFORE_RE = re.compile(r"\d\s*(?:[-–—]|to)\s*$", re.IGNORECASE)
+_RANGE_AFTER_RE = re.compile(r"\s*(?:[-–—]|to)\s*\d", re.IGNORECASE)
+
+# relative tolerance when comparing normalized strengths (float rounding only)
+STRENGTH_REL_TOL = 1e-6
+
+
+class ParsedStrength(NamedTuple):
+    amount: float  # as written, e.g. 10 for "10 mg/5 mL"
+    unit: str  # as written, lower-cased, e.g. "mg"
+    per_volume: Optional[float] = None  # e.g. 5 for "10 mg/5 mL"
+    per_volume_unit: Optional[str] = None  # e.g. "ml"
+
+    def normalized(self) -> Tuple[float, str]:
+        """
+        Return (value, unit_key) comparable across spellings:
+        "0.2 g" -> (200.0, "mg"), "10 mg/5 mL" -> (2.0, "mg/mL").
+        """
+        base_unit, factor = _AMOUNT_UNITS[self.unit]
+        value = self.amount * factor
+        if self.per_volume_unit is None:
+            return value, base_unit
+        ml = (self.per_volume or 1.0) * _VOLUME_UNITS[self.per_volume_unit]
+        return value / ml, f"{base_unit}/mL"
+
+
+def _to_float(s: str) -> float:
+    return float(s.replace(",", "."))
+
+
+def parse_strength(text: Optional[str]) -> Optional[ParsedStrength]:
+    """
+    Parse a free-text strength ("200 mg", "10 mg/5 mL", "0.2 g", "1,000 mg") into numbers.
+    Returns None when no strength expression is found, or for a range ("200-400 mg"):
+    picking either end would let it match products it is not equivalent to.
+    """
+    if not text:
+        return None
+    text = text.strip()
+    m = _STRENGTH_RE.search(text)
+    if m is None:
+        return None
+    if _RANGE_BEFORE_RE.search(text[:m.start()]) or _RANGE_AFTER_RE.match(text[m.end():]):
+        return None
+
+    grouped = m.group("grouped")
+    vunit = m.group("vunit")
+    vol = m.group("vol")
+    return ParsedStrength(
+        amount=float(re.sub(r"[, \u00a0\u202f]", "", grouped)) if grouped else _to_float(m.group("amount")),
+        unit=m.group("unit").lower(),
+        per_volume=_to_float(vol) if vol else (1.0 if vunit else None),
+        per_volume_unit=vunit.lower() if vunit else None,
+    )
+
+
+def normalize_strength(text: Optional[str]) -> Tuple[Optional[float], Optional[str]]:
+    """
+    (strength_value, strength_unit) as stored on medications; (None, None) if unparseable.
+    """
+    parsed = parse_strength(text)
+    if parsed is None:
+        return None, None
+    return parsed.normalized()
+
+
+def strength_range(value: float) -> Tuple[float, float]:
+    """Inclusive [lo, hi] window used to match a normalized strength in SQL."""
+    tol = abs(value) * STRENGTH_REL_TOL
+    return value - tol, value + tol
@@ -1,19 +1,48 @@
+import sqlite3
+import sys
+from typing import Dict, List
+
 from app.db.database import get_conn
 
+COUNT_CHECKS = {
+    "patients": "SELECT COUNT(*) FROM patients",
+    "medications": "SELECT COUNT(*) FROM medications",
+    "inventory": "SELECT COUNT(*) FROM inventory",
+    "prescriptions": "SELECT COUNT(*) FROM prescriptions",
+    "interaction_rules": "SELECT COUNT(*) FROM interaction_rules",
+}
+
+def collect_counts(conn: sqlite3.Connection) -> Dict[str, int]:
+    return {name: conn.execute(q).fetchone()[0] for name, q in COUNT_CHECKS.items()}
+
+def validate(conn: sqlite3.Connection) -> List[str]:
+    """
+    Return a list of problems (empty if the database is usable).
+    Used by `python -m app.db.validate_seed` and before an online reseed swaps a new file in.
+    """
+    problems: List[str] = []
+
+    if conn.execute("PRAGMA quick_check").fetchone()[0] != "ok":
+        problems.append("quick_check failed")
+    if conn.execute("PRAGMA foreign_key_check").fetchone() is not None:
+        problems.append("foreign key violations")
+
+    for name, n in collect_counts(conn).items():
+        if n == 0:
+            problems.append(f"{name} is empty")
+
+    # critical demo checks
+    for med_id in ("MED001", "MED002"):
+        if conn.execute("SELECT 1 FROM inventory WHERE med_id = ?", (med_id,)).fetchone() is None:
+            problems.append(f"{med_id} missing from inventory")
+
+    return problems
+
 def main():
     conn = get_conn()
     cur = conn.cursor()
 
-    checks = {
-        "patients": "SELECT COUNT(*) FROM patients",
-        "medications": "SELECT COUNT(*) FROM medications",
-        "inventory": "SELECT COUNT(*) FROM inventory",
-        "prescriptions": "SELECT COUNT(*) FROM prescriptions",
-        "interaction_rules": "SELECT COUNT(*) FROM interaction_rules",
-    }
-
-    for name, q in checks.items():
-        n = cur.execute(q).fetchone()[0]
+    for name, n in collect_counts(conn).items():
         print(f"{name}: {n}")
 
     # critical demo checks
@@ -27,7 +56,12 @@ def main():
     print("MED001 qty:", med001)
     print("MED002 qty:", med002)
 
+    problems = validate(conn)
     conn.close()
+    for p in problems:
+        print("PROBLEM:", p)
+    if problems:
+        sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,183 @@
+"""
+Structured JSON logging (pharmacy_agent.* at LOG_LEVEL, everything else at WARNING).
+
+    - one JSON object per line: ts, level, logger, msg, plus every `extra=` field
+    - records go through a QueueHandler; a QueueListener thread does the JSON encoding and the write,
+      so request threads only pay for building the record
+    - per-event sampling (by message, e.g. "tool_event"): sampled-out records never reach the queue;
+      kept records carry "sample_rate" so counts can be scaled back up. WARNING and above are never sampled.
+    - patient_id values are redacted at any depth (also inside JSON/repr text and pydantic errors); extra fields larger than LOG_MAX_FIELD_BYTES are
+      truncated
+
+Configured from the environment (LOG_LEVEL, LOG_FORMAT=json|text, LOG_SAMPLE_RATES, LOG_MAX_FIELD_BYTES).
+"""
+from __future__ import annotations
+
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+LOG_MAX_FIELD_BYTES = int(os.getenv("LOG_MAX_FIELD_BYTES", "2048"))
+REDACTED_KEYS = frozenset({"patient_id"})
+REDACTED = "[redacted]"
+# the same keys inside JSON / repr text (tool arguments strings, pydantic error messages): quoted,
+# numeric or bare values
+_REDACT_IN_TEXT_RE = re.compile(r"""(["']patient_id["']\s*:\s*)(?:(["'])(?:\\.|(?!\2).)*\2|[^\s,}\]]+)""")
+# pydantic error text puts the value on the line after the field's loc ("patient_id", "items.0.patient_id"):
+#   patient_id
+#     Input should be a valid string [type=string_type, input_value=12345, input_type=int]
+_REDACT_INPUT_VALUE_RE = re.compile(r"""(\bpatient_id\n[^\n]*?\binput_value=)(?:(["'])(?:\\.|(?!\2).)*\2|[^,\]\n]+)""")
+
+# hot-path events logged once per tool call / per tool result; overridden by LOG_SAMPLE_RATES
+DEFAULT_SAMPLE_RATES: Dict[str, float] = {
+    "tool_event": 0.1,
+    "Tool executed successfully": 0.05,
+}
+
+# attributes every LogRecord has; anything else on a record came from `extra=`
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """"tool_event=0.5,turn_metrics=1" -> {"tool_event": 0.5, "turn_metrics": 1.0}"""
+    rates: Dict[str, float] = {}
+    for part in spec.split(","):
+        if "=" in part:
+            event, rate = part.rsplit("=", 1)
+            rates[event.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+def redact(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: REDACTED if k in REDACTED_KEYS else redact(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(v) for v in value]
+    if isinstance(value, str) and "patient_id" in value:
+        return _REDACT_INPUT_VALUE_RE.sub(_redacted_match, _REDACT_IN_TEXT_RE.sub(_redacted_match, value))
+    return value
+
+
+def _redacted_match(match: "re.Match[str]") -> str:
+    quote = match.group(2) or '"'  # unquoted values come back quoted, so JSON text stays valid
+    return f"{match.group(1)}{quote}{REDACTED}{quote}"
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rates: Dict[str, float]) -> None:
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(record.msg) if isinstance(record.msg, str) else None
+        if rate is None or rate >= 1.0 or record.levelno >= logging.WARNING:
+            return True
+        if random.random() >= rate:
+            return False
+        record.sample_rate = rate
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def __init__(self, max_field_bytes: int = LOG_MAX_FIELD_BYTES) -> None:
+        super().__init__()
+        self.max_field_bytes = max_field_bytes
+
+    def _field(self, value: Any) -> Any:
+        value = redact(value)
+        if isinstance(value, (bool, int, float)) or value is None:
+            return value
+        text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+        if len(text) > self.max_field_bytes:
+            return f"{text[:self.max_field_bytes]}...[+{len(text) - self.max_field_bytes} chars]"
+        return value
+
+    def format(self, record: logging.LogRecord) -> str:
+        out: Dict[str, Any] = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                out[key] = REDACTED if key in REDACTED_KEYS else self._field(value)
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            out["exc"] = record.exc_text
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(QueueHandler):
+    """Defers formatting to the listener; only the message args and traceback are resolved here."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_listener: Optional[QueueListener] = None
+
+
+def configure_logging(
+    level: Optional[str] = None,
+    fmt: Optional[str] = None,
+    sample_rates: Optional[Dict[str, float]] = None,
+    stream: Any = None,
+) -> QueueListener:
+    """Install queue-based logging on the root logger (idempotent; replaces its handlers)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    level = level or os.getenv("LOG_LEVEL", "INFO")
+    fmt = fmt or os.getenv("LOG_FORMAT", "json")
+    if sample_rates is None:
+        sample_rates = {**DEFAULT_SAMPLE_RATES, **parse_sample_rates(os.getenv("LOG_SAMPLE_RATES", ""))}
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    if fmt == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    handler = _QueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(sample_rates))
+
+    root = logging.getLogger()
+    for old in list(root.handlers):
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(logging.WARNING)  # third-party loggers (httpx, openai) stay quiet
+    logging.getLogger("pharmacy_agent").setLevel(level)
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
@@ -0,0 +1,79 @@
+"""
+Async entry points for the tools.
+
+sqlite3 has no non-blocking API (aiosqlite is itself a thread per connection), so the async tools
+run the unchanged sync implementations on a dedicated DB executor whose threads borrow connections
+from their own pool. The event loop only awaits a future: it never blocks on SQLite, and result
+contracts are exactly those of the sync tools.
+
+    out = await dispatch_tool_async("inventory_check", {"query": "advil"})
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Sequence, TypeVar
+
+from app.db.pool import ConnectionPool
+from app.tools.contracts import (
+    InteractionCheckOutput,
+    InventoryCheckOutput,
+    InventoryFindEquivalentOutput,
+    PrescriptionVerifyOutput,
+)
+from app.tools.dispatcher import dispatch_tool
+from app.tools.interactions import interaction_check
+from app.tools.inventory import inventory_check, inventory_find_equivalent
+from app.tools.prescriptions import prescription_verify, prescription_verify_many
+
+DB_THREADS = int(os.getenv("PHARMACY_DB_THREADS", "4"))
+
+DB_EXECUTOR = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="pharmacy-db")
+DB_POOL = ConnectionPool(size=DB_THREADS)
+
+T = TypeVar("T")
+
+
+def _with_pooled_conn(fn: Callable[..., T], *args: Any) -> T:
+    with DB_POOL.connection() as conn:
+        return fn(*args, conn=conn)
+
+
+async def run_db(fn: Callable[..., T], *args: Any) -> T:
+    """Run fn(*args, conn=<pooled connection>) on the DB executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(DB_EXECUTOR, _with_pooled_conn, fn, *args)
+
+
+async def inventory_check_async(payload: Dict[str, Any]) -> InventoryCheckOutput:
+    return await run_db(inventory_check, payload)
+
+
+async def inventory_find_equivalent_async(payload: Dict[str, Any]) -> InventoryFindEquivalentOutput:
+    return await run_db(inventory_find_equivalent, payload)
+
+
+async def prescription_verify_async(payload: Dict[str, Any]) -> PrescriptionVerifyOutput:
+    return await run_db(prescription_verify, payload)
+
+
+async def prescription_verify_many_async(payloads: Sequence[Dict[str, Any]]) -> List[PrescriptionVerifyOutput]:
+    return await run_db(prescription_verify_many, payloads)
+
+
+async def interaction_check_async(payload: Dict[str, Any]) -> InteractionCheckOutput:
+    return await run_db(interaction_check, payload)
+
+
+async def dispatch_tool_async(tool_name: str, tool_args: Dict[str, Any]) -> Dict[str, Any]:
+    """Async dispatch_tool: same validation, error envelopes and output dict."""
+    return await run_db(dispatch_tool, tool_name, tool_args)
+
+
+ASYNC_TOOL_IMPLS: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+    "inventory_check": inventory_check_async,
+    "inventory_find_equivalent": inventory_find_equivalent_async,
+    "prescription_verify": prescription_verify_async,
+    "interaction_check": interaction_check_async,
+}
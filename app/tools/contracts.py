@@ -7,6 +7,7 @@ from pydantic import BaseModel, Field, ConfigDict
 
 # You can import enums from your domain models to avoid duplication:
 from app.db.models import Language, InteractionLevel
+from app.tools.paging import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 
 class ContractBase(BaseModel):
     model_config = ConfigDict(extra="forbid")
@@ -15,7 +16,9 @@ class ContractBase(BaseModel):
 ##################### error envelope #####################
 ToolErrorCode = Literal[
     "MED_NOT_FOUND", "PATIENT_NOT_FOUND", "UNKNOWN_MED_ID",
-    "NO_EQUIVALENTS_FOUND", "DB_ERROR", "INVALID_QUERY"
+    "NO_EQUIVALENTS_FOUND", "DB_ERROR", "INVALID_QUERY",
+    "INSUFFICIENT_STOCK", "RESERVATION_NOT_FOUND", "RESERVATION_NOT_ACTIVE",
+    "INVALID_CURSOR", "INVALID_TOOL_ARGS",
 ]
 
 class ToolError(ContractBase):
@@ -26,6 +29,18 @@ class ToolResultBase(ContractBase):
     ok: bool = True
     error: Optional[ToolError] = None
 
+class PagedResultBase(ToolResultBase):
+    total_count: Optional[int] = Field(
+        default=None,
+        ge=0,
+        description="all matches across pages (first page only)",
+    )
+    has_more: bool = False
+    next_cursor: Optional[str] = Field(
+        default=None,
+        description="pass as cursor to get the next page",
+    )
+
 ##################### structs used across multiple tools #####################
 class MedicationInfo(ContractBase):
     med_id: str = Field(..., examples=["MED001"])
@@ -38,6 +53,12 @@ class MedicationInfo(ContractBase):
 
 class StockedMedication(MedicationInfo):
     qty_on_hand: int = Field(..., ge=0, examples=[12])
+    qty_available: Optional[int] = Field(
+        default=None,
+        ge=0,
+        description="qty_on_hand minus active (unexpired) reservations",
+        examples=[10],
+    )
 
 
 ##################### TOOLS #####################
@@ -45,8 +66,14 @@ class StockedMedication(MedicationInfo):
 class InventoryCheckInput(ContractBase):
     query: str = Field(..., min_length=1, examples=["Advil", "ibuprofen 200"])
     language: Language = Field(default=Language.he)
+    limit: int = Field(
+        default=DEFAULT_PAGE_SIZE,
+        ge=1,
+        description=f"results per page (at most {MAX_PAGE_SIZE})",
+    )
+    cursor: Optional[str] = Field(default=None, description="next_cursor from the previous page")
 
-class InventoryCheckOutput(ToolResultBase):
+class InventoryCheckOutput(PagedResultBase):
     matches: List[StockedMedication] = Field(default_factory=list)
     notes: Optional[str] = None
 
@@ -68,8 +95,14 @@ class InventoryFindEquivalentInput(ContractBase):
     language: Language = Field(default=Language.he)
     require_same_strength: bool = True
     require_same_form: bool = True
+    limit: int = Field(
+        default=DEFAULT_PAGE_SIZE,
+        ge=1,
+        description=f"results per page (at most {MAX_PAGE_SIZE})",
+    )
+    cursor: Optional[str] = Field(default=None, description="next_cursor from the previous page")
 
-class InventoryFindEquivalentOutput(ToolResultBase):
+class InventoryFindEquivalentOutput(PagedResultBase):
     requested: Optional[StockedMedication] = None
     equivalents: List[EquivalentOption] = Field(default_factory=list)
     notes: Optional[str] = None
@@ -125,6 +158,25 @@ class InteractionCheckOutput(ToolResultBase):
     pairs: List[InteractionPair] = Field(default_factory=list)
     notes: Optional[str] = None
 
+##################### stock reservations (backend only, not exposed to the model) #####################
+ReservationStatus = Literal["active", "released", "committed", "expired"]
+
+class InventoryReserveInput(ContractBase):
+    med_id: str = Field(..., examples=["MED002"])
+    qty: int = Field(..., ge=1, examples=[1])
+    ttl_seconds: int = Field(default=900, ge=1, le=86400, description="Hold expires after this many seconds")
+
+class ReservationActionInput(ContractBase):
+    reservation_id: str = Field(..., examples=["RES3F9A1C2B7D10"])
+
+class ReservationOutput(ToolResultBase):
+    reservation_id: Optional[str] = None
+    med_id: Optional[str] = None
+    qty: Optional[int] = Field(default=None, ge=1)
+    status: Optional[ReservationStatus] = None
+    expires_at: Optional[str] = Field(default=None, description="ISO UTC timestamp")
+    qty_available: Optional[int] = Field(default=None, ge=0)
+
 ##################### registry for tool writing #####################
 TOOL_REGISTRY = {
     "inventory_check": (InventoryCheckInput, InventoryCheckOutput),
@@ -1,16 +1,18 @@
 from __future__ import annotations
 
-from typing import Any, Callable, Dict, Tuple, Type
+from typing import Any, Callable, Dict, Optional, Tuple, Type
 from pydantic import BaseModel, ValidationError
+import json
 import logging
+import sqlite3
 
 from app.tools.contracts import TOOL_REGISTRY, ToolError
 from app.tools.inventory import inventory_check, inventory_find_equivalent
 from app.tools.prescriptions import prescription_verify
 from app.tools.interactions import interaction_check
 
-# map tool name to implementation
-TOOL_IMPLS: Dict[str, Callable[[Dict[str, Any]], BaseModel]] = {
+# map tool name to implementation; each takes (payload, conn=None) and opens its own connection if none given
+TOOL_IMPLS: Dict[str, Callable[..., BaseModel]] = {
     "inventory_check": inventory_check,
     "inventory_find_equivalent": inventory_find_equivalent,
     "prescription_verify": prescription_verify,
@@ -19,9 +21,26 @@ TOOL_IMPLS: Dict[str, Callable[[Dict[str, Any]], BaseModel]] = {
 
 logger = logging.getLogger("pharmacy_agent.tools")
 
-def dispatch_tool(tool_name: str, tool_args: Dict[str, Any]) -> Dict[str, Any]:
+def canonical_tool_args(tool_name: str, tool_args: Dict[str, Any]) -> Optional[str]:
+    """
+    Stable key for a tool call: args validated (defaults filled in) and JSON-encoded with sorted keys,
+    so {"query": "x"} and {"language": "he", "query": "x"} are the same call. None if args are invalid.
+    """
+    if tool_name not in TOOL_REGISTRY:
+        return None
+    input_model, _ = TOOL_REGISTRY[tool_name]
+    try:
+        validated = input_model.model_validate(tool_args)
+    except ValidationError:
+        return None
+    return json.dumps([tool_name, validated.model_dump(mode="json")], sort_keys=True, ensure_ascii=False)
+
+def dispatch_tool(
+    tool_name: str, tool_args: Dict[str, Any], conn: Optional[sqlite3.Connection] = None
+) -> Dict[str, Any]:
     """
     Dispatch tool call by name.
+    conn: optional borrowed connection (e.g. from a pool, see app/tools/aio.py); not closed here.
     """
     # check the tool exists
     if tool_name not in TOOL_REGISTRY or tool_name not in TOOL_IMPLS:
@@ -56,7 +75,7 @@ def dispatch_tool(tool_name: str, tool_args: Dict[str, Any]) -> Dict[str, Any]:
 
     # call implementation
     try:
-        out_obj = impl(validated_in.model_dump())
+        out_obj = impl(validated_in.model_dump(), conn=conn)
     except Exception as e:
         logger.exception(
             "Tool runtime error",
@@ -1,8 +1,10 @@
 from __future__ import annotations
 
 import sqlite3
-from typing import Dict, Any, List, Set, Tuple
+from itertools import combinations
+from typing import Dict, Any, List, Optional, Set, Tuple
 
+from app.db.catalog import Catalog, get_catalog
 from app.db.database import get_conn
 from app.tools.contracts import (
     InteractionCheckInput,
@@ -12,7 +14,36 @@ from app.tools.contracts import (
     ToolError,
 )
 
-def interaction_check(payload: Dict[str, Any]) -> InteractionCheckOutput:
+def _overall_level(pairs: List[InteractionPair]) -> InteractionLevel:
+    # determine interaction level
+    if any(p.level == InteractionLevel.avoid for p in pairs):
+        return InteractionLevel.avoid
+    if any(p.level == InteractionLevel.caution for p in pairs):
+        return InteractionLevel.caution
+    return InteractionLevel.none
+
+def _interaction_check_catalog(catalog: Catalog, med_set: Set[str]) -> InteractionCheckOutput:
+    """Same result as the SQL path, answered from the shared memory-mapped catalog."""
+    index = {m: catalog.index_of(m) for m in med_set}
+    missing = sorted(m for m, i in index.items() if i is None)
+    if missing:
+        return InteractionCheckOutput(
+            ok=False,
+            error=ToolError(code="UNKNOWN_MED_ID", message=f"Unknown med_id(s): {missing}"),
+            interaction_level=InteractionLevel.none,
+            pairs=[],
+        )
+
+    pairs: List[InteractionPair] = []
+    for a, b in combinations(sorted(med_set), 2):  # sorted == stored (a < b) order
+        hit = catalog.interaction(index[a], index[b])
+        if hit is not None:
+            level, message = hit
+            pairs.append(InteractionPair(med_id_a=a, med_id_b=b, level=InteractionLevel(level), message=message))
+
+    return InteractionCheckOutput(ok=True, interaction_level=_overall_level(pairs), pairs=pairs, notes=None)
+
+def interaction_check(payload: Dict[str, Any], conn: Optional[sqlite3.Connection] = None) -> InteractionCheckOutput:
     """
     Check pairwise interactions among given med_ids.
     - validate all med_ids exist
@@ -23,7 +54,13 @@ def interaction_check(payload: Dict[str, Any]) -> InteractionCheckOutput:
     med_ids = inp.med_ids
     med_set = set(med_ids)
 
-    conn = get_conn()
+    catalog = get_catalog()
+    if catalog is not None:
+        return _interaction_check_catalog(catalog, med_set)
+
+    own_conn = conn is None
+    if own_conn:
+        conn = get_conn()
     try:
         # validate medication existence
         placeholders = ",".join(["?"] * len(med_ids))
@@ -71,16 +108,9 @@ def interaction_check(payload: Dict[str, Any]) -> InteractionCheckOutput:
                 )
         )
 
-        # determine interaction level
-        overall = InteractionLevel.none
-        if any(p.level == InteractionLevel.avoid for p in pairs):
-            overall = InteractionLevel.avoid
-        elif any(p.level == InteractionLevel.caution for p in pairs):
-            overall = InteractionLevel.caution
-
         return InteractionCheckOutput(
             ok=True,
-            interaction_level=overall,
+            interaction_level=_overall_level(pairs),
             pairs=pairs,
             notes=None,
         )
@@ -94,4 +124,5 @@ def interaction_check(payload: Dict[str, Any]) -> InteractionCheckOutput:
         )
 
     finally:
-        conn.close()
\ No newline at end of file
+        if own_conn:
+            conn.close()
\ No newline at end of file
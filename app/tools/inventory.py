@@ -2,17 +2,19 @@ from __future__ import annotations
 
 import json
 import sqlite3
-from typing import Dict, Any, List
+from typing import Callable, Dict, Any, List, Optional, Tuple
 
+from app.db.catalog import get_catalog
 from app.db.database import get_conn
+from app.db.strength import STRENGTH_REL_TOL, parse_strength, strength_range
+from app.tools.paging import InvalidCursor, decode_cursor, encode_cursor, page_size, scope_of
+from app.tools.rows import STOCK_COLUMNS, StockRow
 from app.tools.contracts import (
     InventoryCheckInput,
     InventoryCheckOutput,
     InventoryFindEquivalentInput,
     InventoryFindEquivalentOutput,
     StockedMedication,
-    EquivalentDisclosure,
-    EquivalentOption,
     ToolError,
 )
 import re
@@ -26,6 +28,11 @@ _STOPWORDS = {
     "oral", "po",
 }
 
+_POSSIBLE_DIFFERENCES = ("price", "inactive ingredients", "packaging")
+
+# numbers and unit fragments left over from strength expressions ("0.2", "mg/5", "ml")
+_STRENGTH_TOKEN_RE = re.compile(r"[\d.,]*(mcg|ug|mg|g|iu|units?|ml|l|%)?(/[\d.,]*(ml|l)?)?")
+
 def normalize_query(q: str) -> str:
     q = q.lower().strip()
     q = q.replace("־", "-")  # hebrew dash normalization (optional)
@@ -45,20 +52,120 @@ def _simplify_tokens(q: str) -> List[str]:
     for t in q.split():
         if t in _STOPWORDS:
             continue
-        if t.isdigit():
-            continue
-        if re.fullmatch(r"\d+(\.\d+)?(mg|mcg|g|ml)", t):
+        if _STRENGTH_TOKEN_RE.fullmatch(t):
             continue
         if len(t) < 2:
             continue
         toks.append(t)
     return toks
 
-def inventory_check(payload: Dict[str, Any]) -> InventoryCheckOutput:
+def _strength_filter(text: str) -> Tuple[str, List[Any]]:
+    """
+    SQL clause + params restricting m.strength to the strength written in text
+    (unit-aware, e.g. "0.2 g" == "200 mg"). Empty clause if text has no strength.
+    """
+    parsed = parse_strength(text)
+    if parsed is None:
+        return "", []
+    value, unit = parsed.normalized()
+    lo, hi = strength_range(value)
+    return "m.strength_unit = ? AND m.strength_value BETWEEN ? AND ?", [unit, lo, hi]
+
+def _same_strength(a: StockRow, b: StockRow) -> bool:
+    if a.strength_value is None or b.strength_value is None:
+        return a.strength == b.strength
+    if a.strength_unit != b.strength_unit:
+        return False
+    return abs(a.strength_value - b.strength_value) <= abs(a.strength_value) * STRENGTH_REL_TOL
+
+# keyset ordering; med_id makes the sort key unique so a page boundary is never ambiguous
+_CHECK_ORDER = "(i.qty_on_hand > 0) DESC, m.brand_name ASC, m.med_id ASC"
+_CHECK_AFTER = (
+    "((i.qty_on_hand > 0) < ? OR ((i.qty_on_hand > 0) = ? "
+    "AND (m.brand_name > ? OR (m.brand_name = ? AND m.med_id > ?))))"
+)
+_EQUIV_ORDER = "i.qty_on_hand DESC, m.brand_name ASC, m.med_id ASC"
+_EQUIV_AFTER = (
+    "(i.qty_on_hand < ? OR (i.qty_on_hand = ? "
+    "AND (m.brand_name > ? OR (m.brand_name = ? AND m.med_id > ?))))"
+)
+
+# the sort key of a row in SQL, for fingerprinting a result set (see _result_version)
+_CHECK_KEY_SQL = "m.med_id || ':' || (i.qty_on_hand > 0) || ':' || m.brand_name"
+_EQUIV_KEY_SQL = "m.med_id || ':' || i.qty_on_hand || ':' || m.brand_name"
+
+def _check_key(item: Dict[str, Any]) -> List[Any]:
+    return [int(item["qty_on_hand"] > 0), item["brand_name"], item["med_id"]]
+
+def _equiv_key(item: Dict[str, Any]) -> List[Any]:
+    return [item["qty_on_hand"], item["brand_name"], item["med_id"]]
+
+# tool -> (paged list field, cursor key of one item), so whoever cuts a page short
+# (see app/agent/compaction.py) can point next_cursor right after the last item it kept
+PAGED_LISTS: Dict[str, Tuple[str, Callable[[Dict[str, Any]], List[Any]]]] = {
+    "inventory_check": ("matches", _check_key),
+    "inventory_find_equivalent": ("equivalents", _equiv_key),
+}
+
+def _fetch_page(
+    conn: sqlite3.Connection,
+    where: str,
+    params: List[Any],
+    order: str,
+    after_sql: str,
+    after: Optional[List[Any]],
+    size: int,
+) -> List[Any]:
+    """Up to size + 1 rows (the extra one only tells whether there is a next page)."""
+    params = list(params)
+    if after is not None:
+        first, brand, med_id = after
+        where = f"({where}) AND {after_sql}"
+        params += [first, first, brand, brand, med_id]
+    return conn.execute(
+        f"""
+        SELECT {STOCK_COLUMNS}
+        FROM medications m
+        JOIN inventory i ON i.med_id = m.med_id
+        WHERE {where}
+        ORDER BY {order}
+        LIMIT ?
+        """,
+        params + [size + 1],
+    ).fetchall()
+
+def _count(conn: sqlite3.Connection, where: str, params: List[Any]) -> int:
+    return conn.execute(
+        f"SELECT COUNT(*) FROM medications m JOIN inventory i ON i.med_id = m.med_id WHERE {where}",
+        params,
+    ).fetchone()[0]
+
+def _result_version(conn: sqlite3.Connection, where: str, params: List[Any], key_sql: str) -> str:
+    """
+    Fingerprint of the sort keys of every row the query matches. Cursors carry it so paging never skips
+    or repeats rows: a later page is rejected only if a row of this result set moved in the order (or
+    joined / left it). Changes to other rows, or to stock that leaves a row's key as it was, keep it valid.
+    """
+    keys = conn.execute(
+        f"""
+        SELECT group_concat(k, '|') FROM (
+            SELECT {key_sql} AS k
+            FROM medications m
+            JOIN inventory i ON i.med_id = m.med_id
+            WHERE {where}
+            ORDER BY m.med_id
+        )
+        """,
+        params,
+    ).fetchone()[0]
+    return scope_of(keys)
+
+def inventory_check(payload: Dict[str, Any], conn: Optional[sqlite3.Connection] = None) -> InventoryCheckOutput:
     """
     Search medication by free-text query and return stock.
     Pass 1: broad LIKE on whole query.
-    Pass 2: tokenized fallback stripping strength/form words (e.g., "200 mg tablets").
+    Pass 2: tokenized fallback stripping strength/form words (e.g., "200 mg tablets"),
+            narrowed to the parsed strength when one is given (retried without it if nothing matches).
     """
     inp = InventoryCheckInput.model_validate(payload)
     raw_q = inp.query.strip()
@@ -71,79 +178,88 @@ def inventory_check(payload: Dict[str, Any]) -> InventoryCheckOutput:
             matches=[],
         )
 
-    conn = get_conn()
+    # ---- PASS 1: whole-query LIKE (your current behavior) ----
+    like = f"%{q}%"
+    stages: List[Tuple[str, List[Any]]] = [
+        ("(lower(m.brand_name) LIKE ? OR lower(m.generic_name) LIKE ?)", [like, like]),
+    ]
+
+    # ---- PASS 2: tokenized fallback ----
+    toks = _simplify_tokens(raw_q)
+    if toks:
+        # AND across tokens; each token can match brand OR generic
+        token_where = " AND ".join(["(lower(m.brand_name) LIKE ? OR lower(m.generic_name) LIKE ?)"] * len(toks))
+        token_params: List[Any] = []
+        for t in toks:
+            like_t = f"%{t}%"
+            token_params.extend([like_t, like_t])
+
+        # prefer the strength written in the query; fall back to any strength
+        strength_where, strength_params = _strength_filter(raw_q)
+        if strength_where:
+            stages.append((f"{token_where} AND {strength_where}", token_params + strength_params))
+        stages.append((token_where, token_params))
+
+    # a cursor pins the pass that produced the first page and continues after its last row
+    size = page_size(inp.limit)
+    scope = scope_of("inventory_check", q)
+    after: Optional[List[Any]] = None
+    candidates = range(len(stages))
+
+    own_conn = conn is None
+    if own_conn:
+        conn = get_conn()
     try:
-        # ---- PASS 1: whole-query LIKE (your current behavior) ----
-        like = f"%{q}%"
-        rows = conn.execute(
-            """
-            SELECT m.med_id,
-                   m.brand_name,
-                   m.generic_name,
-                   m.active_ingredients,
-                   m.form,
-                   m.strength,
-                   m.rx_required,
-                   i.qty_on_hand
-            FROM medications m
-            JOIN inventory i ON i.med_id = m.med_id
-            WHERE lower(m.brand_name) LIKE ?
-               OR lower(m.generic_name) LIKE ?
-            ORDER BY (i.qty_on_hand > 0) DESC, m.brand_name ASC
-            """,
-            (like, like),
-        ).fetchall()
+        # each fingerprint is read before its page, so a concurrent change can only make the next cursor
+        # stale, never miss it
+        if inp.cursor:
+            try:
+                stage, after = decode_cursor(inp.cursor, scope)
+                if not 0 <= stage < len(stages) or len(after) != 3:
+                    raise InvalidCursor("Malformed cursor.")
+                decode_cursor(inp.cursor, scope, _result_version(conn, *stages[stage], _CHECK_KEY_SQL))
+            except InvalidCursor as e:
+                return InventoryCheckOutput(
+                    ok=False,
+                    error=ToolError(code="INVALID_CURSOR", message=str(e)),
+                    matches=[],
+                )
+            candidates = range(stage, stage + 1)
 
-        # ---- PASS 2: tokenized fallback ----
-        if not rows:
-            toks = _simplify_tokens(raw_q)
-            if toks:
-                # AND across tokens; each token can match brand OR generic
-                where = " AND ".join(["(lower(m.brand_name) LIKE ? OR lower(m.generic_name) LIKE ?)"] * len(toks))
-                params: List[str] = []
-                for t in toks:
-                    like_t = f"%{t}%"
-                    params.extend([like_t, like_t])
-
-                sql = f"""
-                SELECT m.med_id,
-                       m.brand_name,
-                       m.generic_name,
-                       m.active_ingredients,
-                       m.form,
-                       m.strength,
-                       m.rx_required,
-                       i.qty_on_hand
-                FROM medications m
-                JOIN inventory i ON i.med_id = m.med_id
-                WHERE {where}
-                ORDER BY (i.qty_on_hand > 0) DESC, m.brand_name ASC
-                """
-                rows = conn.execute(sql, params).fetchall()
+        rows: List[Any] = []
+        version = ""
+        for stage in candidates:
+            where, params = stages[stage]
+            version = _result_version(conn, where, params, _CHECK_KEY_SQL)
+            rows = _fetch_page(conn, where, params, _CHECK_ORDER, _CHECK_AFTER, after, size)
+            if rows:
+                break
 
         if not rows:
+            if after is not None:
+                return InventoryCheckOutput(ok=True, matches=[])
             return InventoryCheckOutput(
                 ok=False,
                 error=ToolError(code="MED_NOT_FOUND", message="No medication matched the query."),
                 matches=[],
             )
 
-        matches: List[StockedMedication] = []
-        for r in rows:
-            matches.append(
-                StockedMedication(
-                    med_id=r["med_id"],
-                    brand_name=r["brand_name"],
-                    generic_name=r["generic_name"],
-                    active_ingredients=json.loads(r["active_ingredients"]),
-                    form=r["form"],
-                    strength=r["strength"],
-                    rx_required=bool(r["rx_required"]),
-                    qty_on_hand=int(r["qty_on_hand"]),
-                )
-            )
-
-        return InventoryCheckOutput(ok=True, matches=matches, notes=None)
+        page = [StockRow(r).as_dict() for r in rows[:size]]
+        has_more = len(rows) > size
+        total = None
+        if after is None:
+            total = _count(conn, *stages[stage]) if has_more else len(page)
+
+        # one validation pass over plain dicts instead of a pydantic object per row;
+        # the last page gets a cursor too (its next page is empty) so a cut-short page can resume
+        return InventoryCheckOutput.model_validate({
+            "ok": True,
+            "matches": page,
+            "notes": None,
+            "total_count": total,
+            "has_more": has_more,
+            "next_cursor": encode_cursor(scope, _check_key(page[-1]), stage, version),
+        })
 
     except sqlite3.Error as e:
         return InventoryCheckOutput(
@@ -153,29 +269,31 @@ def inventory_check(payload: Dict[str, Any]) -> InventoryCheckOutput:
         )
 
     finally:
-        conn.close()
+        if own_conn:
+            conn.close()
 
 
 
 
-def inventory_find_equivalent(payload: Dict[str, Any]) -> InventoryFindEquivalentOutput:
+def inventory_find_equivalent(
+    payload: Dict[str, Any], conn: Optional[sqlite3.Connection] = None
+) -> InventoryFindEquivalentOutput:
     """
     Given a med_id, return equivalent options (same active ingredients, and optionally same form/strength).
     Intended for out-of-stock cases.
     """
     inp = InventoryFindEquivalentInput.model_validate(payload)
-    conn = get_conn()
+    size = page_size(inp.limit)
+    scope = scope_of("inventory_find_equivalent", inp.med_id, inp.require_same_strength, inp.require_same_form)
+    after: Optional[List[Any]] = None
+
+    own_conn = conn is None
+    if own_conn:
+        conn = get_conn()
     try:
-        req = conn.execute(
-            """
-            SELECT m.med_id,
-                   m.brand_name,
-                   m.generic_name,
-                   m.active_ingredients,
-                   m.form,
-                   m.strength,
-                   m.rx_required,
-                   i.qty_on_hand
+        row = conn.execute(
+            f"""
+            SELECT {STOCK_COLUMNS}
             FROM medications m
                      JOIN inventory i ON i.med_id = m.med_id
             WHERE m.med_id = ?
@@ -183,7 +301,7 @@ def inventory_find_equivalent(payload: Dict[str, Any]) -> InventoryFindEquivalen
             (inp.med_id,),
         ).fetchone()
 
-        if req is None:
+        if row is None:
             return InventoryFindEquivalentOutput(
                 ok=False,
                 error=ToolError(code="MED_NOT_FOUND", message="Requested med_id not found."),
@@ -191,44 +309,51 @@ def inventory_find_equivalent(payload: Dict[str, Any]) -> InventoryFindEquivalen
                 equivalents=[],
             )
 
-        requested = StockedMedication(
-            med_id=req["med_id"],
-            brand_name=req["brand_name"],
-            generic_name=req["generic_name"],
-            active_ingredients=json.loads(req["active_ingredients"]),
-            form=req["form"],
-            strength=req["strength"],
-            rx_required=bool(req["rx_required"]),
-            qty_on_hand=int(req["qty_on_hand"]),
-        )
+        req = StockRow(row)
+        requested = StockedMedication.model_validate(req.as_dict())
 
         # Build equivalence query
         clauses = ["m.active_ingredients = ?", "m.med_id != ?"]
-        params: List[Any] = [req["active_ingredients"], inp.med_id]
-
-        if inp.require_same_form:
+        params: List[Any] = [req.ingredients_raw, inp.med_id]
+
+        catalog = get_catalog() if (inp.require_same_form and inp.require_same_strength) else None
+        group_ids = catalog.equivalent_ids(inp.med_id) if catalog is not None else None
+        if group_ids is not None:
+            # strict equivalence group precomputed in the shared catalog: only stock comes from SQL
+            clauses = [f"m.med_id IN ({','.join('?' * len(group_ids))})" if group_ids else "0"]
+            params = list(group_ids)
+        elif inp.require_same_form:
             clauses.append("m.form = ?")
-            params.append(req["form"])
-        if inp.require_same_strength:
-            clauses.append("m.strength = ?")
-            params.append(req["strength"])
+            params.append(req.form)
+        if group_ids is None and inp.require_same_strength:
+            # unit-aware when the strength parsed at seed/import time ("0.2 g" == "200 mg")
+            if req.strength_value is not None:
+                lo, hi = strength_range(req.strength_value)
+                clauses.append("m.strength_unit = ? AND m.strength_value BETWEEN ? AND ?")
+                params.extend([req.strength_unit, lo, hi])
+            else:
+                clauses.append("m.strength = ?")
+                params.append(req.strength)
 
         where_sql = " AND ".join(clauses)
+        version = _result_version(conn, where_sql, params, _EQUIV_KEY_SQL)
+        if inp.cursor:
+            try:
+                _, after = decode_cursor(inp.cursor, scope, version)
+                if len(after) != 3:
+                    raise InvalidCursor("Malformed cursor.")
+            except InvalidCursor as e:
+                return InventoryFindEquivalentOutput(
+                    ok=False,
+                    error=ToolError(code="INVALID_CURSOR", message=str(e)),
+                    requested=None,
+                    equivalents=[],
+                )
 
-        rows = conn.execute(
-            f"""
-                SELECT
-                  m.med_id, m.brand_name, m.generic_name, m.active_ingredients,
-                  m.form, m.strength, m.rx_required,
-                  i.qty_on_hand
-                FROM medications m
-                JOIN inventory i ON i.med_id = m.med_id
-                WHERE {where_sql}
-                ORDER BY i.qty_on_hand DESC, m.brand_name ASC
-                """,
-            tuple(params),
-        ).fetchall()
+        rows = _fetch_page(conn, where_sql, params, _EQUIV_ORDER, _EQUIV_AFTER, after, size)
 
+        if not rows and after is not None:
+            return InventoryFindEquivalentOutput(ok=True, requested=requested, equivalents=[])
         if not rows:
             return InventoryFindEquivalentOutput(
                 ok=False,
@@ -237,34 +362,32 @@ def inventory_find_equivalent(payload: Dict[str, Any]) -> InventoryFindEquivalen
                 equivalents=[],
             )
 
-        equivalents: List[EquivalentOption] = []
-        for r in rows:
-            disclosure = EquivalentDisclosure(
-                same_active_ingredients=True,
-                same_form=(r["form"] == req["form"]),
-                same_strength=(r["strength"] == req["strength"]),
-                possible_differences=["price", "inactive ingredients", "packaging"],
-            )
-            equivalents.append(
-                EquivalentOption(
-                    med_id=r["med_id"],
-                    brand_name=r["brand_name"],
-                    generic_name=r["generic_name"],
-                    active_ingredients=json.loads(r["active_ingredients"]),
-                    form=r["form"],
-                    strength=r["strength"],
-                    rx_required=bool(r["rx_required"]),
-                    qty_on_hand=int(r["qty_on_hand"]),
-                    disclosure=disclosure,
-                )
-            )
-
-        return InventoryFindEquivalentOutput(
-            ok=True,
-            requested=requested,
-            equivalents=equivalents,
-            notes=None,
-        )
+        page = [StockRow(r) for r in rows[:size]]
+        has_more = len(rows) > size
+        total = None
+        if after is None:
+            total = _count(conn, where_sql, params) if has_more else len(page)
+
+        equivalents: List[Dict[str, Any]] = []
+        for r in page:
+            option = r.as_dict()
+            option["disclosure"] = {
+                "same_active_ingredients": True,
+                "same_form": r.form == req.form,
+                "same_strength": _same_strength(r, req),
+                "possible_differences": list(_POSSIBLE_DIFFERENCES),
+            }
+            equivalents.append(option)
+
+        return InventoryFindEquivalentOutput.model_validate({
+            "ok": True,
+            "requested": requested,
+            "equivalents": equivalents,
+            "notes": None,
+            "total_count": total,
+            "has_more": has_more,
+            "next_cursor": encode_cursor(scope, _equiv_key(equivalents[-1]), version=version),
+        })
 
     except sqlite3.Error as e:
         return InventoryFindEquivalentOutput(
@@ -275,7 +398,8 @@ def inventory_find_equivalent(payload: Dict[str, Any]) -> InventoryFindEquivalen
         )
 
     finally:
-        conn.close()
+        if own_conn:
+            conn.close()
 
 def _row_to_stocked_med(row: Any) -> Dict[str, Any]:
     # row columns must match the SELECT below
@@ -321,7 +445,7 @@ def _search_inventory_tokens(tokens: List[str]) -> List[Dict[str, Any]]:
 
     conn = get_conn()
     try:
-        conn.row_factory = __import__("sqlite3").Row
+        conn.row_factory = sqlite3.Row
         rows = conn.execute(sql, params).fetchall()
         return [_row_to_stocked_med(r) for r in rows]
     finally:
@@ -0,0 +1,80 @@
+"""
+Keyset pagination helpers for list-returning tools.
+
+A cursor is opaque to the model: base64url JSON holding a scope (which query/plan produced the
+page) and the sort key of the last row returned. The next page continues strictly after that key,
+so pages stay cheap (no OFFSET scan) and stable while rows are inserted elsewhere.
+
+When the sort key includes mutable columns (stock levels), the cursor also carries a version of the
+result set the first page was read from (a fingerprint of its rows' sort keys); a later page against a
+different version is rejected rather than silently skipping or repeating rows that moved.
+"""
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional, Sequence
+
+DEFAULT_PAGE_SIZE = 10
+# hard server-side cap, whatever limit the model asks for
+MAX_PAGE_SIZE = int(os.getenv("PHARMACY_MAX_PAGE_SIZE", "25"))
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def page_size(limit: Optional[int]) -> int:
+    return max(1, min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+
+
+def scope_of(*parts: Any) -> str:
+    """Short fingerprint of the request a cursor belongs to."""
+    raw = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+def encode_cursor(scope: str, key: Sequence[Any], stage: int = 0, version: Optional[str] = None) -> str:
+    data: Dict[str, Any] = {"s": scope, "p": stage, "k": list(key)}
+    if version is not None:
+        data["v"] = version
+    raw = json.dumps(data, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _load(cursor: str) -> Dict[str, Any]:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    if not isinstance(data, dict):
+        raise ValueError("cursor is not an object")
+    return data
+
+
+def rekey_cursor(cursor: str, key: Sequence[Any]) -> str:
+    """The same cursor (scope, stage, version) continuing after key instead."""
+    try:
+        data = _load(cursor)
+        return encode_cursor(data["s"], key, int(data["p"]), data.get("v"))
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor("Malformed cursor.") from None
+
+
+def decode_cursor(cursor: str, scope: str, version: Optional[str] = None) -> tuple[int, List[Any]]:
+    """
+    (stage, key) of a cursor issued for scope (and, if given, at result-set version); raises InvalidCursor
+    otherwise.
+    """
+    try:
+        data = _load(cursor)
+        stage, key = int(data["p"]), list(data["k"])
+        ok = data["s"] == scope
+        issued_at = data.get("v")
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor("Malformed cursor.") from None
+    if not ok:
+        raise InvalidCursor("Cursor belongs to a different query; start again without a cursor.")
+    if version is not None and issued_at != version:
+        raise InvalidCursor("Results changed since the first page; start again without a cursor.")
+    return stage, key
@@ -2,7 +2,9 @@ from __future__ import annotations
 
 import sqlite3
 from datetime import date
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+from pydantic import ValidationError
 
 from app.db.database import get_conn
 from app.tools.contracts import (
@@ -11,7 +13,104 @@ from app.tools.contracts import (
     ToolError,
 )
 
-def prescription_verify(payload: Dict[str, Any]) -> PrescriptionVerifyOutput:
+# pairs per statement in prescription_verify_many (3 bound parameters each)
+VERIFY_BATCH = 500
+
+# One row per (patient_id, med_id) in q: rx_required (NULL = no such medication), whether the patient
+# exists, and the latest prescription (by expires_at) found with one idx_rx_patient_med_expiry seek.
+_VERIFY_SQL = """
+    WITH q(i, patient_id, med_id) AS (VALUES {rows})
+    SELECT
+      q.i,
+      m.rx_required,
+      EXISTS (SELECT 1 FROM patients p WHERE p.patient_id = q.patient_id) AS patient_found,
+      rx.status,
+      rx.expires_at,
+      rx.refills_remaining
+    FROM q
+    LEFT JOIN medications m ON m.med_id = q.med_id
+    LEFT JOIN prescriptions rx ON rx.rowid = (
+      SELECT r.rowid
+      FROM prescriptions r
+      WHERE r.patient_id = q.patient_id
+        AND r.med_id = q.med_id
+      ORDER BY r.expires_at DESC LIMIT 1
+    )
+"""
+
+
+def _verify_sql(n: int) -> str:
+    return _VERIFY_SQL.format(rows=",".join(["(?,?,?)"] * n))
+
+
+_VERIFY_ONE_SQL = _verify_sql(1)
+
+
+def _verdict(inp: PrescriptionVerifyInput, row: sqlite3.Row, today: str) -> PrescriptionVerifyOutput:
+    # check medication exists
+    if row["rx_required"] is None:
+        return PrescriptionVerifyOutput(
+            ok=False,
+            error=ToolError(code="MED_NOT_FOUND", message="Medication not found."),
+            patient_found=True,
+        )
+
+    # check prescription requirements
+    if not row["rx_required"]:
+        return PrescriptionVerifyOutput(
+            ok=True,
+            rx_required=False,
+            patient_found=True,
+            has_valid_rx=None,
+            next_step="allow_refill_request",
+            notes="No prescription required for this medication.",
+        )
+
+    # check patient exists
+    if not row["patient_found"]:
+        return PrescriptionVerifyOutput(
+            ok=False,
+            error=ToolError(code="PATIENT_NOT_FOUND", message="Patient not found."),
+            patient_found=False,
+        )
+
+    # has no prescription
+    if row["status"] is None:
+        return PrescriptionVerifyOutput(
+            ok=True,
+            rx_required=True,
+            patient_found=True,
+            has_valid_rx=False,
+            rx_status=None,
+            expires_at=None,
+            refills_remaining=None,
+            next_step="cannot_proceed",
+            notes="No prescription on file.",
+        )
+
+    # has prescription
+    status = row["status"]
+    expires_at = row["expires_at"]
+    refills_remaining = int(row["refills_remaining"])
+
+    valid = (status == "active") and (expires_at >= today)
+    if inp.intent == "refill":
+        valid = valid and (refills_remaining > 0)
+
+    return PrescriptionVerifyOutput(
+        ok=True,
+        rx_required=True,
+        patient_found=True,
+        has_valid_rx=bool(valid),
+        rx_status=status,
+        expires_at=expires_at,
+        refills_remaining=refills_remaining,
+        next_step="allow_refill_request" if valid else "cannot_proceed",
+        notes=None,
+    )
+
+
+def prescription_verify(payload: Dict[str, Any], conn: Optional[sqlite3.Connection] = None) -> PrescriptionVerifyOutput:
     """
     Verify if a prescription is required and whether the patient has a valid prescription.
     - patient must exist in the database
@@ -21,100 +120,76 @@ def prescription_verify(payload: Dict[str, Any]) -> PrescriptionVerifyOutput:
         status must be 'active'
         expires_at >= today
         if intent == 'refill': refills_remaining > 0
+    Medication, patient and latest prescription are read in one query.
     """
     inp = PrescriptionVerifyInput.model_validate(payload)
     today = date.today().isoformat()
 
-    conn = get_conn()
+    own_conn = conn is None
+    if own_conn:
+        conn = get_conn()
     try:
-        # check medication exists
-        m = conn.execute(
-            "SELECT rx_required FROM medications WHERE med_id = ?",
-            (inp.med_id,),
-        ).fetchone()
-        if m is None:
-            return PrescriptionVerifyOutput(
-                ok=False,
-                error=ToolError(code="MED_NOT_FOUND", message="Medication not found."),
-                patient_found=True,
-            )
-
-        # check prescription requirements
-        rx_required = bool(m["rx_required"])
-        if not rx_required:
-            return PrescriptionVerifyOutput(
-                ok=True,
-                rx_required=False,
-                patient_found=True,
-                has_valid_rx=None,
-                next_step="allow_refill_request",
-                notes="No prescription required for this medication.",
-            )
+        row = conn.execute(_VERIFY_ONE_SQL, (0, inp.patient_id, inp.med_id)).fetchone()
+        return _verdict(inp, row, today)
 
-        # check patient exists
-        p = conn.execute(
-            "SELECT 1 FROM patients WHERE patient_id = ?",
-            (inp.patient_id,),
-        ).fetchone()
-        if p is None:
-            return PrescriptionVerifyOutput(
-                ok=False,
-                error=ToolError(code="PATIENT_NOT_FOUND", message="Patient not found."),
-                patient_found=False,
-            )
+    except sqlite3.Error as e:
+        return PrescriptionVerifyOutput(
+        ok=False,
+        error=ToolError(code="DB_ERROR", message=str(e)),
+        )
 
-        # if prescription required look up prescriptions
-        rx = conn.execute(
-            """
-            SELECT status, expires_at, refills_remaining
-            FROM prescriptions
-            WHERE patient_id = ?
-              AND med_id = ?
-            ORDER BY expires_at DESC LIMIT 1
-            """,
-            (inp.patient_id, inp.med_id),
-        ).fetchone()
-
-        # has no prescription
-        if rx is None:
-            return PrescriptionVerifyOutput(
-                ok=True,
-                rx_required=True,
-                patient_found=True,
-                has_valid_rx=False,
-                rx_status=None,
-                expires_at=None,
-                refills_remaining=None,
-                next_step="cannot_proceed",
-                notes="No prescription on file.",
-            )
+    finally:
+        if own_conn:
+            conn.close()
 
-        # has prescription
-        status = rx["status"]
-        expires_at = rx["expires_at"]
-        refills_remaining = int(rx["refills_remaining"])
 
-        valid = (status == "active") and (expires_at >= today)
-        if inp.intent == "refill":
-            valid = valid and (refills_remaining > 0)
+def prescription_verify_many(
+    payloads: Sequence[Dict[str, Any]], conn: Optional[sqlite3.Connection] = None
+) -> List[PrescriptionVerifyOutput]:
+    """
+    prescription_verify for many (patient_id, med_id, intent) items, e.g. back-office reconciliation.
+    - results are in input order, each exactly what prescription_verify returns for that item
+    - an invalid item gets an INVALID_TOOL_ARGS result; the others are still verified
+    - VERIFY_BATCH pairs per query, all read from one snapshot (single read transaction)
+    """
+    today = date.today().isoformat()
+    results: List[Optional[PrescriptionVerifyOutput]] = [None] * len(payloads)
+    valid: List[Tuple[int, PrescriptionVerifyInput]] = []
+    for i, payload in enumerate(payloads):
+        try:
+            valid.append((i, PrescriptionVerifyInput.model_validate(payload)))
+        except ValidationError as e:
+            results[i] = PrescriptionVerifyOutput(
+                ok=False,
+                error=ToolError(code="INVALID_TOOL_ARGS", message=str(e)),
+            )
 
-        return PrescriptionVerifyOutput(
-            ok=True,
-            rx_required=True,
-            patient_found=True,
-            has_valid_rx=bool(valid),
-            rx_status=status,
-            expires_at=expires_at,
-            refills_remaining=refills_remaining,
-            next_step="allow_refill_request" if valid else "cannot_proceed",
-            notes=None,
-        )
+    own_conn = conn is None
+    if own_conn:
+        conn = get_conn()
+    began = False
+    try:
+        if not conn.in_transaction:
+            conn.execute("BEGIN")
+            began = True
+        for start in range(0, len(valid), VERIFY_BATCH):
+            chunk = valid[start:start + VERIFY_BATCH]
+            params = [v for i, inp in chunk for v in (i, inp.patient_id, inp.med_id)]
+            sql = _VERIFY_ONE_SQL if len(chunk) == 1 else _verify_sql(len(chunk))
+            inputs = dict(chunk)
+            for row in conn.execute(sql, params).fetchall():
+                results[row["i"]] = _verdict(inputs[row["i"]], row, today)
 
     except sqlite3.Error as e:
-        return PrescriptionVerifyOutput(
-        ok=False,
-        error=ToolError(code="DB_ERROR", message=str(e)),
-        )
+        for i, _ in valid:
+            results[i] = PrescriptionVerifyOutput(
+                ok=False,
+                error=ToolError(code="DB_ERROR", message=str(e)),
+            )
 
     finally:
-        conn.close()
\ No newline at end of file
+        if began:
+            conn.rollback()  # read-only: just ends the snapshot
+        if own_conn:
+            conn.close()
+    return results  # type: ignore[return-value]
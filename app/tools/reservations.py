@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import sqlite3
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from app.db.database import get_conn, run_write
+from app.tools.contracts import (
+    InventoryReserveInput,
+    ReservationActionInput,
+    ReservationOutput,
+    ToolError,
+)
+
+# Units held by active, unexpired reservations for inventory row `i`.
+# Used by every stock read so available = on_hand - held, without a sweeper having run.
+ACTIVE_HELD_SQL = """
+    (SELECT COALESCE(SUM(r.qty), 0)
+     FROM inventory_reservations r
+     WHERE r.med_id = i.med_id
+       AND r.status = 'active'
+       AND r.expires_at > CAST(strftime('%s','now') AS REAL))
+"""
+
+AVAILABLE_SQL = f"MAX(i.qty_on_hand - {ACTIVE_HELD_SQL}, 0)"
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).replace(microsecond=0).isoformat()
+
+
+def _available(conn: sqlite3.Connection, med_id: str) -> Optional[int]:
+    row = conn.execute(
+        f"SELECT {AVAILABLE_SQL} AS qty_available FROM inventory i WHERE i.med_id = ?",
+        (med_id,),
+    ).fetchone()
+    return None if row is None else int(row["qty_available"])
+
+
+def _expire(conn: sqlite3.Connection, now: float, med_id: Optional[str] = None) -> int:
+    sql = "UPDATE inventory_reservations SET status = 'expired' WHERE status = 'active' AND expires_at <= ?"
+    params: list[Any] = [now]
+    if med_id is not None:
+        sql += " AND med_id = ?"
+        params.append(med_id)
+    return conn.execute(sql, params).rowcount
+
+
+def _output(row: Any, qty_available: Optional[int]) -> ReservationOutput:
+    return ReservationOutput(
+        ok=True,
+        reservation_id=row["reservation_id"],
+        med_id=row["med_id"],
+        qty=int(row["qty"]),
+        status=row["status"],
+        expires_at=_iso(row["expires_at"]),
+        qty_available=qty_available,
+    )
+
+
+def inventory_reserve(payload: Dict[str, Any]) -> ReservationOutput:
+    """
+    Hold qty units of med_id for ttl_seconds.
+    - runs in one BEGIN IMMEDIATE transaction: the availability check and the insert cannot interleave
+      with another writer, so concurrent reservations never oversell
+    - stale holds for this med are marked expired first (they already don't count toward availability)
+    """
+    inp = InventoryReserveInput.model_validate(payload)
+
+    def _tx(conn: sqlite3.Connection) -> ReservationOutput:
+        now = time.time()
+        _expire(conn, now, inp.med_id)
+
+        available = _available(conn, inp.med_id)
+        if available is None:
+            return ReservationOutput(
+                ok=False,
+                error=ToolError(code="MED_NOT_FOUND", message="Medication not stocked."),
+                med_id=inp.med_id,
+            )
+        if available < inp.qty:
+            return ReservationOutput(
+                ok=False,
+                error=ToolError(
+                    code="INSUFFICIENT_STOCK",
+                    message=f"Requested {inp.qty}, only {available} available.",
+                ),
+                med_id=inp.med_id,
+                qty_available=available,
+            )
+
+        reservation_id = f"RES{uuid.uuid4().hex[:12].upper()}"
+        conn.execute(
+            """
+            INSERT INTO inventory_reservations(reservation_id, med_id, qty, status, created_at, expires_at)
+            VALUES (?,?,?,'active',?,?)
+            """,
+            (reservation_id, inp.med_id, inp.qty, now, now + inp.ttl_seconds),
+        )
+        return ReservationOutput(
+            ok=True,
+            reservation_id=reservation_id,
+            med_id=inp.med_id,
+            qty=inp.qty,
+            status="active",
+            expires_at=_iso(now + inp.ttl_seconds),
+            qty_available=available - inp.qty,
+        )
+
+    try:
+        return run_write(_tx)
+    except sqlite3.Error as e:
+        return ReservationOutput(ok=False, error=ToolError(code="DB_ERROR", message=str(e)))
+
+
+def _finish(payload: Dict[str, Any], *, commit: bool) -> ReservationOutput:
+    inp = ReservationActionInput.model_validate(payload)
+
+    def _tx(conn: sqlite3.Connection) -> ReservationOutput:
+        now = time.time()
+        row = conn.execute(
+            "SELECT * FROM inventory_reservations WHERE reservation_id = ?",
+            (inp.reservation_id,),
+        ).fetchone()
+        if row is None:
+            return ReservationOutput(
+                ok=False,
+                error=ToolError(code="RESERVATION_NOT_FOUND", message="Reservation not found."),
+                reservation_id=inp.reservation_id,
+            )
+
+        status = row["status"]
+        if status == "active" and row["expires_at"] <= now:
+            _expire(conn, now, row["med_id"])
+            status = "expired"
+        if status != "active":
+            return ReservationOutput(
+                ok=False,
+                error=ToolError(code="RESERVATION_NOT_ACTIVE", message=f"Reservation is {status}."),
+                reservation_id=inp.reservation_id,
+                med_id=row["med_id"],
+                qty=int(row["qty"]),
+                status=status,
+                expires_at=_iso(row["expires_at"]),
+            )
+
+        if commit:
+            # the hold guaranteed on_hand >= qty; the CHECK constraint backs that up
+            conn.execute(
+                "UPDATE inventory SET qty_on_hand = qty_on_hand - ? WHERE med_id = ?",
+                (int(row["qty"]), row["med_id"]),
+            )
+        conn.execute(
+            "UPDATE inventory_reservations SET status = ? WHERE reservation_id = ?",
+            ("committed" if commit else "released", inp.reservation_id),
+        )
+        row = conn.execute(
+            "SELECT * FROM inventory_reservations WHERE reservation_id = ?",
+            (inp.reservation_id,),
+        ).fetchone()
+        return _output(row, _available(conn, row["med_id"]))
+
+    try:
+        return run_write(_tx)
+    except sqlite3.Error as e:
+        return ReservationOutput(ok=False, error=ToolError(code="DB_ERROR", message=str(e)))
+
+
+def inventory_release(payload: Dict[str, Any]) -> ReservationOutput:
+    """Give back an active hold (e.g. the conversation ended without a refill)."""
+    return _finish(payload, commit=False)
+
+
+def inventory_commit(payload: Dict[str, Any]) -> ReservationOutput:
+    """Turn an active hold into a real stock decrement."""
+    return _finish(payload, commit=True)
+
+
+def expire_reservations() -> int:
+    """Mark every lapsed hold as expired; returns how many were swept. Safe to run from a timer."""
+    return run_write(lambda conn: _expire(conn, time.time()))
+
+
+def next_expiry() -> Optional[float]:
+    """
+    When the earliest active hold lapses (None if none will). qty_available goes up at that moment
+    without any write, so the data version does not change: a stock result is only good until then.
+    """
+    conn = get_conn()
+    try:
+        row = conn.execute(
+            "SELECT MIN(expires_at) FROM inventory_reservations WHERE status = 'active' AND expires_at > ?",
+            (time.time(),),
+        ).fetchone()
+    finally:
+        conn.close()
+    return row[0]
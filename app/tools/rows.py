@@ -0,0 +1,80 @@
+"""
+Compact internal row type for catalog/stock queries.
+
+Tools keep matches as StockRow records (__slots__, shared ingredient lists, interned repeated
+strings) while filtering and ordering, and only turn the survivors into contract data at the
+boundary: one validation pass over plain dicts instead of one pydantic object per SQL row.
+"""
+from __future__ import annotations
+
+import json
+import sys
+from typing import Any, Dict, List, Optional, Sequence
+
+from app.tools.reservations import AVAILABLE_SQL
+
+# SELECT list matching StockRow.from_row (positional)
+STOCK_COLUMNS = f"""
+    m.med_id, m.brand_name, m.generic_name, m.active_ingredients,
+    m.form, m.strength, m.strength_value, m.strength_unit, m.rx_required,
+    i.qty_on_hand, {AVAILABLE_SQL} AS qty_available
+"""
+
+# a catalog has few distinct ingredient sets, forms and strengths: share one object per value
+_INGREDIENTS: Dict[str, List[str]] = {}
+_STRINGS: Dict[str, str] = {}
+_CACHE_MAX = 50_000
+
+
+def _ingredients(raw: str) -> List[str]:
+    hit = _INGREDIENTS.get(raw)
+    if hit is None:
+        hit = [sys.intern(x) for x in json.loads(raw)]
+        if len(_INGREDIENTS) < _CACHE_MAX:
+            _INGREDIENTS[raw] = hit
+    return hit
+
+
+def _shared(s: Optional[str]) -> Optional[str]:
+    if s is None:
+        return None
+    hit = _STRINGS.get(s)
+    if hit is None:
+        hit = sys.intern(s)
+        if len(_STRINGS) < _CACHE_MAX:
+            _STRINGS[hit] = hit
+    return hit
+
+
+class StockRow:
+    """One medications+inventory row. Treat active_ingredients as read-only (it is shared)."""
+
+    __slots__ = (
+        "med_id", "brand_name", "generic_name", "ingredients_raw", "active_ingredients",
+        "form", "strength", "strength_value", "strength_unit", "rx_required",
+        "qty_on_hand", "qty_available",
+    )
+
+    def __init__(self, row: Sequence[Any]) -> None:
+        (self.med_id, self.brand_name, generic, self.ingredients_raw, form, strength,
+         self.strength_value, unit, rx, self.qty_on_hand, self.qty_available) = row
+        self.generic_name = _shared(generic)
+        self.active_ingredients = _ingredients(self.ingredients_raw)
+        self.form = _shared(form)
+        self.strength = _shared(strength)
+        self.strength_unit = _shared(unit)
+        self.rx_required = bool(rx)
+
+    def as_dict(self) -> Dict[str, Any]:
+        """StockedMedication-shaped dict (validated by the caller's output model)."""
+        return {
+            "med_id": self.med_id,
+            "brand_name": self.brand_name,
+            "generic_name": self.generic_name,
+            "active_ingredients": self.active_ingredients,
+            "form": self.form,
+            "strength": self.strength,
+            "rx_required": self.rx_required,
+            "qty_on_hand": self.qty_on_hand,
+            "qty_available": self.qty_available,
+        }
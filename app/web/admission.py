@@ -0,0 +1,135 @@
+"""
+Admission control for /chat turns (per worker process).
+
+    - at most max_active turns stream at once
+    - up to max_queue more wait, each for at most timeout_s; a client can hold max_per_client queue slots
+    - freed slots go round-robin across clients, so one busy client can't starve the others
+    - anything beyond that is rejected immediately (503 + Retry-After) instead of slowing everyone down
+"""
+from __future__ import annotations
+
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict
+
+
+class Overloaded(Exception):
+    def __init__(self, reason: str, retry_after_s: int) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after_s = retry_after_s
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_active: int = 8,
+        max_queue: int = 32,
+        timeout_s: float = 10.0,
+        max_per_client: int = 4,
+    ) -> None:
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.timeout_s = timeout_s
+        self.max_per_client = max_per_client
+
+        self.active = 0
+        self.waiting = 0
+        self._queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.max_waiting_seen = 0
+        self._turn_s_ewma = 5.0  # typical turn duration, for Retry-After
+        self._wait_s_ewma = 0.0
+
+    def _retry_after(self) -> int:
+        backlog = (self.waiting + 1) / max(self.max_active, 1)
+        return max(1, min(60, math.ceil(self._turn_s_ewma * backlog)))
+
+    async def acquire(self, client_id: str) -> float:
+        """Wait for a turn slot; returns seconds spent queued. Raises Overloaded."""
+        if self.active < self.max_active and self.waiting == 0:
+            self.active += 1
+            self.admitted += 1
+            return 0.0
+        queue = self._queues.get(client_id)
+        if self.waiting >= self.max_queue or (queue is not None and len(queue) >= self.max_per_client):
+            self.rejected += 1
+            raise Overloaded("queue full", self._retry_after())
+
+        fut: asyncio.Future = asyncio.get_running_loop().create_future()
+        if queue is None:
+            queue = self._queues[client_id] = deque()
+        queue.append(fut)
+        self.waiting += 1
+        self.max_waiting_seen = max(self.max_waiting_seen, self.waiting)
+        t0 = time.monotonic()
+        try:
+            await asyncio.wait_for(fut, self.timeout_s)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if fut.done() and not fut.cancelled():
+                self.release()  # granted just as we gave up: pass it on
+            else:
+                self._forget(client_id, fut)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.timed_out += 1
+            raise Overloaded("queue timeout", self._retry_after()) from None
+        waited = time.monotonic() - t0
+        self._wait_s_ewma = 0.8 * self._wait_s_ewma + 0.2 * waited
+        self.admitted += 1
+        return waited
+
+    def _forget(self, client_id: str, fut: asyncio.Future) -> None:
+        queue = self._queues.get(client_id)
+        if queue is not None and fut in queue:
+            queue.remove(fut)
+            self.waiting -= 1
+            if not queue:
+                del self._queues[client_id]
+
+    def release(self, turn_s: float = 0.0) -> None:
+        """A turn finished (or its client went away): hand the slot to the next client in line."""
+        if turn_s > 0:
+            self._turn_s_ewma = 0.8 * self._turn_s_ewma + 0.2 * turn_s
+        while self._queues:
+            client_id, queue = next(iter(self._queues.items()))
+            fut = queue.popleft()
+            self.waiting -= 1
+            if queue:
+                self._queues.move_to_end(client_id)  # round-robin: this client goes to the back
+            else:
+                del self._queues[client_id]
+            if not fut.done():
+                fut.set_result(None)  # slot transferred; active count unchanged
+                return
+        self.active -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "waiting_clients": len(self._queues),
+            "max_active": self.max_active,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "max_waiting_seen": self.max_waiting_seen,
+            "avg_queue_wait_ms": round(self._wait_s_ewma * 1000, 1),
+            "avg_turn_s": round(self._turn_s_ewma, 2),
+        }
+
+
+def controller_from_env() -> AdmissionController:
+    return AdmissionController(
+        max_active=int(os.getenv("MAX_CONCURRENT_TURNS", "8")),
+        max_queue=int(os.getenv("MAX_QUEUED_TURNS", "32")),
+        timeout_s=float(os.getenv("ADMISSION_TIMEOUT_S", "10")),
+        max_per_client=int(os.getenv("MAX_QUEUED_PER_CLIENT", "4")),
+    )
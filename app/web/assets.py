@@ -0,0 +1,152 @@
+"""
+In-memory static assets: loaded once, precompressed, fingerprinted.
+
+    - every file under the static dir is read at startup with gzip (and brotli, if the optional
+      `brotli` package is installed) variants computed once; variants that don't shrink are skipped
+    - /static/<name>.<hash>.<ext> URLs are immutable (cached for a year); references to /static/<name>
+      in the index page are rewritten to them
+    - the index itself is revalidated (ETag / If-None-Match -> 304), so repeat loads cost one
+      round trip and no body
+    - dev_reload=True re-reads a file when its mtime changes (STATIC_DEV_RELOAD=1)
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+try:  # optional: brotli beats gzip on text, but the image does not require it
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = Path("app/web/static")
+INDEX_NAME = "index.html"
+STATIC_DEV_RELOAD = os.getenv("STATIC_DEV_RELOAD", "0") == "1"
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+_COMPRESSIBLE = ("text/", "application/javascript", "application/json", "image/svg+xml")
+_MIN_COMPRESS_BYTES = 256
+_FINGERPRINT_RE = re.compile(r"^(?P<stem>.+)\.(?P<hash>[0-9a-f]{10})(?P<ext>\.[^.]+)$")
+
+
+@dataclass
+class Asset:
+    name: str
+    media_type: str
+    etag: str
+    digest: str
+    mtime: float
+    bodies: Dict[str, bytes] = field(default_factory=dict)  # encoding ("identity", "gzip", "br") -> bytes
+
+    @property
+    def fingerprinted_name(self) -> str:
+        stem, ext = os.path.splitext(self.name)
+        return f"{stem}.{self.digest}{ext}"
+
+
+def _build(name: str, body: bytes, mtime: float) -> Asset:
+    media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    if media_type.startswith("text/"):
+        media_type += "; charset=utf-8"
+    digest = hashlib.sha256(body).hexdigest()[:10]
+    # weak: the same tag covers every encoding of the content
+    asset = Asset(name=name, media_type=media_type, etag=f'W/"{digest}"', digest=digest, mtime=mtime)
+    asset.bodies["identity"] = body
+    if len(body) >= _MIN_COMPRESS_BYTES and media_type.startswith(_COMPRESSIBLE):
+        gz = gzip.compress(body, compresslevel=9, mtime=0)
+        if len(gz) < len(body):
+            asset.bodies["gzip"] = gz
+        if brotli is not None:
+            br = brotli.compress(body, quality=11)
+            if len(br) < len(body):
+                asset.bodies["br"] = br
+    return asset
+
+
+def _pick_encoding(asset: Asset, accept_encoding: str) -> str:
+    accepted = {part.split(";")[0].strip().lower() for part in accept_encoding.split(",")}
+    for enc in ("br", "gzip"):
+        if enc in asset.bodies and enc in accepted:
+            return enc
+    return "identity"
+
+
+class AssetStore:
+    def __init__(self, root: Path = STATIC_DIR, dev_reload: bool = STATIC_DEV_RELOAD) -> None:
+        self.root = Path(root)
+        self.dev_reload = dev_reload
+        self._assets: Dict[str, Asset] = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self) -> None:
+        assets: Dict[str, Asset] = {}
+        for path in sorted(self.root.rglob("*")):
+            if path.is_file():
+                name = path.relative_to(self.root).as_posix()
+                assets[name] = _build(name, path.read_bytes(), path.stat().st_mtime)
+        index = assets.get(INDEX_NAME)
+        if index is not None:
+            assets[INDEX_NAME] = self._with_fingerprinted_links(index, assets)
+        with self._lock:
+            self._assets = assets
+
+    def _with_fingerprinted_links(self, index: Asset, assets: Dict[str, Asset]) -> Asset:
+        html = index.bodies["identity"].decode("utf-8")
+        for name, asset in assets.items():
+            if name != INDEX_NAME:
+                html = html.replace(f"/static/{name}", f"/static/{asset.fingerprinted_name}")
+        return _build(INDEX_NAME, html.encode("utf-8"), index.mtime)
+
+    def _maybe_reload(self, asset: Optional[Asset]) -> None:
+        if not self.dev_reload:
+            return
+        try:
+            changed = asset is None or (self.root / asset.name).stat().st_mtime != asset.mtime
+        except FileNotFoundError:
+            changed = True
+        if changed:
+            self.load()
+
+    def lookup(self, name: str) -> Tuple[Optional[Asset], bool]:
+        """(asset, immutable): a fingerprinted name only matches the current content hash."""
+        asset = self._assets.get(name)
+        self._maybe_reload(asset)
+        asset = self._assets.get(name)
+        if asset is not None:
+            return asset, False
+        m = _FINGERPRINT_RE.match(name)
+        if m:
+            asset = self._assets.get(m["stem"] + m["ext"])
+            if asset is not None and asset.digest == m["hash"]:
+                return asset, True
+        return None, False
+
+    def response(self, request: Request, name: str) -> Response:
+        asset, immutable = self.lookup(name)
+        if asset is None:
+            return Response(status_code=404)
+        headers = {
+            "ETag": asset.etag,
+            "Cache-Control": IMMUTABLE if immutable else REVALIDATE,
+            "Vary": "Accept-Encoding",
+        }
+        inm = request.headers.get("if-none-match", "")
+        if asset.etag in {t.strip() for t in inm.split(",")} or inm.strip() == "*":
+            return Response(status_code=304, headers=headers)
+        encoding = _pick_encoding(asset, request.headers.get("accept-encoding", ""))
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(asset.bodies[encoding], media_type=asset.media_type, headers=headers)
@@ -0,0 +1,71 @@
+"""
+Liveness and readiness probes for orchestrated deployments.
+
+    - /healthz (liveness): the process is up and its event loop answers. No I/O, so a DB outage
+      marks workers unready instead of getting them restarted in a loop.
+    - /readyz (readiness): this worker should get traffic. Required: warm-up finished, the model
+      client was built, the DB answers a cheap query in time, the admission queue isn't full.
+      Catalog age, connection pool use and in-flight turns are reported alongside.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import sqlite3
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from app.db.catalog import get_catalog
+from app.tools.aio import DB_POOL, run_db
+from app.web.admission import AdmissionController
+
+READY_DB_TIMEOUT_S = float(os.getenv("READY_DB_TIMEOUT_S", "1.0"))
+
+
+def _ping(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT count(*) FROM medications").fetchone()[0]
+
+
+async def check_db() -> Dict[str, Any]:
+    """Cheap query on the DB executor + pool, i.e. the path tool calls take."""
+    t0 = time.perf_counter()
+    try:
+        meds = await asyncio.wait_for(run_db(_ping), READY_DB_TIMEOUT_S)
+    except asyncio.TimeoutError:
+        return {"ok": False, "error": f"no answer within {READY_DB_TIMEOUT_S}s"}
+    except sqlite3.Error as e:
+        return {"ok": False, "error": str(e)}
+    return {"ok": True, "ms": round((time.perf_counter() - t0) * 1000, 1), "medications": meds}
+
+
+def check_catalog() -> Dict[str, Any]:
+    catalog = get_catalog()
+    if catalog is None:
+        return {"loaded": False}  # not exported or stale: tools read SQLite instead
+    return {"loaded": True, "age_s": round(catalog.age_s, 1)}
+
+
+async def readiness(warmup: Optional[Dict[str, Any]], admission: AdmissionController) -> Tuple[bool, Dict[str, Any]]:
+    """(ready, report) for /readyz."""
+    turns = admission.stats()
+    pool = DB_POOL.stats()
+    report: Dict[str, Any] = {
+        "warmup": {"done": warmup is not None, **(warmup or {})},
+        "db": await check_db(),
+        "catalog": await asyncio.to_thread(check_catalog),
+        "pool": {**pool, "saturated": pool["in_use"] >= pool["size"]},
+        "turns": {k: turns[k] for k in ("active", "waiting", "max_active", "max_queue")},
+    }
+    reasons = []
+    if warmup is None:
+        reasons.append("warming up")
+    elif "model_client" in warmup["failed"]:
+        reasons.append("model client unavailable")
+    if not report["db"]["ok"]:
+        reasons.append("database unreachable")
+    if turns["active"] >= turns["max_active"] and turns["waiting"] >= turns["max_queue"]:
+        reasons.append("admission queue full")
+    report["ready"] = not reasons
+    if reasons:
+        report["reasons"] = reasons
+    return not reasons, report
@@ -0,0 +1,37 @@
+"""
+Multi-worker entry point.
+
+    python -m app.web.launcher --workers 4 --host 0.0.0.0 --port 8000
+
+Exports the catalog snapshot once in the parent (app/db/catalog.py), then starts N uvicorn worker
+processes. Every worker mmaps the same read-only file, so catalog memory is shared through the OS
+page cache instead of being duplicated per worker; only SQLite connections and per-process state
+grow with the worker count.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+
+import uvicorn
+
+from app.db.catalog import CATALOG_PATH, export_catalog
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the pharmacy agent with N worker processes.")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    path = export_catalog(CATALOG_PATH)
+    # workers are spawned fresh and re-read the environment
+    os.environ["PHARMACY_CATALOG_PATH"] = str(path.resolve())
+    print(f"Catalog exported: {path} ({path.stat().st_size} bytes); starting {args.workers} worker(s)")
+
+    uvicorn.run("app.web.server:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+Rate limits: token buckets per (scope, identity).
+
+    scopes    "route:/chat"       per client (peer address; X-Forwarded-For only via TRUSTED_PROXIES), checked
+                                  before admission
+              "route:/prescriptions/verify"
+                                  per client, one token per item in a bulk request
+              "tool:<tool_name>"  per client, checked before each tool call in a turn
+              "patient"           per patient_id in tool arguments, across tools and clients
+    spec      RATE_LIMITS="route:/chat=20/60,route:/prescriptions/verify=20000/3600,patient=30/60"
+              (<scope>=<burst>/<seconds>: up to burst at once, refilled at burst/seconds per second;
+              RATE_LIMITS=off disables)
+    backends  memory (default): per worker process, shared by every task and thread in it
+              sqlite (RATE_LIMIT_BACKEND=sqlite, RATE_LIMIT_DB=path): one bucket table shared by all
+              workers on the host; if it can't be reached the request is let through (fail open)
+
+Throttled /chat requests get 429 + Retry-After; a throttled tool call returns a RATE_LIMITED error
+envelope to the model instead of running. GET /stats/ratelimit shows the counters.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("pharmacy_agent.web")
+
+DEFAULT_LIMITS = "route:/chat=20/60,route:/prescriptions/verify=20000/3600,patient=30/60"
+MAX_MEMORY_BUCKETS = 10_000
+# a bucket idle this long has refilled (any sane limit), so forgetting it changes nothing
+IDLE_BUCKET_S = 3600.0
+SQLITE_PRUNE_EVERY_S = 60.0
+
+
+@dataclass(frozen=True)
+class Limit:
+    burst: float
+    per_s: float  # refill rate, tokens per second
+
+
+class Throttled(Exception):
+    def __init__(self, scope: str, retry_after_s: int) -> None:
+        super().__init__(scope)
+        self.scope = scope
+        self.retry_after_s = retry_after_s
+
+
+def parse_limits(spec: str) -> Dict[str, Limit]:
+    """"route:/chat=20/60,patient=30/60" -> {"route:/chat": Limit(20, 1/3), ...}"""
+    limits: Dict[str, Limit] = {}
+    if spec.strip().lower() == "off":
+        return limits
+    for part in spec.split(","):
+        if "=" not in part:
+            continue
+        scope, rate = part.rsplit("=", 1)
+        burst, seconds = rate.split("/")
+        limits[scope.strip()] = Limit(burst=float(burst), per_s=float(burst) / float(seconds))
+    return limits
+
+
+def _take(tokens: float, updated: float, now: float, limit: Limit, cost: float = 1.0) -> Tuple[float, float]:
+    """
+    Refill, then take cost tokens. Returns (tokens left, seconds to wait; 0 = allowed).
+    A negative cost gives tokens back (a refund), never above the burst.
+    """
+    tokens = min(limit.burst, tokens + max(0.0, now - updated) * limit.per_s)
+    if tokens >= cost:
+        return min(limit.burst, tokens - cost), 0.0
+    return tokens, (cost - tokens) / limit.per_s
+
+
+##################### backends #####################
+class MemoryBuckets:
+    blocking = False
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+        self.clock = clock
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()  # tool calls run in threadpool threads
+
+    def take(self, key: str, limit: Limit, cost: float = 1.0) -> float:
+        now = self.clock()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (limit.burst, now))
+            tokens, wait = _take(tokens, updated, now, limit, cost)
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > MAX_MEMORY_BUCKETS:
+                self._prune(now)
+        return wait
+
+    def peek(self, key: str, limit: Limit) -> float:
+        """Tokens key's bucket holds now; takes nothing."""
+        now = self.clock()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (limit.burst, now))
+        return _take(tokens, updated, now, limit, 0.0)[0]
+
+    def _prune(self, now: float, idle_s: float = IDLE_BUCKET_S) -> None:
+        stale = [k for k, (_, updated) in self._buckets.items() if now - updated > idle_s]
+        for k in stale:
+            del self._buckets[k]
+
+
+class SQLiteBuckets:
+    blocking = True
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS rate_buckets (
+      key     TEXT PRIMARY KEY,
+      tokens  REAL NOT NULL,
+      updated REAL NOT NULL
+    ) WITHOUT ROWID
+    """
+
+    def __init__(self, path: Path, clock: Callable[[], float] = time.time, busy_timeout_s: float = 0.5) -> None:
+        self.clock = clock  # wall clock: buckets are shared across processes
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=busy_timeout_s, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL;")
+        self._conn.execute("PRAGMA synchronous = NORMAL;")
+        self._conn.execute(self._SCHEMA)
+        self._lock = threading.Lock()
+        self._pruned_at = 0.0
+
+    def take(self, key: str, limit: Limit, cost: float = 1.0) -> float:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")  # serializes read-modify-write across workers
+            try:
+                now = self.clock()
+                row = self._conn.execute("SELECT tokens, updated FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+                tokens, updated = row or (limit.burst, now)
+                tokens, wait = _take(tokens, updated, now, limit, cost)
+                self._conn.execute(
+                    "INSERT INTO rate_buckets (key, tokens, updated) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                    (key, tokens, now),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            if now - self._pruned_at > SQLITE_PRUNE_EVERY_S:
+                self._prune(now)
+        return wait
+
+    def peek(self, key: str, limit: Limit) -> float:
+        """Tokens key's bucket holds now; takes nothing (and writes nothing)."""
+        with self._lock:
+            now = self.clock()
+            row = self._conn.execute("SELECT tokens, updated FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+        tokens, updated = row or (limit.burst, now)
+        return _take(tokens, updated, now, limit, 0.0)[0]
+
+    def _prune(self, now: float, idle_s: float = IDLE_BUCKET_S) -> None:
+        # one key per client and patient ever seen: without this the table only grows
+        self._pruned_at = now
+        self._conn.execute("DELETE FROM rate_buckets WHERE updated < ?", (now - idle_s,))
+
+
+##################### limiter #####################
+class RateLimiter:
+    def __init__(self, limits: Dict[str, Limit], backend: Any = None) -> None:
+        self.limits = limits
+        self.backend = backend if backend is not None else MemoryBuckets()
+        self.allowed: Counter = Counter()
+        self.throttled: Counter = Counter()
+        self.backend_errors = 0
+
+    def check(self, scope: str, identity: str, cost: float = 1.0) -> None:
+        """
+        Take cost tokens from scope's bucket for identity. Raises Throttled; no limit for scope -> no-op.
+        A cost above the burst can never be met: keep requests within max_cost(scope).
+        """
+        limit = self.limits.get(scope)
+        if limit is None or not identity:
+            return
+        try:
+            wait = self.backend.take(f"{scope}|{identity}", limit, cost)
+        except sqlite3.Error as e:
+            self.backend_errors += 1
+            logger.warning("Rate limit backend failed, allowing request: %s", e)
+            return
+        if wait > 0:
+            self.throttled[scope] += 1
+            raise Throttled(scope, max(1, math.ceil(wait)))
+        self.allowed[scope] += 1
+
+    def refund(self, scope: str, identity: str, cost: float = 1.0) -> None:
+        """Give back tokens a check() took for a request that was refused further on."""
+        limit = self.limits.get(scope)
+        if limit is None or not identity:
+            return
+        try:
+            self.backend.take(f"{scope}|{identity}", limit, -cost)
+        except sqlite3.Error as e:
+            self.backend_errors += 1
+            logger.warning("Rate limit backend failed, token not refunded: %s", e)
+            return
+        self.allowed[scope] -= 1
+
+    def allows(self, scope: str, identity: str, cost: float = 1.0) -> bool:
+        """Would check() grant cost tokens now? Takes nothing; an unreachable backend allows (fail open)."""
+        limit = self.limits.get(scope)
+        if limit is None or not identity:
+            return True
+        try:
+            return self.backend.peek(f"{scope}|{identity}", limit) >= cost
+        except sqlite3.Error as e:
+            self.backend_errors += 1
+            logger.warning("Rate limit backend failed, allowing request: %s", e)
+            return True
+
+    async def check_async(self, scope: str, identity: str, cost: float = 1.0) -> None:
+        """check() without blocking the event loop on a shared (SQLite) backend."""
+        if self.backend.blocking:
+            await asyncio.to_thread(self.check, scope, identity, cost)
+        else:
+            self.check(scope, identity, cost)
+
+    def max_cost(self, scope: str) -> float:
+        """Largest cost one check() on scope can ever be granted (its burst); unlimited scope -> inf."""
+        limit = self.limits.get(scope)
+        return limit.burst if limit is not None else math.inf
+
+    def tool_gate(self, client_id: str) -> "ToolGate":
+        """Per-turn hook for run_turn_stream (see ToolGate)."""
+        return ToolGate(self, client_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": type(self.backend).__name__,
+            "limits": {scope: {"burst": l.burst, "per_s": round(l.per_s, 4)} for scope, l in self.limits.items()},
+            "allowed": dict(self.allowed),
+            "throttled": dict(self.throttled),
+            "backend_errors": self.backend_errors,
+        }
+
+
+class ToolGate:
+    """
+    Rate limits for one client's tool calls in a turn:
+        gate(name, args)         None if the call may run (its tokens are taken), else the error envelope
+                                 the model gets instead of the tool result; a refused call is charged to
+                                 no bucket
+        gate.allows(name, args)  would the call run now? Takes nothing: predicted prefetches ask this,
+                                 and are charged only when the model asks for them
+    """
+
+    def __init__(self, limiter: RateLimiter, client_id: str) -> None:
+        self.limiter = limiter
+        self.client_id = client_id
+
+    def _scopes(self, tool_name: str, tool_args: Dict[str, Any]) -> List[Tuple[str, str]]:
+        scopes = [(f"tool:{tool_name}", self.client_id)]
+        patient_id = tool_args.get("patient_id") if isinstance(tool_args, dict) else None
+        if isinstance(patient_id, str):
+            scopes.append(("patient", patient_id))
+        return scopes
+
+    def __call__(self, tool_name: str, tool_args: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        taken: List[Tuple[str, str]] = []
+        try:
+            for scope, identity in self._scopes(tool_name, tool_args):
+                self.limiter.check(scope, identity)
+                taken.append((scope, identity))
+        except Throttled as e:
+            for scope, identity in taken:
+                self.limiter.refund(scope, identity)
+            return {
+                "ok": False,
+                "error": {
+                    "code": "RATE_LIMITED",
+                    "message": f"Too many requests; try again in {e.retry_after_s} s.",
+                },
+            }
+        return None
+
+    def allows(self, tool_name: str, tool_args: Dict[str, Any]) -> bool:
+        return all(self.limiter.allows(scope, identity) for scope, identity in self._scopes(tool_name, tool_args))
+
+
+def limiter_from_env() -> RateLimiter:
+    limits = parse_limits(os.getenv("RATE_LIMITS", DEFAULT_LIMITS))
+    backend = None
+    if os.getenv("RATE_LIMIT_BACKEND", "memory") == "sqlite":
+        backend = SQLiteBuckets(Path(os.getenv("RATE_LIMIT_DB", "app/db/ratelimit.db")))
+    return RateLimiter(limits, backend)
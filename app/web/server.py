@@ -1,23 +1,140 @@
 from __future__ import annotations
+import asyncio
+import ipaddress
 import json
-from typing import Any, Dict, List, Optional
+import os
+import sqlite3
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, List, Optional, Union
 
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse, StreamingResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
 
+from app.agent.cancellation import CancelToken
 from app.agent.runner import run_turn_stream
+from app.db.changes import prune_change_log
+from app.logging_config import configure_logging, shutdown_logging
+from app.tools.aio import prescription_verify_many_async
+from app.web.admission import AdmissionController, Overloaded, controller_from_env
+from app.web.assets import INDEX_NAME, AssetStore
+from app.web.health import readiness
+from app.web.ratelimit import Throttled, limiter_from_env
+from app.web.warmup import warm_up
 
 import logging
 logger = logging.getLogger("pharmacy_agent.web")
 
-app = FastAPI(title="Pharmacy Agent (Demo)")
-app.mount("/static", StaticFiles(directory="app/web/static"), name="static")
+IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
 
-@app.get("/", response_class=HTMLResponse)
-def index() -> str:
-    with open("app/web/static/index.html", "r", encoding="utf-8") as f:
-        return f.read()
+MODEL = "gpt-5"
+
+# filled in by the startup warm-up; /readyz reports 503 until then
+warmup_report: Optional[Dict[str, Any]] = None
+
+# how often change_log is trimmed (every reservation and restock appends to it); 0 disables
+CHANGE_LOG_PRUNE_S = float(os.getenv("CHANGE_LOG_PRUNE_S", "3600"))
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    async def run_warm_up() -> None:
+        global warmup_report
+        warmup_report = await asyncio.to_thread(warm_up, MODEL)
+
+    async def prune_changes() -> None:
+        while True:
+            await asyncio.sleep(CHANGE_LOG_PRUNE_S)
+            try:
+                deleted = await asyncio.to_thread(prune_change_log)
+            except sqlite3.Error:
+                logger.exception("change_log prune failed")
+                continue
+            if deleted:
+                logger.info("change_log pruned", extra={"rows_deleted": deleted})
+
+    configure_logging()
+    tasks = [asyncio.create_task(run_warm_up())]
+    if CHANGE_LOG_PRUNE_S > 0:
+        tasks.append(asyncio.create_task(prune_changes()))
+    yield
+    for task in tasks:
+        task.cancel()
+    shutdown_logging()
+
+app = FastAPI(title="Pharmacy Agent (Demo)", lifespan=lifespan)
+# index + static files are read and compressed once, at import (see app/web/assets.py)
+assets = AssetStore()
+
+admission = controller_from_env()
+limiter = limiter_from_env()
+
+# largest batch POST /prescriptions/verify accepts (also capped by its rate-limit burst)
+VERIFY_MAX_ITEMS = int(os.getenv("PRESCRIPTION_VERIFY_MAX_ITEMS", "10000"))
+VERIFY_SCOPE = "route:/prescriptions/verify"
+verify_admission = AdmissionController(
+    max_active=int(os.getenv("VERIFY_MAX_CONCURRENT", "2")),
+    max_queue=int(os.getenv("VERIFY_MAX_QUEUED", "8")),
+    timeout_s=float(os.getenv("ADMISSION_TIMEOUT_S", "10")),
+    max_per_client=1,
+)
+
+# how often an idle stream (model thinking, tools running) checks whether the client is still there
+DISCONNECT_POLL_S = float(os.getenv("DISCONNECT_POLL_S", "0.5"))
+
+def _parse_networks(spec: str) -> List[IPNetwork]:
+    return [ipaddress.ip_network(part.strip(), strict=False) for part in spec.split(",") if part.strip()]
+
+# proxies / load balancers whose X-Forwarded-For is believed, e.g. TRUSTED_PROXIES="10.0.0.0/8,127.0.0.1"
+TRUSTED_PROXIES = _parse_networks(os.getenv("TRUSTED_PROXIES", ""))
+
+def _is_trusted_proxy(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in net for net in TRUSTED_PROXIES)
+
+def _client_id(req: Request) -> str:
+    """
+    Rate-limit and fair-queuing key: the peer address. Only when the peer is a trusted proxy, the right-most
+    X-Forwarded-For hop that is not itself a trusted proxy (hops left of it are client-supplied).
+    """
+    peer = req.client.host if req.client else "unknown"
+    if not _is_trusted_proxy(peer):
+        return peer
+    hops = [h.strip() for h in ",".join(req.headers.getlist("x-forwarded-for")).split(",") if h.strip()]
+    for hop in reversed(hops):
+        if not _is_trusted_proxy(hop):
+            return hop
+    return hops[0] if hops else peer
+
+@app.get("/")
+def index(req: Request) -> Response:
+    return assets.response(req, INDEX_NAME)
+
+@app.get("/static/{name:path}")
+def static(req: Request, name: str) -> Response:
+    return assets.response(req, name)
+
+class _AdmittedResponse(StreamingResponse):
+    """
+    StreamingResponse that hands back its admission slot when the response is over, however it ends:
+    also when the client is gone or http.response.start fails before the body iterator ever runs.
+    """
+
+    def __init__(self, content: Any, on_close: Callable[[], None], **kwargs: Any) -> None:
+        super().__init__(content, **kwargs)
+        self._on_close = on_close
+
+    async def __call__(self, scope: Any, receive: Any, send: Any) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            try:
+                await self.body_iterator.aclose()  # runs the stream's own cleanup if it started
+            finally:
+                self._on_close()
 
 @app.post("/chat")
 async def chat(req: Request):
@@ -25,24 +142,159 @@ async def chat(req: Request):
     body = await req.json()
     message: str = body.get("message", "")
     history: Optional[List[Dict[str, Any]]] = body.get("history")
+    perf = bool(body.get("perf", False))  # opt-in "perf" event (latency breakdown) before "done"
+
+    client_id = _client_id(req)
+    # per-client rate limit first: a throttled client never takes a queue slot
+    try:
+        await limiter.check_async("route:/chat", client_id)
+    except Throttled as e:
+        logger.warning("chat_throttled", extra={"scope": e.scope, "client_id": client_id})
+        return JSONResponse(
+            {"error": "rate_limited", "scope": e.scope, "retry_after_s": e.retry_after_s},
+            status_code=429,
+            headers={"Retry-After": str(e.retry_after_s)},
+        )
+
+    # admission: bounded concurrency + bounded fair queue; overload fails fast
+    try:
+        queued_s = await admission.acquire(client_id)
+    except Overloaded as e:
+        logger.warning("chat_rejected", extra={"reason": e.reason, **admission.stats()})
+        return JSONResponse(
+            {"error": "overloaded", "reason": e.reason, "retry_after_s": e.retry_after_s},
+            status_code=503,
+            headers={"Retry-After": str(e.retry_after_s)},
+        )
+    started = time.monotonic()
 
     def sse_event(event_type: str, data: Dict[str, Any]) -> str:
         return f"event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
+    cancel = CancelToken()
+
     def stream():
         updated_history: List[Dict[str, Any]] = history or []
-        gen = run_turn_stream(user_text=message, history=updated_history, model="gpt-5")
+        gen = run_turn_stream(
+            user_text=message, history=updated_history, model=MODEL, cancel=cancel, perf=perf,
+            tool_gate=limiter.tool_gate(client_id),
+        )
 
         try:
             while True:
                 ev = next(gen)
-                if ev["type"] in {"tool_call", "tool_result"}:
-                    logger.info("tool_event", extra=ev)
+                if ev["type"] == "tool_call":
+                    logger.info("tool_event", extra={
+                        "event": "tool_call", "tool_name": ev["name"], "call_id": ev["call_id"], "tool_args": ev["arguments"],
+                    })
+                elif ev["type"] == "tool_result":
+                    logger.info("tool_event", extra={
+                        "event": "tool_result", "tool_name": ev["name"], "call_id": ev["call_id"], "ok": ev["output"].get("ok"),
+                        "prefetched": ev.get("prefetched", False), "output": ev["output"],
+                    })
+                elif ev["type"] == "metrics":
+                    logger.info("turn_metrics", extra=ev)
                 yield sse_event(ev["type"], ev)
                 if ev["type"] == "error":
                     break
         except StopIteration as si:
+            if cancel.cancelled:
+                return
             updated_history = si.value or updated_history
             yield sse_event("history", {"type": "history", "history": updated_history})
 
-    return StreamingResponse(stream(), media_type="text/event-stream")
\ No newline at end of file
+    async def watch_disconnect():
+        while not cancel.cancelled:
+            if await req.is_disconnected():
+                cancel.cancel("client disconnected")
+                return
+            await asyncio.sleep(DISCONNECT_POLL_S)
+
+    async def admitted_stream():
+        # the sync runner iterates on the threadpool; the response releases the slot (see _AdmittedResponse)
+        watcher = asyncio.create_task(watch_disconnect())
+        finished = False
+        try:
+            async for chunk in iterate_in_threadpool(stream()):
+                yield chunk
+            finished = True
+        finally:
+            watcher.cancel()
+            if not finished:
+                # send failed / response task cancelled: stop the runner and its upstream stream now
+                cancel.cancel("client disconnected")
+
+    headers = {"X-Queue-Wait-Ms": str(int(queued_s * 1000))}
+    return _AdmittedResponse(
+        admitted_stream(),
+        on_close=lambda: admission.release(time.monotonic() - started),
+        media_type="text/event-stream",
+        headers=headers,
+    )
+
+@app.post("/prescriptions/verify")
+async def prescriptions_verify(req: Request):
+    """bulk prescription_verify (back-office reconciliation): {"items": [...]} -> {"results": [...]}, same order"""
+    try:
+        body = await req.json()
+    except json.JSONDecodeError:
+        return JSONResponse({"error": "invalid_json"}, status_code=400)
+    items = body.get("items") if isinstance(body, dict) else None
+    if not isinstance(items, list):
+        return JSONResponse({"error": "invalid_body", "detail": "expected {\"items\": [...]}"}, status_code=422)
+    max_items = int(min(VERIFY_MAX_ITEMS, limiter.max_cost(VERIFY_SCOPE)))
+    if len(items) > max_items:
+        return JSONResponse({"error": "too_many_items", "max_items": max_items}, status_code=413)
+
+    client_id = _client_id(req)
+    # one token per item: bounds both DB load and how fast prescription statuses can be enumerated
+    try:
+        await limiter.check_async(VERIFY_SCOPE, client_id, cost=len(items))
+    except Throttled as e:
+        logger.warning("verify_throttled", extra={"scope": e.scope, "client_id": client_id, "items": len(items)})
+        return JSONResponse(
+            {"error": "rate_limited", "scope": e.scope, "retry_after_s": e.retry_after_s},
+            status_code=429,
+            headers={"Retry-After": str(e.retry_after_s)},
+        )
+
+    # own admission controller: bulk runs can't take /chat's slots, and only a few run at once
+    try:
+        await verify_admission.acquire(client_id)
+    except Overloaded as e:
+        logger.warning("verify_rejected", extra={"reason": e.reason, **verify_admission.stats()})
+        return JSONResponse(
+            {"error": "overloaded", "reason": e.reason, "retry_after_s": e.retry_after_s},
+            status_code=503,
+            headers={"Retry-After": str(e.retry_after_s)},
+        )
+    started = time.monotonic()
+    try:
+        results = await prescription_verify_many_async(items)
+    finally:
+        verify_admission.release(time.monotonic() - started)
+    logger.info("prescriptions_verified", extra={
+        "client_id": client_id, "items": len(items), "duration_ms": round((time.monotonic() - started) * 1000, 1),
+    })
+    return {"results": [r.model_dump() for r in results]}
+
+@app.get("/stats/admission")
+def admission_stats() -> Dict[str, Any]:
+    """Queue depth and admission counters for this worker."""
+    return admission.stats()
+
+@app.get("/stats/ratelimit")
+def ratelimit_stats() -> Dict[str, Any]:
+    """Configured limits and allowed / throttled counts per scope for this worker."""
+    return limiter.stats()
+
+@app.get("/healthz")
+async def healthz() -> Dict[str, Any]:
+    """Liveness: answered straight from the event loop, no I/O."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz() -> JSONResponse:
+    """Readiness: warm-up, model client, DB, admission queue (details in app/web/health.py)."""
+    ready, report = await readiness(warmup_report, admission)
+    return JSONResponse(report, status_code=200 if ready else 503)
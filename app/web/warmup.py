@@ -0,0 +1,62 @@
+"""
+Worker warm-up: pay the cold-path costs before the first user does.
+
+    - the OpenAI SDK import + shared client (deferred everywhere else, see app.agent.runner.default_client)
+    - tool schemas + the cached request prefix for the served model
+    - the shared catalog snapshot (mmap + staleness check), when one was exported
+    - one representative call per tool on pooled connections (SQLite page cache, statement cache,
+      pydantic validators, the pool itself)
+
+The server runs warm_up() in the background at startup; /readyz reports not ready until it is done.
+"""
+from __future__ import annotations
+
+import logging
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from app.agent.prompt_cache import get_request_prefix
+from app.agent.runner import default_client
+from app.db.catalog import get_catalog
+from app.tools.aio import DB_POOL
+from app.tools.dispatcher import dispatch_tool
+
+logger = logging.getLogger("pharmacy_agent.web")
+
+WARMUP_CALLS: Tuple[Tuple[str, Dict[str, Any]], ...] = (
+    ("inventory_check", {"query": "ibuprofen", "language": "en"}),
+    ("inventory_find_equivalent", {"med_id": "MED001", "language": "en"}),
+    ("prescription_verify", {"patient_id": "P001", "med_id": "MED003", "intent": "refill", "language": "en"}),
+    ("interaction_check", {"med_ids": ["MED001", "MED003"], "language": "en"}),
+)
+
+
+def _tool_calls() -> None:
+    with DB_POOL.connection() as conn:
+        for name, args in WARMUP_CALLS:
+            dispatch_tool(name, args, conn=conn)
+
+
+def warm_up(model: str = "gpt-5") -> Dict[str, Any]:
+    """
+    Run every warm-up step. Returns {"steps_ms": {step: ms}, "failed": [step, ...]}.
+    A failing step is logged and reported, not raised (e.g. no OPENAI_API_KEY -> "model_client").
+    """
+    steps: List[Tuple[str, Callable[[], object]]] = [
+        ("model_client", default_client),
+        ("request_prefix", lambda: get_request_prefix(model)),
+        ("catalog", get_catalog),
+        ("tool_calls", _tool_calls),
+    ]
+    timings: Dict[str, float] = {}
+    failed: List[str] = []
+    for name, step in steps:
+        t0 = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            logger.warning("Warm-up step %s failed: %s", name, e)
+            failed.append(name)
+        timings[name] = round((time.perf_counter() - t0) * 1000, 1)
+    logger.info("Warm-up done", extra={"warmup_ms": timings, "warmup_failed": failed})
+    return {"steps_ms": timings, "failed": failed}
@@ -0,0 +1,100 @@
+"""
+Event-loop responsiveness under concurrent tool load: sync dispatch_tool called from coroutines vs
+dispatch_tool_async (DB executor + connection pool).
+
+    python -m benchmarks.bench_async_tools --concurrency 16 --calls 400
+
+A ticker coroutine sleeps 5 ms in a loop and records how late it wakes up; that lag is what every
+other request on the same event loop (SSE streams, health checks) would see.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List
+
+TICK_S = 0.005
+
+
+def _pct(values: List[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000
+
+
+async def _ticker(stop: asyncio.Event, lags: List[float]) -> None:
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(TICK_S)
+        lags.append(time.perf_counter() - t0 - TICK_S)
+
+
+async def _load(call: Callable[[str, Dict[str, Any]], Awaitable[Any]], n_meds: int, calls: int, concurrency: int) -> float:
+    rnd = random.Random(1)
+    ids = [f"SYN{i:06d}" for i in range(n_meds)]
+    work = [
+        ("inventory_check", {"query": rnd.choice(["ibuprofen", "amoxicillin", "loratadine"]), "limit": 25}),
+        ("inventory_find_equivalent", {"med_id": rnd.choice(ids)}),
+        ("interaction_check", {"med_ids": rnd.sample(ids, 4)}),
+        ("prescription_verify", {"patient_id": "P001", "med_id": "MED003", "intent": "refill"}),
+    ]
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(calls):
+        queue.put_nowait(work[i % len(work)])
+
+    async def worker() -> None:
+        while not queue.empty():
+            name, args = queue.get_nowait()
+            out = await call(name, args)
+            assert out["ok"] or out["error"]["code"] != "TOOL_RUNTIME_ERROR", out
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - t0
+
+
+async def _run(name: str, call: Callable, args: argparse.Namespace) -> None:
+    lags: List[float] = []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(_ticker(stop, lags))
+    elapsed = await _load(call, args.meds, args.calls, args.concurrency)
+    stop.set()
+    await ticker
+    print(f"{name:<22} {args.calls / elapsed:>9.0f} {statistics.median(lags) * 1000:>9.2f} "
+          f"{_pct(lags, 0.99):>9.2f} {max(lags) * 1000:>9.2f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--meds", type=int, default=20_000)
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["PHARMACY_DB_PATH"] = str(Path(tmp) / "pharmacy.db")
+        from app.db import database
+        from benchmarks.synthetic import build_synthetic_db
+
+        database.DB_PATH = Path(os.environ["PHARMACY_DB_PATH"])
+        build_synthetic_db(database.DB_PATH, n_meds=args.meds, n_rules=args.meds)
+
+        from app.tools.aio import dispatch_tool_async
+        from app.tools.dispatcher import dispatch_tool
+
+        async def blocking(name: str, tool_args: Dict[str, Any]) -> Dict[str, Any]:
+            return dispatch_tool(name, tool_args)  # what an async handler calling the sync tools does
+
+        print(f"cpus: {os.cpu_count()}, {args.calls} calls, concurrency {args.concurrency}")
+        print(f"{'variant':<22} {'calls/s':>9} {'lag p50':>9} {'lag p99':>9} {'lag max':>9}  (ms)")
+        asyncio.run(_run("sync in coroutine", blocking, args))
+        asyncio.run(_run("dispatch_tool_async", dispatch_tool_async, args))
+
+
+if __name__ == "__main__":
+    main()
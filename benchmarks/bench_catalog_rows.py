@@ -0,0 +1,99 @@
+"""
+Latency and allocation for large match sets: per-row pydantic objects vs compact StockRow records.
+
+    python -m benchmarks.bench_catalog_rows --meds 20000 --repeat 20
+
+Both variants run the same SQL; the baseline rebuilds the previous behaviour (a validated
+StockedMedication and a json.loads per row), the compact path is what inventory_check does now.
+"convert" times only rows -> contract dict on already-fetched rows (the part that differs);
+"end-to-end" includes the query.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, List, Tuple
+
+
+def _measure(fn: Callable[[], Any], repeat: int) -> Tuple[float, float]:
+    fn()  # warm caches (ingredient cache, page cache)
+    times: List[float] = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(times) * 1000, peak / 1024 / 1024
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--meds", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--query", default="ibuprofen")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["PHARMACY_DB_PATH"] = str(Path(tmp) / "pharmacy.db")
+        from app.db import database
+        from benchmarks.synthetic import build_synthetic_db
+
+        database.DB_PATH = Path(os.environ["PHARMACY_DB_PATH"])
+        build_synthetic_db(database.DB_PATH, n_meds=args.meds, n_rules=10)
+
+        from app.tools.contracts import InventoryCheckOutput, StockedMedication
+        from app.tools.rows import STOCK_COLUMNS, StockRow
+
+        sql = f"""
+            SELECT {STOCK_COLUMNS}
+            FROM medications m JOIN inventory i ON i.med_id = m.med_id
+            WHERE lower(m.brand_name) LIKE ? OR lower(m.generic_name) LIKE ?
+            ORDER BY (i.qty_on_hand > 0) DESC, m.brand_name ASC
+        """
+        like = f"%{args.query}%"
+        conn = database.get_conn()
+        fetched = conn.execute(sql, (like, like)).fetchall()
+
+        def per_row_pydantic(rows: List[Any]) -> dict:
+            matches = [
+                StockedMedication(
+                    med_id=r["med_id"],
+                    brand_name=r["brand_name"],
+                    generic_name=r["generic_name"],
+                    active_ingredients=json.loads(r["active_ingredients"]),
+                    form=r["form"],
+                    strength=r["strength"],
+                    rx_required=bool(r["rx_required"]),
+                    qty_on_hand=int(r["qty_on_hand"]),
+                    qty_available=int(r["qty_available"]),
+                )
+                for r in rows
+            ]
+            return InventoryCheckOutput(ok=True, matches=matches).model_dump()
+
+        def compact_rows(rows: List[Any]) -> dict:
+            return InventoryCheckOutput.model_validate(
+                {"ok": True, "matches": [StockRow(r).as_dict() for r in rows]}
+            ).model_dump()
+
+        assert per_row_pydantic(fetched) == compact_rows(fetched)
+        print(f"query={args.query!r}: {len(fetched)} matches out of {args.meds} SKUs")
+        print(f"{'variant':<20} {'convert ms':>11} {'peak alloc MB':>14} {'end-to-end ms':>14}")
+        for name, fn in (("per-row pydantic", per_row_pydantic), ("compact StockRow", compact_rows)):
+            ms, mb = _measure(lambda: fn(fetched), args.repeat)
+            total_ms, _ = _measure(lambda: fn(conn.execute(sql, (like, like)).fetchall()), args.repeat)
+            print(f"{name:<20} {ms:>11.2f} {mb:>14.2f} {total_ms:>14.2f}")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Early tool dispatch: turn wall time when a response asks for several tool calls at once.
+
+    python -m benchmarks.bench_early_dispatch --meds 20000 --calls 4 --event-ms 2 --turns 10
+
+The model is a ReplayClient whose stream sleeps event-ms per event (a stand-in for token streaming), so
+each call's arguments finish well before response.completed. The first response asks for `calls`
+inventory_check calls over the synthetic catalog, the second answers. "off" runs every call after the
+stream has completed; "on" (the default) starts each one when its arguments are done.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--meds", type=int, default=20_000)
+    parser.add_argument("--calls", type=int, default=4)
+    parser.add_argument("--event-ms", type=float, default=2.0)
+    parser.add_argument("--turns", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["PHARMACY_DB_PATH"] = str(Path(tmp) / "pharmacy.db")
+        os.environ["SPECULATIVE_PREFETCH"] = "0"  # measure early dispatch alone
+        from app.agent.replay import ReplayClient, function_call, message
+        from app.agent.runner import run_turn_stream
+        from app.db import database
+        from benchmarks.synthetic import GENERICS, build_synthetic_db
+
+        database.DB_PATH = Path(os.environ["PHARMACY_DB_PATH"])
+        build_synthetic_db(database.DB_PATH, n_meds=args.meds, n_rules=10)
+
+        calls = [
+            function_call("inventory_check", {"query": GENERICS[i % len(GENERICS)], "language": "en", "limit": 50})
+            for i in range(args.calls)
+        ]
+
+        def turn(early: bool) -> float:
+            client = ReplayClient([calls, [message("Here is what is in stock.")]], event_delay_s=args.event_ms / 1000)
+            t0 = time.perf_counter()
+            for event in run_turn_stream(user_text="What do you have?", client=client, early_dispatch=early):
+                if event["type"] == "error":
+                    raise RuntimeError(event)
+            return time.perf_counter() - t0
+
+        turn(True)  # warm caches
+        print(f"{args.calls} inventory_check calls over {args.meds} SKUs, {args.event_ms} ms per stream event")
+        print(f"{'early dispatch':<15} {'median turn ms':>15} {'min turn ms':>12}")
+        for label, early in (("off", False), ("on", True)):
+            times: List[float] = [turn(early) for _ in range(args.turns)]
+            print(f"{label:<15} {statistics.median(times) * 1000:15.1f} {min(times) * 1000:12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Logging overhead per turn: what the request thread pays for the log calls of one tool-using turn.
+
+    python -m benchmarks.bench_logging --turns 2000 --tools 4
+
+A turn logs what server.py / dispatch_tool log for real: tool_call + tool_result ("tool_event") and
+"Tool executed successfully" per tool, plus one "turn_metrics". Payloads are real tool outputs from the
+bundled DB. Output goes to /dev/null, so only formatting/handler cost is measured.
+
+    disabled       pharmacy_agent at WARNING (floor: record creation is skipped)
+    sync json      JSON formatter on a plain StreamHandler, no sampling, no size cap
+    queue json     app.logging_config: QueueHandler + listener thread, default sampling and caps
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import time
+from typing import Any, Dict, List, Tuple
+
+from app.logging_config import JsonFormatter, configure_logging, shutdown_logging
+from app.tools.dispatcher import dispatch_tool
+
+CALLS = [
+    ("inventory_check", {"query": "PainAway", "language": "en"}),
+    ("inventory_find_equivalent", {"med_id": "MED001", "language": "en"}),
+    ("prescription_verify", {"patient_id": "P001", "med_id": "MED003", "intent": "refill", "language": "en"}),
+    ("interaction_check", {"med_ids": ["MED001", "MED003"], "language": "en"}),
+]
+
+
+def _turn_events(n_tools: int) -> List[Tuple[str, Dict[str, Any]]]:
+    events: List[Tuple[str, Dict[str, Any]]] = []
+    for i in range(n_tools):
+        name, args = CALLS[i % len(CALLS)]
+        out = dispatch_tool(name, args)
+        call_id = f"call_{i}"
+        events.append(("tool_event", {"event": "tool_call", "tool_name": name, "call_id": call_id,
+                                      "tool_args": json.dumps(args)}))
+        events.append(("Tool executed successfully", {"tool_name": name}))
+        events.append(("tool_event", {"event": "tool_result", "tool_name": name, "call_id": call_id,
+                                      "ok": out.get("ok"), "prefetched": False, "output": out}))
+    events.append(("turn_metrics", {"type": "metrics", "model_calls": n_tools + 1, "tool_calls": n_tools}))
+    return events
+
+
+def _run(events: List[Tuple[str, Dict[str, Any]]], turns: int) -> List[float]:
+    log = logging.getLogger("pharmacy_agent.web")
+    per_turn: List[float] = []
+    for _ in range(turns):
+        t0 = time.perf_counter()
+        for msg, extra in events:
+            log.info(msg, extra=extra)
+        per_turn.append(time.perf_counter() - t0)
+    return per_turn
+
+
+def _reset_root() -> None:
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--turns", type=int, default=2000)
+    ap.add_argument("--tools", type=int, default=4)
+    args = ap.parse_args()
+
+    events = _turn_events(args.tools)
+    devnull = open(os.devnull, "w")
+    results = {}
+
+    _reset_root()
+    logging.getLogger("pharmacy_agent").setLevel(logging.WARNING)
+    results["disabled"] = (_run(events, args.turns), 0.0)
+
+    _reset_root()
+    sync = logging.StreamHandler(devnull)
+    sync.setFormatter(JsonFormatter(max_field_bytes=10**9))
+    logging.getLogger().addHandler(sync)
+    logging.getLogger("pharmacy_agent").setLevel(logging.INFO)
+    results["sync json"] = (_run(events, args.turns), 0.0)
+
+    _reset_root()
+    configure_logging(level="INFO", fmt="json", stream=devnull)
+    t0 = time.perf_counter()
+    per_turn = _run(events, args.turns)
+    shutdown_logging()  # drains the queue
+    results["queue json"] = (per_turn, time.perf_counter() - t0 - sum(per_turn))
+
+    print(f"{len(events)} log calls per turn, {args.turns} turns")
+    print(f"{'':12} {'median us/turn':>15} {'p99 us/turn':>12} {'listener drain ms':>18}")
+    for name, (times, drain) in results.items():
+        times = sorted(times)
+        p99 = times[min(len(times) - 1, int(len(times) * 0.99))]
+        print(f"{name:12} {statistics.median(times) * 1e6:15.1f} {p99 * 1e6:12.1f} {drain * 1000:18.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+prescription_verify on a large prescriptions table: per-call latency and bulk throughput.
+
+    python -m benchmarks.bench_prescriptions --meds 50 --patients 50000 --rx 300000 --pairs 5000
+
+    3 queries, old index   the previous implementation (rx_required, patient, then latest prescription
+                           sorted on demand) over the old (patient_id, med_id) index
+    1 query                prescription_verify: one combined query over idx_rx_patient_med_expiry
+    bulk                   prescription_verify_many over all pairs (VERIFY_BATCH pairs per statement)
+
+All variants verify the same random (patient, med) pairs on one connection (best of 3), and must agree.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+
+def _old_verify(conn: Any, payload: Dict[str, Any]) -> Any:
+    """The previous prescription_verify (three queries), minus the DB_ERROR handling."""
+    from app.tools.contracts import PrescriptionVerifyInput, PrescriptionVerifyOutput, ToolError
+
+    inp = PrescriptionVerifyInput.model_validate(payload)
+    today = date.today().isoformat()
+    m = conn.execute("SELECT rx_required FROM medications WHERE med_id = ?", (inp.med_id,)).fetchone()
+    if m is None:
+        return PrescriptionVerifyOutput(ok=False, error=ToolError(code="MED_NOT_FOUND", message="Medication not found."),
+                                        patient_found=True)
+    if not m["rx_required"]:
+        return PrescriptionVerifyOutput(ok=True, rx_required=False, patient_found=True, has_valid_rx=None,
+                                        next_step="allow_refill_request",
+                                        notes="No prescription required for this medication.")
+    if conn.execute("SELECT 1 FROM patients WHERE patient_id = ?", (inp.patient_id,)).fetchone() is None:
+        return PrescriptionVerifyOutput(ok=False, error=ToolError(code="PATIENT_NOT_FOUND", message="Patient not found."),
+                                        patient_found=False)
+    rx = conn.execute(
+        "SELECT status, expires_at, refills_remaining FROM prescriptions "
+        "WHERE patient_id = ? AND med_id = ? ORDER BY expires_at DESC LIMIT 1",
+        (inp.patient_id, inp.med_id),
+    ).fetchone()
+    if rx is None:
+        return PrescriptionVerifyOutput(ok=True, rx_required=True, patient_found=True, has_valid_rx=False,
+                                        next_step="cannot_proceed", notes="No prescription on file.")
+    refills_remaining = int(rx["refills_remaining"])
+    valid = rx["status"] == "active" and rx["expires_at"] >= today
+    if inp.intent == "refill":
+        valid = valid and refills_remaining > 0
+    return PrescriptionVerifyOutput(ok=True, rx_required=True, patient_found=True, has_valid_rx=bool(valid),
+                                    rx_status=rx["status"], expires_at=rx["expires_at"],
+                                    refills_remaining=refills_remaining,
+                                    next_step="allow_refill_request" if valid else "cannot_proceed")
+
+
+def _timed(fn: Callable[[], Any], repeat: int = 3) -> tuple:
+    """(result, best of repeat runs in seconds)"""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return out, best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--meds", type=int, default=50)
+    parser.add_argument("--patients", type=int, default=50_000)
+    parser.add_argument("--rx", type=int, default=300_000)
+    parser.add_argument("--pairs", type=int, default=5_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["PHARMACY_DB_PATH"] = str(Path(tmp) / "pharmacy.db")
+        from app.db import database
+        from app.db.database import get_conn
+        from app.tools.prescriptions import prescription_verify, prescription_verify_many
+        from benchmarks.synthetic import add_synthetic_prescriptions, build_synthetic_db
+
+        database.DB_PATH = Path(os.environ["PHARMACY_DB_PATH"])
+        build_synthetic_db(database.DB_PATH, n_meds=args.meds, n_rules=10)
+        add_synthetic_prescriptions(database.DB_PATH, n_patients=args.patients, n_rx=args.rx)
+
+        conn = get_conn()
+        rx_meds = [r["med_id"] for r in conn.execute("SELECT med_id FROM medications WHERE rx_required = 1")]
+        on_file = conn.execute(
+            "SELECT r.patient_id, r.med_id FROM prescriptions r JOIN medications m ON m.med_id = r.med_id "
+            "WHERE m.rx_required = 1 ORDER BY random() LIMIT ?",
+            (args.pairs,),
+        ).fetchall()
+        rnd = random.Random(1)
+        items = [
+            # mostly Rx-only pairs with prescriptions on file (the lookup that sorted), some without
+            {"patient_id": pair[0], "med_id": pair[1], "intent": rnd.choice(["new", "refill"])}
+            if rnd.random() < 0.8 else
+            {"patient_id": f"SP{rnd.randrange(args.patients):07d}", "med_id": rnd.choice(rx_meds),
+             "intent": rnd.choice(["new", "refill"])}
+            for pair in on_file
+        ]
+
+        def new_index() -> None:
+            conn.execute("ANALYZE")
+            conn.commit()
+
+        conn.execute("DROP INDEX idx_rx_patient_med_expiry")
+        conn.execute("CREATE INDEX idx_rx_patient_med ON prescriptions(patient_id, med_id)")
+        new_index()
+        old, old_s = _timed(lambda: [_old_verify(conn, item) for item in items])
+        conn.execute("DROP INDEX idx_rx_patient_med")
+        conn.execute("CREATE INDEX idx_rx_patient_med_expiry ON prescriptions(patient_id, med_id, expires_at DESC)")
+        new_index()
+
+        single, single_s = _timed(lambda: [prescription_verify(item, conn=conn) for item in items])
+        bulk, bulk_s = _timed(lambda: prescription_verify_many(items, conn=conn))
+        assert old == single == bulk
+        conn.close()
+
+        found = sum(o.rx_status is not None for o in single)
+        print(f"{args.rx} prescriptions, {args.patients} patients; {len(items)} pairs ({found} with a prescription)")
+        print(f"{'variant':<24} {'us/verification':>16} {'total ms':>10}")
+        results: List[tuple] = [("3 queries, old index", old_s), ("1 query", single_s), ("bulk", bulk_s)]
+        for name, seconds in results:
+            print(f"{name:<24} {seconds / len(items) * 1e6:16.1f} {seconds * 1000:10.1f}")
+
+
+if __name__ == "__main__":
+    main()
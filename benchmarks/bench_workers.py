@@ -0,0 +1,104 @@
+"""
+Throughput and per-worker memory vs worker count, with and without the shared mmap catalog.
+
+    python -m benchmarks.bench_workers --workers 1 2 4 --seconds 5
+
+Each worker process runs catalog-heavy tool calls (interaction_check over 4 meds,
+inventory_find_equivalent) against a synthetic 20k-SKU database. Reported memory is per worker:
+RSS counts shared catalog pages in every process, PSS splits them between the processes mapping
+them, Private is what the worker alone costs.
+"""
+from __future__ import annotations
+
+import argparse
+import multiprocessing as mp
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+
+def _memory_kb() -> Dict[str, int]:
+    out = {"Rss": 0, "Pss": 0, "Private": 0}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Pss"):
+                out[key] = int(rest.split()[0])
+            elif key in ("Private_Clean", "Private_Dirty"):
+                out["Private"] += int(rest.split()[0])
+    return out
+
+
+def _worker(n_meds: int, seconds: float, start_at: float, results: "mp.Queue") -> None:
+    # imported here so DB/catalog paths come from the environment set by the parent
+    from app.tools.interactions import interaction_check
+    from app.tools.inventory import inventory_find_equivalent
+
+    rnd = random.Random(os.getpid())
+    ids = [f"SYN{i:06d}" for i in range(n_meds)]
+    interaction_check({"med_ids": ids[:2]})  # warm up: open catalog / connections
+
+    while time.time() < start_at:
+        time.sleep(0.001)
+    ops = 0
+    deadline = start_at + seconds
+    while time.time() < deadline:
+        interaction_check({"med_ids": rnd.sample(ids, 4)})
+        inventory_find_equivalent({"med_id": rnd.choice(ids)})
+        ops += 2
+    results.put({"ops": ops, **_memory_kb()})
+
+
+def run(workers: List[int], seconds: float, n_meds: int, use_catalog: bool) -> None:
+    from benchmarks.synthetic import build_synthetic_db
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = build_synthetic_db(Path(tmp) / "pharmacy.db", n_meds=n_meds, n_rules=n_meds)
+        os.environ["PHARMACY_DB_PATH"] = str(db)
+        catalog = Path(tmp) / "catalog.bin"
+        os.environ["PHARMACY_CATALOG_PATH"] = str(catalog)
+        if use_catalog:
+            # export from a child so this parent never imports app modules with stale paths
+            ctx = mp.get_context("spawn")
+            p = ctx.Process(target=_export)
+            p.start()
+            p.join()
+            print(f"catalog: {catalog.stat().st_size / 1024:.0f} KiB mmap file")
+
+        print(f"{'workers':>7} {'ops/s':>10} {'scaling':>8} {'RSS/worker':>11} {'PSS/worker':>11} {'Private/worker':>15}")
+        base = None
+        for n in workers:
+            ctx = mp.get_context("spawn")
+            q: "mp.Queue" = ctx.Queue()
+            start_at = time.time() + 2.0
+            procs = [ctx.Process(target=_worker, args=(n_meds, seconds, start_at, q)) for _ in range(n)]
+            for p in procs:
+                p.start()
+            res = [q.get() for _ in procs]
+            for p in procs:
+                p.join()
+            ops_s = sum(r["ops"] for r in res) / seconds
+            base = base or ops_s
+            avg = {k: sum(r[k] for r in res) / n / 1024 for k in ("Rss", "Pss", "Private")}
+            print(f"{n:>7} {ops_s:>10,.0f} {ops_s / base:>7.2f}x {avg['Rss']:>9.1f}MB {avg['Pss']:>9.1f}MB "
+                  f"{avg['Private']:>13.1f}MB")
+
+
+def _export() -> None:
+    from app.db.catalog import export_catalog
+
+    export_catalog()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--meds", type=int, default=20_000)
+    parser.add_argument("--no-catalog", action="store_true", help="SQL-only baseline")
+    args = parser.parse_args()
+    print(f"cpus: {os.cpu_count()}")
+    run(args.workers, args.seconds, args.meds, use_catalog=not args.no_catalog)
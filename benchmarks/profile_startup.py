@@ -0,0 +1,69 @@
+"""
+Startup profile: import-time breakdown for the server and CLI entry points.
+
+    python -m benchmarks.profile_startup
+    python -m benchmarks.profile_startup --module app.web.server --top 25
+
+Each module is imported in a fresh interpreter with `-X importtime`; the report lists the slowest
+imports by cumulative time, the self time per top-level package, and the wall time of the import.
+"""
+from __future__ import annotations
+
+import argparse
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+ENTRY_POINTS = ("app.web.server", "app.cli_chat", "app.agent.runner")
+
+
+def import_profile(module: str) -> Tuple[float, List[Tuple[str, int, int]]]:
+    """(wall ms, [(module, self us, cumulative us)]) for importing `module` in a fresh interpreter."""
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    wall_ms = (time.perf_counter() - t0) * 1000
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((name.strip(), int(self_us), int(cum_us)))
+    return wall_ms, rows
+
+
+def report(module: str, top: int) -> None:
+    wall_ms, rows = import_profile(module)
+    total_us = next((cum for name, _, cum in rows if name == module), 0)
+    print(f"{module}: import {total_us / 1000:.0f} ms (process wall {wall_ms:.0f} ms, {len(rows)} modules)")
+
+    print("  slowest by cumulative time:")
+    for name, _, cum in sorted(rows, key=lambda r: -r[2])[:top]:
+        print(f"    {cum / 1000:8.1f} ms  {name}")
+
+    by_package: Dict[str, int] = defaultdict(int)
+    for name, self_us, _ in rows:
+        by_package[name.split(".")[0]] += self_us
+    print("  self time by top-level package:")
+    for pkg, us in sorted(by_package.items(), key=lambda kv: -kv[1])[:top]:
+        print(f"    {us / 1000:8.1f} ms  {pkg}")
+    print()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--module", action="append", help=f"module to import (default: {', '.join(ENTRY_POINTS)})")
+    ap.add_argument("--top", type=int, default=12)
+    args = ap.parse_args()
+    for module in args.module or ENTRY_POINTS:
+        report(module, args.top)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Large synthetic catalogs for benchmarks (the demo seed only has 5 medications)."""
+from __future__ import annotations
+
+import json
+import random
+from pathlib import Path
+
+from app.db.database import get_conn
+from app.db.seed import norm_pair, run_seed
+from app.db.strength import normalize_strength
+
+GENERICS = ["Ibuprofen", "Atorvastatin", "Omeprazole", "Loratadine", "Paracetamol", "Metformin", "Amoxicillin"]
+FORMS = ["tablet", "capsule", "syrup"]
+STRENGTHS = ["200 mg", "0.2 g", "400 mg", "10 mg/5 mL", "20 mg", "500 mg"]
+
+
+def build_synthetic_db(path: Path, n_meds: int = 20_000, n_rules: int = 20_000, seed: int = 7) -> Path:
+    """Demo seed + n_meds synthetic SKUs (with stock) + n_rules interaction rules, written to path."""
+    rnd = random.Random(seed)
+    run_seed(path)
+    conn = get_conn(path)
+    try:
+        meds, inventory = [], []
+        for i in range(n_meds):
+            generic = GENERICS[i % len(GENERICS)]
+            strength = rnd.choice(STRENGTHS)
+            meds.append((
+                f"SYN{i:06d}", f"{generic[:4]}Brand{i}", generic, json.dumps([generic.lower()]),
+                rnd.choice(FORMS), strength, *normalize_strength(strength), rnd.randint(0, 1),
+                "Informational only.", json.dumps(["nausea"]), json.dumps([]),
+            ))
+            inventory.append((f"SYN{i:06d}", rnd.randint(0, 40), 5, f"Z{i % 50}-{i % 7}"))
+        conn.executemany("INSERT INTO medications VALUES (?,?,?,?,?,?,?,?,?,?,?,?)", meds)
+        conn.executemany("INSERT INTO inventory VALUES (?,?,?,?)", inventory)
+
+        rules, seen = [], set()
+        while len(rules) < n_rules:
+            a, b = norm_pair(f"SYN{rnd.randrange(n_meds):06d}", f"SYN{rnd.randrange(n_meds):06d}")
+            if a == b or (a, b) in seen:
+                continue
+            seen.add((a, b))
+            rules.append((f"SYNR{len(rules):06d}", a, b, rnd.choice(["caution", "avoid"]), "Synthetic rule.", None))
+        conn.executemany("INSERT INTO interaction_rules VALUES (?,?,?,?,?,?)", rules)
+        conn.commit()
+    finally:
+        conn.close()
+    return path
+
+
+def add_synthetic_prescriptions(path: Path, n_patients: int = 100_000, n_rx: int = 1_000_000, seed: int = 7) -> Path:
+    """n_patients synthetic patients and n_rx prescriptions spread over them and the catalog's meds."""
+    rnd = random.Random(seed)
+    conn = get_conn(path)
+    try:
+        conn.executemany(
+            "INSERT INTO patients VALUES (?,?,?)",
+            ((f"SP{i:07d}", f"Patient {i}", rnd.choice(["he", "en"])) for i in range(n_patients)),
+        )
+        med_ids = [r["med_id"] for r in conn.execute("SELECT med_id FROM medications")]
+        statuses = ["active", "refill_pending", "expired", "cancelled"]
+        conn.executemany(
+            "INSERT INTO prescriptions VALUES (?,?,?,?,?,?,?,?)",
+            (
+                (f"SRX{i:08d}", f"SP{rnd.randrange(n_patients):07d}", rnd.choice(med_ids), rnd.choice(statuses),
+                 f"20{rnd.randint(24, 28)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}", rnd.randint(0, 5),
+                 "Synthetic directions.", None)
+                for i in range(n_rx)
+            ),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return path
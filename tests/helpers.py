@@ -0,0 +1,24 @@
+"""Shared setup for the run_*_test scripts (plain decorators, so the scripts also run without pytest)."""
+import tempfile
+from pathlib import Path
+from typing import Callable
+
+from app.db import database
+from app.db.seed import run_seed
+
+
+def with_temp_db(build: Callable[[Path], object] = run_seed):
+    """Run the decorated test against a fresh database written by build(path) in a temp dir."""
+    def decorate(fn):
+        def wrapper():
+            original = database.DB_PATH
+            with tempfile.TemporaryDirectory() as tmp:
+                database.DB_PATH = Path(tmp) / "pharmacy.db"
+                try:
+                    build(database.DB_PATH)
+                    fn()
+                finally:
+                    database.DB_PATH = original
+        wrapper.__name__ = fn.__name__
+        return wrapper
+    return decorate
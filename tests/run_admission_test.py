@@ -0,0 +1,107 @@
+"""
+Admission controller: bounded concurrency, fast rejection, timeouts and round-robin fairness.
+
+    python -m pytest tests/run_admission_test.py -q
+    python -m tests.run_admission_test
+"""
+import asyncio
+import json
+
+import app.web.server as server
+from app.web.admission import AdmissionController, Overloaded
+
+
+def test_overload_is_rejected_fast_with_retry_after():
+    async def scenario():
+        ctl = AdmissionController(max_active=1, max_queue=1, timeout_s=0.05, max_per_client=4)
+        await ctl.acquire("a")
+        waiter = asyncio.create_task(ctl.acquire("b"))
+        await asyncio.sleep(0)
+        try:
+            await ctl.acquire("c")
+            raise AssertionError("third request should be rejected")
+        except Overloaded as e:
+            assert e.reason == "queue full" and e.retry_after_s >= 1
+        try:
+            await waiter
+            raise AssertionError("queued request should time out")
+        except Overloaded as e:
+            assert e.reason == "queue timeout"
+        ctl.release()
+        assert ctl.stats()["active"] == 0 and ctl.stats()["waiting"] == 0
+        assert ctl.rejected == 1 and ctl.timed_out == 1
+
+    asyncio.run(scenario())
+
+
+def test_freed_slots_go_round_robin_across_clients():
+    async def scenario():
+        ctl = AdmissionController(max_active=1, max_queue=10, timeout_s=5, max_per_client=4)
+        await ctl.acquire("busy")
+        order = []
+
+        async def turn(client, i):
+            await ctl.acquire(client)
+            order.append(client)
+            await asyncio.sleep(0)
+            ctl.release()
+
+        tasks = [asyncio.create_task(turn("busy", i)) for i in range(3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(turn("quiet", 0)))
+        await asyncio.sleep(0)
+        ctl.release()
+        await asyncio.gather(*tasks)
+        # the quiet client is served second, not behind all of busy's queued turns
+        assert order == ["busy", "quiet", "busy", "busy"]
+        assert ctl.active == 0
+
+    asyncio.run(scenario())
+
+
+def _chat_asgi(spec_version, send):
+    """Drive POST /chat through the ASGI app with a client that is gone once the body is read."""
+    body = json.dumps({"message": "hi"}).encode()
+    scope = {
+        "type": "http", "asgi": {"version": "3.0", "spec_version": spec_version}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": "/chat", "raw_path": b"/chat", "root_path": "",
+        "query_string": b"", "headers": [(b"content-type", b"application/json")],
+        "client": ("10.0.0.1", 5000), "server": ("test", 80),
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def run():
+        try:
+            await server.app(scope, receive, send)
+        except Exception:
+            pass  # ClientDisconnect / the failed send surface here, as they would in the server
+
+    asyncio.run(run())
+
+
+def test_slot_is_released_when_client_leaves_before_first_chunk():
+    saved = server.admission
+    server.admission = AdmissionController(max_active=1, max_queue=0, timeout_s=0.1)
+    try:
+        async def send_fails(message):
+            raise OSError("connection reset")  # at http.response.start
+
+        async def send_hangs(message):
+            await asyncio.sleep(3600)  # start never completes; the disconnect wins
+
+        for spec_version, send in (("2.4", send_fails), ("2.3", send_hangs), ("2.4", send_fails)):
+            _chat_asgi(spec_version, send)
+            assert server.admission.active == 0, server.admission.stats()
+        assert server.admission.admitted == 3 and server.admission.rejected == 0
+    finally:
+        server.admission = saved
+
+
+if __name__ == "__main__":
+    test_overload_is_rejected_fast_with_retry_after()
+    test_freed_slots_go_round_robin_across_clients()
+    test_slot_is_released_when_client_leaves_before_first_chunk()
+    print("OK")
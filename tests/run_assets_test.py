@@ -0,0 +1,47 @@
+"""
+Static assets: served from memory, precompressed, revalidated by ETag, fingerprinted URLs immutable.
+
+    python -m pytest tests/run_assets_test.py -q
+    python -m tests.run_assets_test
+"""
+import gzip
+import tempfile
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+from app.web.assets import IMMUTABLE, REVALIDATE, AssetStore
+from app.web.server import app
+
+
+def test_index_is_compressed_and_revalidated():
+    client = TestClient(app)
+    r = client.get("/", headers={"accept-encoding": "gzip"})
+    assert r.status_code == 200 and r.headers["content-encoding"] == "gzip"
+    assert r.headers["cache-control"] == REVALIDATE and "<html" in r.text.lower()
+    again = client.get("/", headers={"if-none-match": r.headers["etag"]})
+    assert again.status_code == 304 and again.content == b""
+    plain = client.get("/", headers={"accept-encoding": "identity"})
+    assert "content-encoding" not in plain.headers and plain.text == r.text
+
+
+def test_fingerprinted_links_are_immutable():
+    with tempfile.TemporaryDirectory() as d:
+        root = Path(d)
+        (root / "app.js").write_text("console.log('hi');\n" * 40)
+        (root / "index.html").write_text('<html><script src="/static/app.js"></script></html>')
+        store = AssetStore(root, dev_reload=False)
+        js = store._assets["app.js"]
+        assert f"/static/{js.fingerprinted_name}" in store._assets["index.html"].bodies["identity"].decode()
+        assert gzip.decompress(js.bodies["gzip"]) == js.bodies["identity"]
+
+        asset, immutable = store.lookup(js.fingerprinted_name)
+        assert asset is js and immutable
+        assert store.lookup("app.0123456789.js") == (None, False)  # stale hash
+        assert IMMUTABLE.endswith("immutable")
+
+
+if __name__ == "__main__":
+    test_index_is_compressed_and_revalidated()
+    test_fingerprinted_links_are_immutable()
+    print("OK")
@@ -0,0 +1,34 @@
+"""
+Async tool entry points return exactly what the sync tools return.
+
+    python -m pytest tests/run_async_tools_test.py -q
+    python -m tests.run_async_tools_test
+"""
+import asyncio
+
+from app.tools.aio import DB_POOL, dispatch_tool_async
+from app.tools.dispatcher import dispatch_tool
+
+CALLS = [
+    ("inventory_check", {"query": "PainAway", "language": "en"}),
+    ("inventory_find_equivalent", {"med_id": "MED001", "language": "en"}),
+    ("prescription_verify", {"patient_id": "P001", "med_id": "MED003", "intent": "refill", "language": "en"}),
+    ("interaction_check", {"med_ids": ["MED001", "MED003"], "language": "en"}),
+    ("interaction_check", {"med_ids": []}),  # invalid args envelope
+    ("no_such_tool", {}),
+]
+
+
+def test_async_dispatch_matches_sync():
+    async def run_all():
+        return await asyncio.gather(*(dispatch_tool_async(name, args) for name, args in CALLS * 3))
+
+    results = asyncio.run(run_all())
+    expected = [dispatch_tool(name, args) for name, args in CALLS * 3]
+    assert results == expected
+    assert len(DB_POOL._idle) <= DB_POOL.size
+
+
+if __name__ == "__main__":
+    test_async_dispatch_matches_sync()
+    print("OK")
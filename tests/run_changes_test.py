@@ -0,0 +1,139 @@
+"""
+Change tracking: the schema triggers log every row change, ChangeFeed.poll() fans the new rows out to
+subscribers, and prune_change_log keeps the log bounded without hiding events from a feed.
+
+    python -m pytest tests/run_changes_test.py -q
+    python -m tests.run_changes_test
+"""
+from app.db import database
+from app.db.changes import MAX_EVENTS_PER_POLL, TRACKED_TABLES, ChangeFeed, prune_change_log
+from tests.helpers import with_temp_db
+
+
+def _write(*statements):
+    conn = database.get_conn()
+    try:
+        for sql in statements:
+            conn.execute(sql)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _log_after(change_id):
+    conn = database.get_conn()
+    try:
+        return [tuple(r) for r in conn.execute(
+            "SELECT table_name, op, med_id, patient_id FROM change_log WHERE change_id > ? ORDER BY change_id",
+            (change_id,),
+        )]
+    finally:
+        conn.close()
+
+
+@with_temp_db()
+def test_triggers_log_changes_and_feed_delivers_them():
+    feed = ChangeFeed()
+    stock, everything = [], []
+    feed.subscribe(stock.append, tables=["inventory", "inventory_reservations"])
+    feed.subscribe(everything.append)
+    try:
+        start = feed.poll()  # first poll starts from now
+        tables = feed.table_versions()
+        assert start > 0 and not everything
+        assert feed.poll() == start and not everything  # nothing changed
+
+        _write(
+            "UPDATE inventory SET qty_on_hand = 3 WHERE med_id = 'MED001'",
+            "INSERT INTO prescriptions VALUES ('RX900', 'P001', 'MED002', 'active', '2999-01-01', 1, 'x', NULL)",
+            "DELETE FROM interaction_rules WHERE rule_id = 'INT0001'",
+        )
+        assert _log_after(start) == [
+            ("inventory", "update", "MED001", None),
+            ("prescriptions", "insert", "MED002", "P001"),
+            ("interaction_rules", "delete", "MED001", None),
+            ("interaction_rules", "delete", "MED003", None),
+        ]
+        versions = feed.table_versions()
+        assert {t: versions[t] - tables[t] for t in TRACKED_TABLES} == {
+            "medications": 0, "inventory": 1, "inventory_reservations": 0, "prescriptions": 1,
+            "interaction_rules": 1,
+        }
+
+        head = feed.poll()
+        assert head == start + 4 == feed.version
+        assert [(e.table, e.op, e.med_id) for e in stock] == [("inventory", "update", "MED001")]
+        assert [e.change_id for e in everything] == list(range(start + 1, head + 1))
+        assert everything[1].patient_id == "P001"
+    finally:
+        feed.close()
+
+
+@with_temp_db()
+def test_update_that_changes_a_key_logs_the_old_key_too():
+    feed = ChangeFeed()
+    start = feed.poll()
+    feed.close()
+    _write(
+        "UPDATE prescriptions SET patient_id = 'P003' WHERE rx_id = 'RX0001'",  # P001 -> P003
+        "UPDATE prescriptions SET refills_remaining = 0 WHERE rx_id = 'RX0002'",  # keys unchanged: one row
+        "UPDATE interaction_rules SET med_id_b = 'MED002' WHERE rule_id = 'INT0001'",  # MED003 -> MED002
+    )
+    assert _log_after(start) == [
+        ("prescriptions", "update", "MED003", "P003"),
+        ("prescriptions", "update", "MED003", "P001"),
+        ("prescriptions", "update", "MED003", "P002"),
+        ("interaction_rules", "update", "MED001", None),
+        ("interaction_rules", "update", "MED002", None),
+        ("interaction_rules", "update", "MED003", None),
+    ]
+
+
+@with_temp_db()
+def test_prune_keeps_enough_history_for_any_feed():
+    feed = ChangeFeed()
+    events = []
+    feed.subscribe(events.append, tables=["inventory"])
+    try:
+        feed.poll()
+        conn = database.get_conn()
+        for _ in range(MAX_EVENTS_PER_POLL // 5 + 100):
+            conn.execute("UPDATE inventory SET qty_on_hand = qty_on_hand + 1")  # 5 rows -> 5 log rows
+        conn.commit()
+        conn.close()
+
+        # asked to keep nothing, it still keeps the last MAX_EVENTS_PER_POLL rows
+        assert prune_change_log(keep_last=0) > 0
+        assert len(_log_after(0)) == MAX_EVENTS_PER_POLL
+        assert prune_change_log() == 0
+
+        # this feed is further behind than what is kept: it gets a reset, not a silent gap
+        feed.poll()
+        assert [(e.table, e.op) for e in events] == [("inventory", "reset")]
+    finally:
+        feed.close()
+
+
+@with_temp_db()
+def test_poll_reads_the_log_only_after_a_commit():
+    feed = ChangeFeed()
+    try:
+        start = feed.poll()
+        statements = []
+        feed._conn.set_trace_callback(statements.append)
+        assert [feed.poll() for _ in range(3)] == [start] * 3
+        assert statements == ["PRAGMA data_version"] * 3
+
+        _write("UPDATE inventory SET qty_on_hand = 3 WHERE med_id = 'MED001'")
+        assert feed.poll() == start + 1
+        assert any("change_log" in sql for sql in statements[3:])
+    finally:
+        feed.close()
+
+
+if __name__ == "__main__":
+    test_triggers_log_changes_and_feed_delivers_them()
+    test_update_that_changes_a_key_logs_the_old_key_too()
+    test_prune_keeps_enough_history_for_any_feed()
+    test_poll_reads_the_log_only_after_a_commit()
+    print("OK")
@@ -0,0 +1,93 @@
+"""
+Tool-output compaction: nulls dropped, shared fields hoisted, budget enforced with a marker.
+
+    python -m pytest tests/run_compaction_test.py -q
+    python -m tests.run_compaction_test
+"""
+import json
+from functools import partial
+
+from app.agent.compaction import compact_tool_output
+from app.tools.inventory import inventory_check
+from benchmarks.synthetic import build_synthetic_db
+from tests.helpers import with_temp_db
+
+
+def _option(i, qty):
+    return {
+        "med_id": f"MED{i:03d}", "brand_name": f"Brand{i}", "generic_name": "Ibuprofen",
+        "active_ingredients": ["ibuprofen"], "form": "tablet", "strength": "200 mg", "rx_required": False,
+        "qty_on_hand": qty, "qty_available": None,
+        "disclosure": {"same_active_ingredients": True, "same_strength": True, "same_form": True,
+                       "possible_differences": ["price", "inactive ingredients", "packaging"]},
+    }
+
+
+def test_nulls_dropped_and_common_fields_hoisted():
+    out = {"ok": True, "error": None, "has_more": False, "notes": None,
+           "equivalents": [_option(i, 10 + i) for i in range(5)]}
+    res = compact_tool_output("inventory_find_equivalent", out)
+    data = json.loads(res.text)
+
+    assert "error" not in data and "notes" not in data and "has_more" not in data
+    common = data["equivalents_common"]
+    assert common["generic_name"] == "Ibuprofen" and "possible_differences" in common["disclosure"]
+    assert [e["med_id"] for e in data["equivalents"]] == [f"MED{i:03d}" for i in range(5)]
+    assert all("disclosure" not in e and "qty_available" not in e for e in data["equivalents"])
+    assert res.sent_tokens < res.raw_tokens
+
+
+def test_budget_cuts_trailing_items_with_marker():
+    out = {"ok": True, "matches": [_option(i, i) for i in range(40)]}
+    res = compact_tool_output("inventory_check", out, budget_tokens=300)
+    data = json.loads(res.text)
+
+    assert res.sent_tokens <= 300
+    kept = len(data["matches"])
+    assert kept > 0 and data["matches_omitted"] == 40 - kept == res.omitted_items
+    assert data["matches"][0]["med_id"] == "MED000"  # ranking order preserved
+
+
+def test_avoid_interactions_are_never_cut():
+    levels = ["caution", "avoid", "caution"] * 37  # 111 pairs, avoid ones spread through the list
+    pairs = [
+        {"med_id_a": f"MED{i:03d}", "med_id_b": f"MED{i + 1:03d}", "level": level,
+         "message": f"Synthetic interaction warning number {i}; consult a pharmacist."}
+        for i, level in enumerate(levels)
+    ]
+    out = {"ok": True, "interaction_level": "avoid", "pairs": pairs, "notes": None}
+    res = compact_tool_output("interaction_check", out)
+    data = json.loads(res.text)
+
+    kept = [p.get("level", data.get("pairs_common", {}).get("level")) for p in data["pairs"]]
+    assert res.omitted_items > 0 and data["pairs_omitted"] == res.omitted_items
+    assert kept.count("avoid") == levels.count("avoid")  # every avoid pair survives the budget
+    assert kept == sorted(kept, key=["avoid", "caution"].index)  # most severe first
+
+
+@with_temp_db(partial(build_synthetic_db, n_meds=400, n_rules=0))
+def test_paging_through_cut_pages_sees_every_row_once():
+    payload = {"query": "ibuprofen", "limit": 25}
+    seen, cut, cursor, total = [], 0, None, None
+    while True:
+        out = inventory_check({**payload, "cursor": cursor} if cursor else payload).model_dump()
+        total = total or out["total_count"]
+        res = compact_tool_output("inventory_check", out, budget_tokens=500)
+        data = json.loads(res.text)
+        cut += res.omitted_items
+        seen.extend(m["med_id"] for m in data["matches"])
+        if not data.get("has_more"):
+            assert "next_cursor" not in data
+            break
+        cursor = data["next_cursor"]
+
+    assert cut > 0
+    assert len(seen) == total == len(set(seen))
+
+
+if __name__ == "__main__":
+    test_nulls_dropped_and_common_fields_hoisted()
+    test_budget_cuts_trailing_items_with_marker()
+    test_avoid_interactions_are_never_cut()
+    test_paging_through_cut_pages_sees_every_row_once()
+    print("OK")
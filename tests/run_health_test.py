@@ -0,0 +1,45 @@
+"""
+Liveness / readiness probes.
+
+    python -m pytest tests/run_health_test.py -q
+    python -m tests.run_health_test
+"""
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from app.web.admission import AdmissionController
+from app.web.health import readiness
+from app.web.server import app
+
+WARM = {"steps_ms": {"model_client": 1.0}, "failed": []}
+
+
+def test_not_ready_until_warmed_up():
+    client = TestClient(app)  # no lifespan: warm-up never runs
+    assert client.get("/healthz").json() == {"status": "ok"}
+    r = client.get("/readyz")
+    assert r.status_code == 503
+    body = r.json()
+    assert body["reasons"] == ["warming up"]
+    assert body["db"]["ok"] and body["db"]["medications"] > 0
+
+
+def test_ready_report_and_queue_full():
+    ctl = AdmissionController(max_active=1, max_queue=0)
+    ready, report = asyncio.run(readiness(WARM, ctl))
+    assert ready and report["ready"] and report["warmup"]["done"]
+    assert set(report) >= {"db", "catalog", "pool", "turns"}
+
+    ctl.active, ctl.waiting = 1, 0  # slot taken, no queue room
+    ready, report = asyncio.run(readiness(WARM, ctl))
+    assert not ready and report["reasons"] == ["admission queue full"]
+
+    ready, report = asyncio.run(readiness({"steps_ms": {}, "failed": ["model_client"]}, AdmissionController()))
+    assert not ready and report["reasons"] == ["model client unavailable"]
+
+
+if __name__ == "__main__":
+    test_not_ready_until_warmed_up()
+    test_ready_report_and_queue_full()
+    print("OK")
@@ -0,0 +1,75 @@
+"""
+Bulk feed import: CSV and JSONL rows are upserted, and bad rows (including unparseable JSON) are
+rejected one by one without stopping the load.
+
+    python -m pytest tests/run_import_feed_test.py -q
+    python -m tests.run_import_feed_test
+"""
+import csv
+import json
+import tempfile
+from pathlib import Path
+
+from app.db import database
+from app.db.import_feed import import_feed
+from tests.helpers import with_temp_db
+
+_MED_COLUMNS = ["med_id", "brand_name", "generic_name", "active_ingredients", "form", "strength",
+                "rx_required", "standard_instructions", "common_side_effects", "warnings"]
+
+
+def _med(med_id, brand, ingredients, rx="false"):
+    return [med_id, brand, "Ibuprofen", ingredients, "tablet", "200 mg", rx, "Informational only.", "nausea", ""]
+
+
+def _row(sql, *params):
+    conn = database.get_conn()
+    try:
+        return conn.execute(sql, params).fetchone()
+    finally:
+        conn.close()
+
+
+@with_temp_db()
+def test_csv_and_jsonl_upsert_and_reject_bad_rows():
+    with tempfile.TemporaryDirectory() as tmp:
+        meds = Path(tmp) / "formulary.csv"
+        with open(meds, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(_MED_COLUMNS)
+            writer.writerow(_med("MED001", "Advil Max", "ibuprofen"))  # existing row: updated
+            writer.writerow(_med("MED900", "IbuNew", '["ibuprofen", "caffeine"]'))
+            writer.writerow(_med("MED901", "Broken", '["ibuprofen"'))  # bad JSON list cell
+            writer.writerow(_med("MED902", "Unsure", "ibuprofen", rx="maybe"))  # fails validation
+
+        report = import_feed("medications", meds, chunk_size=2)
+        assert (report.rows_read, report.rows_upserted, report.rows_rejected) == (4, 2, 2), report
+        assert report.errors[0].startswith("row 3: active_ingredients: invalid JSON list")
+        assert report.errors[1].startswith("row 4: rx_required")
+        assert _row("SELECT brand_name FROM medications WHERE med_id = 'MED001'")[0] == "Advil Max"
+        assert json.loads(_row("SELECT active_ingredients FROM medications WHERE med_id = 'MED900'")[0]) == [
+            "ibuprofen", "caffeine"]
+        assert _row("SELECT 1 FROM medications WHERE med_id = 'MED901'") is None
+
+        stock = Path(tmp) / "stock.jsonl"
+        stock.write_text("\n".join([
+            json.dumps({"med_id": "MED900", "qty_on_hand": 12, "location_bin": "B1-01"}),
+            '{"med_id": "MED001", "qty_on_hand": ',  # truncated line
+            json.dumps({"med_id": "MED001", "qty_on_hand": 40}),
+            "[1, 2]",
+            json.dumps({"med_id": "NOPE", "qty_on_hand": 1}),  # unknown medication (FK)
+        ]) + "\n", encoding="utf-8")
+
+        report = import_feed("inventory", stock, chunk_size=2)
+        assert (report.rows_read, report.rows_upserted, report.rows_rejected) == (5, 2, 3), report
+        assert report.errors[0].startswith("row 2: invalid JSON")
+        assert report.errors[1] == "row 4: not a JSON object"
+        assert _row("SELECT qty_on_hand FROM inventory WHERE med_id = 'MED001'")[0] == 40
+        assert tuple(_row("SELECT qty_on_hand, location_bin FROM inventory WHERE med_id = 'MED900'")) == (
+            12, "B1-01")
+        assert _row("SELECT 1 FROM inventory WHERE med_id = 'NOPE'") is None
+
+
+if __name__ == "__main__":
+    test_csv_and_jsonl_upsert_and_reject_bad_rows()
+    print("OK")
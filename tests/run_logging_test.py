@@ -0,0 +1,100 @@
+"""
+JSON logging: redaction, field caps, sampling, queue-based delivery.
+
+    python -m pytest tests/run_logging_test.py -q
+    python -m tests.run_logging_test
+"""
+import io
+import json
+import logging
+
+from pydantic import BaseModel, ValidationError
+
+from app.logging_config import REDACTED, configure_logging, parse_sample_rates, redact, shutdown_logging
+
+
+def _capture(sample_rates, emit):
+    buf = io.StringIO()
+    root = logging.getLogger()
+    saved = (list(root.handlers), root.level, logging.getLogger("pharmacy_agent").level)
+    configure_logging(level="INFO", fmt="json", sample_rates=sample_rates, stream=buf)
+    try:
+        emit(logging.getLogger("pharmacy_agent.test"))
+    finally:
+        shutdown_logging()
+        root.handlers[:] = saved[0]
+        root.setLevel(saved[1])
+        logging.getLogger("pharmacy_agent").setLevel(saved[2])
+    return [json.loads(line) for line in buf.getvalue().splitlines()]
+
+
+def test_redaction_and_field_cap():
+    def emit(log):
+        log.info("tool_event", extra={
+            "tool_name": "prescription_verify",
+            "tool_args": '{"patient_id": "P001", "med_id": "MED003"}',
+            "output": {"ok": True, "patient_id": "P001", "items": ["x" * 100] * 100},
+        })
+        log.warning("Tool input validation failed", extra={"patient_id": "P002"})
+
+    first, second = _capture({}, emit)
+    assert "P001" not in json.dumps(first) and "P002" not in json.dumps(second)
+    assert first["msg"] == "tool_event" and first["tool_name"] == "prescription_verify"
+    assert "MED003" in first["tool_args"]
+    assert isinstance(first["output"], str) and first["output"].endswith("chars]")
+
+
+class _Verify(BaseModel):
+    patient_id: str
+    med_id: str
+
+
+def _validation_error(payload):
+    try:
+        _Verify.model_validate(payload)
+    except ValidationError as e:
+        return str(e)
+    raise AssertionError("expected a validation error")
+
+
+def test_redaction_covers_unquoted_and_pydantic_values():
+    cases = [
+        ('{"patient_id": 12345, "med_id": "MED003"}', "12345"),  # JSON number
+        ("{'patient_id': 'P0\\'77', 'med_id': 'MED003'}", "77"),  # repr with an escaped quote
+        ("patient_id: P001", None),  # not a key: left alone
+        ('{"patient_id":P001}', "P001"),  # bare value
+        (_validation_error({"patient_id": 12345, "med_id": "MED003"}), "12345"),  # input_value under its loc
+        (_validation_error({"patient_id": "P001"}), "P001"),  # the whole input under another loc
+    ]
+    for text, secret in cases:
+        out = redact(text)
+        if secret is None:
+            assert out == text
+        else:
+            assert secret not in out and REDACTED in out, out
+    assert json.loads(redact('{"patient_id": 12345}')) == {"patient_id": REDACTED}
+
+
+def test_sampling_keeps_warnings_and_tags_rate():
+    def emit(log):
+        for _ in range(200):
+            log.info("tool_event")
+        log.info("never")
+        log.warning("never")
+        log.info("always")
+
+    records = _capture({"tool_event": 0.5, "never": 0.0}, emit)
+    sampled = [r for r in records if r["msg"] == "tool_event"]
+    assert 40 < len(sampled) < 160 and all(r["sample_rate"] == 0.5 for r in sampled)
+    assert [r["level"] for r in records if r["msg"] == "never"] == ["WARNING"]
+    assert [r for r in records if r["msg"] == "always"][0].get("sample_rate") is None
+    assert parse_sample_rates("tool_event=0.2, Tool executed successfully=2") == {
+        "tool_event": 0.2, "Tool executed successfully": 1.0,
+    }
+
+
+if __name__ == "__main__":
+    test_redaction_and_field_cap()
+    test_redaction_covers_unquoted_and_pydantic_values()
+    test_sampling_keeps_warnings_and_tags_rate()
+    print("OK")
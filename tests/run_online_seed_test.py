@@ -0,0 +1,91 @@
+"""
+Online reseed: the new generation is swapped in atomically, every data version and active reservation
+is carried across the swap, connections left on the old file cannot write to it, and the live data it
+discards is reported.
+
+    python -m pytest tests/run_online_seed_test.py -q
+    python -m tests.run_online_seed_test
+"""
+import logging
+import os
+import sqlite3
+
+from app.db import database
+from app.db.changes import current_version, get_change_feed
+from app.db.seed import run_online_seed
+from app.tools.inventory import inventory_check
+from app.tools.reservations import inventory_reserve
+from tests.helpers import with_temp_db
+
+
+class _Records(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def _count(sql):
+    conn = database.get_conn()
+    try:
+        return conn.execute(sql).fetchone()[0]
+    finally:
+        conn.close()
+
+
+@with_temp_db()
+def test_swap_carries_versions_and_reservations_and_reports_discarded_data():
+    held = inventory_reserve({"med_id": "MED002", "qty": 2, "ttl_seconds": 600})
+    assert held.ok
+    conn = database.get_conn()
+    conn.execute(
+        "INSERT INTO patients(patient_id, display_name, language_preference) VALUES ('P900', 'Imported', 'en')"
+    )
+    conn.commit()
+    conn.close()
+    cursor = inventory_check({"query": "a", "limit": 1}).next_cursor
+    version, tables = current_version(), get_change_feed().table_versions()
+    old = database.get_conn()  # still open on the original plain file when it is swapped out
+    old.execute("SELECT COUNT(*) FROM inventory").fetchone()
+
+    records = _Records()
+    logger = logging.getLogger("pharmacy_agent.db.seed")
+    logger.addHandler(records)
+    try:
+        gen = run_online_seed()
+        run_online_seed()
+        newest = run_online_seed()
+    finally:
+        logger.removeHandler(records)
+
+    assert database.DB_PATH.is_symlink() and os.path.realpath(database.DB_PATH) == str(newest.resolve())
+    assert not gen.exists()  # only the newest two generations are kept
+    assert current_version() > version
+    assert all(v > tables[t] for t, v in get_change_feed().table_versions().items())
+
+    discarded = records.records[0].discarded
+    assert discarded == {"patients": 1}, discarded
+    assert len(records.records) == 1  # the later swaps had nothing to discard
+    assert _count("SELECT COUNT(*) FROM inventory_reservations") == 1  # the held stock stays held
+    assert _count("SELECT COUNT(*) FROM patients WHERE patient_id = 'P900'") == 0
+
+    # the first swap replaced a plain file: its -wal/-shm would otherwise be left next to the symlink
+    assert not any(os.path.exists(f"{database.DB_PATH}{suffix}") for suffix in ("-wal", "-shm"))
+    try:
+        old.execute("UPDATE inventory SET qty_on_hand = 0")
+        raise AssertionError("a write to the swapped-out file must fail, not be lost")
+    except sqlite3.DatabaseError as e:
+        assert "swapped out" in str(e)
+    finally:
+        old.close()
+
+    # the reseed left the rows of that result set as they were, so its cursor keeps paging
+    resumed = inventory_check({"query": "a", "limit": 1, "cursor": cursor})
+    assert resumed.ok and resumed.matches
+
+
+if __name__ == "__main__":
+    test_swap_carries_versions_and_reservations_and_reports_discarded_data()
+    print("OK")
@@ -0,0 +1,92 @@
+"""
+Keyset pagination of inventory_check / inventory_find_equivalent over a synthetic catalog:
+walking next_cursor must visit every match exactly once, in the single-query order.
+
+    python -m pytest tests/run_pagination_test.py -q
+    python -m tests.run_pagination_test
+"""
+from functools import partial
+
+from app.db import database
+from app.tools.inventory import inventory_check, inventory_find_equivalent
+from app.tools.paging import MAX_PAGE_SIZE
+from benchmarks.synthetic import build_synthetic_db
+from tests.helpers import with_temp_db
+
+_SYNTHETIC = partial(build_synthetic_db, n_meds=400, n_rules=0)
+
+
+def _walk(tool, payload, key):
+    first = tool({**payload, "limit": 7}).model_dump()
+    assert first["ok"], first
+    seen = list(first[key])
+    cursor = first["next_cursor"]
+    while cursor:
+        page = tool({**payload, "limit": 7, "cursor": cursor}).model_dump()
+        assert page["ok"] and page["total_count"] is None
+        seen.extend(page[key])
+        cursor = page["next_cursor"]
+    return first["total_count"], [m["med_id"] for m in seen]
+
+
+def _execute(sql, *params):
+    conn = database.get_conn()
+    conn.execute(sql, params)
+    conn.commit()
+    conn.close()
+
+
+@with_temp_db(_SYNTHETIC)
+def test_inventory_check_pages_cover_all_matches():
+    total, ids = _walk(inventory_check, {"query": "ibuprofen"}, "matches")
+    assert total > MAX_PAGE_SIZE
+    assert len(ids) == total == len(set(ids))
+
+    out = inventory_check({"query": "ibuprofen", "limit": 1000}).model_dump()
+    assert len(out["matches"]) == MAX_PAGE_SIZE and out["has_more"]
+    assert [m["med_id"] for m in out["matches"]] == ids[:MAX_PAGE_SIZE]
+
+
+@with_temp_db(_SYNTHETIC)
+def test_find_equivalent_pages_and_cursor_scope():
+    payload = {"med_id": "SYN000000", "require_same_strength": False, "require_same_form": False}
+    total, ids = _walk(inventory_find_equivalent, payload, "equivalents")
+    assert len(ids) == total == len(set(ids)) and "SYN000000" not in ids
+
+    cursor = inventory_find_equivalent({**payload, "limit": 1}).next_cursor
+    other = inventory_check({"query": "ibuprofen", "cursor": cursor})
+    assert not other.ok and other.error.code == "INVALID_CURSOR"
+
+
+@with_temp_db(_SYNTHETIC)
+def test_cursor_is_rejected_only_when_its_rows_move():
+    payload = {"query": "ibuprofen", "limit": 7}
+    first = inventory_check(payload)
+    assert first.ok and first.next_cursor
+    second = inventory_check({**payload, "cursor": first.next_cursor})
+    assert second.ok and second.matches
+
+    # a sale that keeps the row in stock, or any change outside the result set, leaves the order as it was
+    _execute("UPDATE inventory SET qty_on_hand = qty_on_hand - 1 WHERE med_id = ?", second.matches[-1].med_id)
+    _execute("UPDATE inventory SET qty_on_hand = 0 WHERE med_id = (SELECT med_id FROM medications "
+             "WHERE generic_name NOT LIKE '%ibuprofen%' AND brand_name NOT LIKE '%ibuprofen%' LIMIT 1)")
+    again = inventory_check({**payload, "cursor": first.next_cursor})
+    assert again.ok and [m.med_id for m in again.matches] == [m.med_id for m in second.matches]
+
+    # selling out a row from a later page moves it behind rows already returned
+    _execute("UPDATE inventory SET qty_on_hand = 0 WHERE med_id = ?", second.matches[-1].med_id)
+    stale = inventory_check({**payload, "cursor": first.next_cursor})
+    assert not stale.ok and stale.error.code == "INVALID_CURSOR"
+
+    equivalents = {"med_id": "SYN000000", "require_same_strength": False, "require_same_form": False, "limit": 3}
+    cursor = inventory_find_equivalent(equivalents).next_cursor
+    _execute("UPDATE inventory SET qty_on_hand = 0 WHERE med_id = 'SYN000007'")
+    stale = inventory_find_equivalent({**equivalents, "cursor": cursor})
+    assert not stale.ok and stale.error.code == "INVALID_CURSOR"
+
+
+if __name__ == "__main__":
+    test_inventory_check_pages_cover_all_matches()
+    test_find_equivalent_pages_and_cursor_scope()
+    test_cursor_is_rejected_only_when_its_rows_move()
+    print("OK")
@@ -0,0 +1,102 @@
+"""
+prescription_verify: one indexed query per call, and a bulk API that agrees with it item by item.
+
+    python -m pytest tests/run_prescriptions_test.py -q
+    python -m tests.run_prescriptions_test
+"""
+from fastapi.testclient import TestClient
+
+import app.tools.prescriptions as prescriptions
+import app.web.server as server
+from app.db.database import collect_queries, get_conn
+from app.tools.prescriptions import prescription_verify, prescription_verify_many
+from app.web.admission import AdmissionController
+from app.web.ratelimit import RateLimiter, parse_limits
+from tests.helpers import with_temp_db
+
+
+def _items():
+    conn = get_conn()
+    patients = [r["patient_id"] for r in conn.execute("SELECT patient_id FROM patients")] + ["P999"]
+    meds = [r["med_id"] for r in conn.execute("SELECT med_id FROM medications")] + ["MED999"]
+    conn.close()
+    return [{"patient_id": p, "med_id": m, "intent": i} for p in patients for m in meds for i in ("new", "refill")]
+
+
+def test_verify_is_one_query_seeking_the_expiry_index():
+    conn = get_conn()
+    with collect_queries() as db:
+        out = prescription_verify({"patient_id": "P001", "med_id": "MED003", "intent": "refill"}, conn=conn)
+    assert out.ok and out.rx_required and db.count == 1
+
+    plan = " | ".join(r["detail"] for r in conn.execute(
+        "EXPLAIN QUERY PLAN " + prescriptions._VERIFY_ONE_SQL, (0, "P001", "MED003")))
+    conn.close()
+    assert "idx_rx_patient_med_expiry" in plan and "TEMP B-TREE" not in plan, plan
+
+
+@with_temp_db()
+def test_latest_prescription_wins():
+    conn = get_conn()
+    conn.execute("INSERT INTO prescriptions VALUES ('RXNEW', 'P001', 'MED003', 'active', '2999-01-01', 4, 'x', NULL)")
+    conn.commit()
+    conn.close()
+    out = prescription_verify({"patient_id": "P001", "med_id": "MED003", "intent": "refill"})
+    assert (out.expires_at, out.refills_remaining, out.has_valid_rx) == ("2999-01-01", 4, True)
+
+
+def test_bulk_matches_single_calls():
+    items = _items() + [{"patient_id": "P001"}]  # last one is missing med_id and intent
+    saved = prescriptions.VERIFY_BATCH
+    prescriptions.VERIFY_BATCH = 7  # several statements, last one partial
+    try:
+        results = prescription_verify_many(items)
+    finally:
+        prescriptions.VERIFY_BATCH = saved
+    assert results[:-1] == [prescription_verify(item) for item in items[:-1]]
+    assert results[-1].error.code == "INVALID_TOOL_ARGS"
+
+
+def test_bulk_endpoint():
+    items = _items()[:20]
+    client = TestClient(server.app)
+    r = client.post("/prescriptions/verify", json={"items": items})
+    assert r.status_code == 200
+    assert r.json()["results"] == [prescription_verify(item).model_dump() for item in items]
+    assert server.verify_admission.active == 0
+
+    assert client.post("/prescriptions/verify", json={"pairs": []}).status_code == 422
+    bad = client.post("/prescriptions/verify", content=b"{not json", headers={"content-type": "application/json"})
+    assert bad.status_code == 400
+
+
+def test_bulk_endpoint_is_charged_per_item_and_admitted():
+    client = TestClient(server.app)
+    items = _items()[:20]
+    saved = server.VERIFY_MAX_ITEMS, server.limiter, server.verify_admission
+    server.limiter = RateLimiter(parse_limits("route:/prescriptions/verify=8/60"))
+    try:
+        server.VERIFY_MAX_ITEMS = 5
+        assert client.post("/prescriptions/verify", json={"items": items}).json()["max_items"] == 5
+        server.VERIFY_MAX_ITEMS = 100  # the bucket's burst caps it too
+        assert client.post("/prescriptions/verify", json={"items": items}).json()["max_items"] == 8
+
+        assert client.post("/prescriptions/verify", json={"items": items[:5]}).status_code == 200
+        r = client.post("/prescriptions/verify", json={"items": items[:5]})  # 3 tokens left, 5 items
+        assert r.status_code == 429 and int(r.headers["retry-after"]) >= 1
+        assert client.post("/prescriptions/verify", json={"items": items[:3]}).status_code == 200
+
+        server.limiter = RateLimiter({})
+        server.verify_admission = AdmissionController(max_active=0, max_queue=0)
+        assert client.post("/prescriptions/verify", json={"items": items[:1]}).status_code == 503
+    finally:
+        server.VERIFY_MAX_ITEMS, server.limiter, server.verify_admission = saved
+
+
+if __name__ == "__main__":
+    test_verify_is_one_query_seeking_the_expiry_index()
+    test_latest_prescription_wins()
+    test_bulk_matches_single_calls()
+    test_bulk_endpoint()
+    test_bulk_endpoint_is_charged_per_item_and_admitted()
+    print("OK")
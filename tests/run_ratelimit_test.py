@@ -0,0 +1,149 @@
+"""
+Rate limits: token-bucket refill, shared SQLite buckets, per-patient tool gate, 429 on /chat, client identity.
+
+    python -m pytest tests/run_ratelimit_test.py -q
+    python -m tests.run_ratelimit_test
+"""
+import tempfile
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+import app.web.server as server
+from app.agent.replay import ReplayClient, function_call, message
+from app.agent.runner import run_turn_stream
+from app.web.ratelimit import IDLE_BUCKET_S, MemoryBuckets, RateLimiter, SQLiteBuckets, Throttled, parse_limits
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _allowed(limiter, scope, identity, n):
+    ok = 0
+    for _ in range(n):
+        try:
+            limiter.check(scope, identity)
+            ok += 1
+        except Throttled:
+            pass
+    return ok
+
+
+def test_bucket_bursts_then_refills():
+    clock = FakeClock()
+    limiter = RateLimiter(parse_limits("route:/chat=3/30"), MemoryBuckets(clock))
+    assert _allowed(limiter, "route:/chat", "a", 5) == 3
+    assert _allowed(limiter, "route:/chat", "b", 1) == 1  # buckets are per identity
+    try:
+        limiter.check("route:/chat", "a")
+        raise AssertionError("should be throttled")
+    except Throttled as e:
+        assert e.retry_after_s == 10  # one token per 10 s
+    clock.now += 10
+    assert _allowed(limiter, "route:/chat", "a", 2) == 1
+    assert _allowed(limiter, "tool:unlimited", "a", 50) == 50
+    assert limiter.stats()["throttled"] == {"route:/chat": 4}
+
+
+def test_sqlite_buckets_are_shared_between_workers():
+    with tempfile.TemporaryDirectory() as d:
+        path = Path(d) / "rl.db"
+        limits = parse_limits("patient=4/60")
+        worker_a = RateLimiter(limits, SQLiteBuckets(path))
+        worker_b = RateLimiter(limits, SQLiteBuckets(path))
+        assert _allowed(worker_a, "patient", "P001", 3) + _allowed(worker_b, "patient", "P001", 3) == 4
+        assert not worker_a.allows("patient", "P001") and worker_b.allows("patient", "P002")
+
+
+def test_tool_gate_refuses_per_patient():
+    limiter = RateLimiter(parse_limits("patient=1/60"))
+    verify = {"patient_id": "P001", "med_id": "MED003", "intent": "refill", "language": "en"}
+    script = [
+        [function_call("prescription_verify", verify)],
+        [function_call("prescription_verify", verify)],
+        [message("Done.")],
+    ]
+    events = list(run_turn_stream(user_text="refill for P001", client=ReplayClient(script),
+                                  tool_gate=limiter.tool_gate("client-1")))
+    first, second = [e["output"] for e in events if e["type"] == "tool_result"]
+    assert first["ok"] and second["error"]["code"] == "RATE_LIMITED"
+    assert next(e for e in events if e["type"] == "metrics")["tool_calls_refused"] == 1
+
+
+def test_patient_refusal_does_not_spend_the_tool_token():
+    limiter = RateLimiter(parse_limits("tool:prescription_verify=2/60,patient=1/60"), MemoryBuckets(FakeClock()))
+    gate = limiter.tool_gate("client-1")
+    verify = {"med_id": "MED003", "intent": "refill", "language": "en"}
+    assert gate("prescription_verify", {**verify, "patient_id": "P001"}) is None
+    assert gate("prescription_verify", {**verify, "patient_id": "P001"})["error"]["code"] == "RATE_LIMITED"
+    # the refused call gave its tool token back: another patient still gets the client's second one
+    assert gate("prescription_verify", {**verify, "patient_id": "P002"}) is None
+    assert gate("prescription_verify", {**verify, "patient_id": "P003"})["error"]["code"] == "RATE_LIMITED"
+    assert limiter.stats()["allowed"] == {"tool:prescription_verify": 2, "patient": 2}
+
+
+def test_sqlite_buckets_prune_idle_keys():
+    clock = FakeClock()
+    with tempfile.TemporaryDirectory() as d:
+        buckets = SQLiteBuckets(Path(d) / "rl.db", clock=clock)
+        limiter = RateLimiter(parse_limits("patient=4/60"), buckets)
+        for i in range(5):
+            limiter.check("patient", f"P{i:03d}")
+        clock.now += IDLE_BUCKET_S + 1
+        limiter.check("patient", "P999")
+        keys = [k for (k,) in buckets._conn.execute("SELECT key FROM rate_buckets")]
+        assert keys == ["patient|P999"]
+
+
+def test_chat_returns_429_with_retry_after():
+    saved = server.limiter
+    server.limiter = RateLimiter(parse_limits("route:/chat=1/60"))
+    try:
+        server.limiter.check("route:/chat", "testclient")  # TestClient's peer address: bucket drained
+        # a fresh client header does not buy a fresh bucket
+        r = TestClient(server.app).post("/chat", json={"message": "hi"}, headers={"X-Client-Id": "someone-else"})
+        assert r.status_code == 429 and r.headers["retry-after"] == "60"
+        assert r.json()["scope"] == "route:/chat"
+        assert TestClient(server.app).get("/stats/ratelimit").json()["throttled"] == {"route:/chat": 1}
+    finally:
+        server.limiter = saved
+
+
+def _request(peer, forwarded=None):
+    headers = [(b"x-client-id", b"spoofed")]
+    if forwarded is not None:
+        headers.append((b"x-forwarded-for", forwarded.encode()))
+    return Request({"type": "http", "method": "POST", "path": "/chat", "headers": headers, "client": (peer, 5000)})
+
+
+def test_client_id_is_the_peer_unless_behind_a_trusted_proxy():
+    saved = server.TRUSTED_PROXIES
+    try:
+        server.TRUSTED_PROXIES = []
+        assert server._client_id(_request("203.0.113.9", "198.51.100.1")) == "203.0.113.9"
+
+        server.TRUSTED_PROXIES = server._parse_networks("10.0.0.0/8, 127.0.0.1")
+        assert server._client_id(_request("203.0.113.9", "198.51.100.1")) == "203.0.113.9"  # untrusted peer
+        # rotating the left-most (client-written) hop changes nothing; the proxy-appended hop decides
+        assert server._client_id(_request("10.0.0.2", "1.2.3.4, 198.51.100.7, 10.0.0.5")) == "198.51.100.7"
+        assert server._client_id(_request("10.0.0.2", "5.6.7.8, 198.51.100.7")) == "198.51.100.7"
+        assert server._client_id(_request("10.0.0.2")) == "10.0.0.2"
+    finally:
+        server.TRUSTED_PROXIES = saved
+
+
+if __name__ == "__main__":
+    test_bucket_bursts_then_refills()
+    test_sqlite_buckets_are_shared_between_workers()
+    test_tool_gate_refuses_per_patient()
+    test_patient_refusal_does_not_spend_the_tool_token()
+    test_sqlite_buckets_prune_idle_keys()
+    test_chat_returns_429_with_retry_after()
+    test_client_id_is_the_peer_unless_behind_a_trusted_proxy()
+    print("OK")
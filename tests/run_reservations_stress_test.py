@@ -0,0 +1,109 @@
+"""
+Concurrency stress test for stock reservations: many threads race to hold the same SKU.
+Runs against a throwaway copy of the seeded DB (WAL mode), so app/db/pharmacy.db is untouched.
+
+    python -m pytest tests/run_reservations_stress_test.py -q
+    python -m tests.run_reservations_stress_test
+"""
+import random
+import threading
+import time
+
+from app.db import database
+from app.tools.inventory import inventory_check
+from app.tools.reservations import inventory_commit, inventory_release, inventory_reserve
+from tests.helpers import with_temp_db
+
+THREADS = 16
+ATTEMPTS_PER_THREAD = 25
+MED_ID = "MED002"  # seeded with qty_on_hand=25
+STRESS_STOCK = 300  # enough that the race runs for a while before stock runs out
+
+
+def _set_qty(med_id, qty):
+    conn = database.get_conn()
+    try:
+        conn.execute("UPDATE inventory SET qty_on_hand = ? WHERE med_id = ?", (qty, med_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _qty(med_id):
+    conn = database.get_conn()
+    try:
+        return conn.execute("SELECT qty_on_hand FROM inventory WHERE med_id = ?", (med_id,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+@with_temp_db()
+def test_concurrent_reservations_never_oversell():
+    _set_qty(MED_ID, STRESS_STOCK)
+    on_hand = _qty(MED_ID)
+    held, committed, errors = [], [], []
+    lock = threading.Lock()
+    start = threading.Barrier(THREADS)
+
+    def worker(seed):
+        rnd = random.Random(seed)
+        start.wait()
+        for _ in range(ATTEMPTS_PER_THREAD):
+            out = inventory_reserve({"med_id": MED_ID, "qty": rnd.randint(1, 3), "ttl_seconds": 60})
+            if not out.ok:
+                if out.error.code != "INSUFFICIENT_STOCK":
+                    with lock:
+                        errors.append(out.error.message)
+                continue
+            # settle roughly a third of the holds each way, keep the rest active
+            action = rnd.random()
+            if action < 0.33:
+                done = inventory_release({"reservation_id": out.reservation_id})
+            elif action < 0.66:
+                done = inventory_commit({"reservation_id": out.reservation_id})
+                if done.ok:
+                    with lock:
+                        committed.append(out.qty)
+            else:
+                with lock:
+                    held.append(out.qty)
+                continue
+            if not done.ok:
+                with lock:
+                    errors.append(done.error.message)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(THREADS)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    assert not errors, errors[:5]  # in particular: no "database is locked"
+    remaining = _qty(MED_ID)
+    assert remaining == on_hand - sum(committed)
+    assert sum(held) <= remaining, "active holds exceed stock on hand"
+
+    match = inventory_check({"query": "IbuTabs"}).matches[0]
+    assert match.qty_on_hand == remaining
+    assert match.qty_available == remaining - sum(held)
+    print(f"{THREADS * ATTEMPTS_PER_THREAD} reservation attempts in {elapsed:.2f}s; "
+          f"committed={sum(committed)} held={sum(held)} available={match.qty_available}")
+
+
+@with_temp_db()
+def test_expired_hold_returns_to_available():
+    out = inventory_reserve({"med_id": MED_ID, "qty": 5, "ttl_seconds": 1})
+    assert out.ok and out.qty_available == 20
+    time.sleep(2.1)  # availability reads compare at whole-second resolution
+    assert inventory_check({"query": "IbuTabs"}).matches[0].qty_available == 25
+    late = inventory_commit({"reservation_id": out.reservation_id})
+    assert not late.ok and late.error.code == "RESERVATION_NOT_ACTIVE"
+    assert _qty(MED_ID) == 25
+
+
+if __name__ == "__main__":
+    test_concurrent_reservations_never_oversell()
+    test_expired_hold_returns_to_available()
+    print("ok")
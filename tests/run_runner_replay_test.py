@@ -0,0 +1,450 @@
+"""
+Runner tool loop against the offline replay backend (no network, real tools on the seeded DB).
+
+    python -m pytest tests/run_runner_replay_test.py -q
+    python -m tests.run_runner_replay_test
+"""
+import json
+import logging
+import threading
+import time
+from types import SimpleNamespace
+
+from app.agent.budget import TurnBudget
+from app.agent.cancellation import CancelToken
+from app.agent.memo import ToolMemo
+from app.agent.replay import ReplayClient, function_call, message, request_bytes, stream_error
+from app.agent.runner import run_turn_stream
+from app.agent import early, speculation
+from app.agent.speculation import Speculator
+from app.db import database
+from app.tools.inventory import inventory_check
+from app.web.ratelimit import RateLimiter, parse_limits
+from tests.helpers import with_temp_db
+
+SCRIPT = [
+    [function_call("inventory_check", {"query": "PainAway", "language": "en"})],
+    [function_call("inventory_find_equivalent", {"med_id": "MED001", "language": "en"})],
+    [message("PainAway is out of stock; IbuTabs has the same active ingredient.")],
+]
+# per stream event, like real generation time: a prefetch gets to start before the model asks for it
+# (one still queued when claimed is run inline instead)
+THINK_S = 0.002
+
+
+def _run(client, chain):
+    events = []
+    gen = run_turn_stream(user_text="Do you have PainAway?", client=client, chain_responses=chain)
+    try:
+        while True:
+            events.append(next(gen))
+    except StopIteration as si:
+        return events, si.value
+
+
+def test_full_resend_and_chained_give_same_turn():
+    full_client = ReplayClient(SCRIPT)
+    full_events, full_history = _run(full_client, chain=False)
+    chained_client = ReplayClient(SCRIPT)
+    chained_events, chained_history = _run(chained_client, chain=True)
+
+    assert [e["type"] for e in full_events] == [e["type"] for e in chained_events]
+    assert full_history == chained_history
+    assert full_history[-1]["content"].startswith("PainAway is out of stock")
+
+    # chained iterations send only the new function_call_output items
+    later = chained_client.requests[1:]
+    assert all(r["previous_response_id"] for r in later)
+    assert all(i["type"] == "function_call_output" for r in later for i in r["input"])
+    assert sum(map(request_bytes, chained_client.requests)) < sum(map(request_bytes, full_client.requests))
+
+    metrics = next(e for e in chained_events if e["type"] == "metrics")
+    assert metrics["chained_calls"] == 2 and metrics["chain_fallbacks"] == 0
+
+
+def test_rejected_chain_falls_back_to_full_resend():
+    # the provider refuses an unknown previous_response_id either on create() or as a stream "error" event
+    for rejection in ("raise", "event"):
+        client = ReplayClient(SCRIPT, reject_chaining=True, rejection=rejection)
+        events, history = _run(client, chain=True)
+
+        assert not any(e["type"] == "error" for e in events), rejection
+        assert history[-1]["content"].startswith("PainAway is out of stock")
+        metrics = next(e for e in events if e["type"] == "metrics")
+        assert metrics["chain_fallbacks"] == 1 and metrics["chained_calls"] == 0
+        assert metrics["model_calls"] == 3
+        # the rejected call was retried in full, and the rest of the turn is sent in full
+        assert [bool(r.get("previous_response_id")) for r in client.requests] == [False, True, False, False]
+
+
+def test_out_of_stock_follow_up_is_prefetched():
+    events, _ = _run(ReplayClient(SCRIPT, event_delay_s=THINK_S), chain=False)
+
+    results = [e for e in events if e["type"] == "tool_result"]
+    assert [r.get("prefetched", False) for r in results] == [False, True]
+    assert results[1]["output"]["ok"] and results[1]["output"]["equivalents"]
+    metrics = next(e for e in events if e["type"] == "metrics")
+    assert metrics["prefetch_hits"] == 1 and metrics["prefetch_wasted"] == 0
+
+
+def test_prefetch_goes_through_the_gate_once():
+    asked = []
+
+    def allow(name, args):
+        asked.append(name)
+        return None
+
+    events = list(run_turn_stream(user_text="Do you have PainAway?", client=ReplayClient(SCRIPT, event_delay_s=THINK_S),
+                                  tool_gate=allow))
+    # the model's matching call is charged once, and served from the prefetch
+    assert asked == ["inventory_check", "inventory_find_equivalent"]
+    assert [e.get("prefetched", False) for e in events if e["type"] == "tool_result"] == [False, True]
+
+    # a prediction only peeks at the buckets: unused, it costs the client nothing
+    limiter = RateLimiter(parse_limits("tool:inventory_find_equivalent=1/60"))
+    events = list(run_turn_stream(user_text="Do you have PainAway?", tool_gate=limiter.tool_gate("client-1"),
+                                  client=ReplayClient([SCRIPT[0], [message("PainAway is out of stock.")]],
+                                                      event_delay_s=THINK_S)))
+    metrics = next(e for e in events if e["type"] == "metrics")
+    assert (metrics["prefetch_submitted"], metrics["prefetch_wasted"]) == (1, 1)
+    assert limiter.allows("tool:inventory_find_equivalent", "client-1")
+
+    # throttled: never scheduled, and the model's own call gets the refusal
+    limiter.check("tool:inventory_find_equivalent", "client-1")
+    events = list(run_turn_stream(user_text="Do you have PainAway?", client=ReplayClient(SCRIPT),
+                                  tool_gate=limiter.tool_gate("client-1")))
+    metrics = next(e for e in events if e["type"] == "metrics")
+    assert (metrics["prefetch_submitted"], metrics["prefetch_refused"]) == (0, 1)
+    assert [e for e in events if e["type"] == "tool_result"][1]["output"]["error"]["code"] == "RATE_LIMITED"
+
+
+OUT_OF_STOCK = {"ok": True, "matches": [{"med_id": "MED001", "qty_on_hand": 0}]}
+EQUIVALENT = ("inventory_find_equivalent", {"med_id": "MED001", "language": "en"})
+
+
+@with_temp_db()
+def test_claimed_prefetch_is_never_waited_on_unbounded():
+    release = threading.Event()
+
+    # queued behind other turns' work on the shared pool: cancelled, the caller dispatches inline
+    busy = [speculation._executor.submit(release.wait, 5) for _ in range(speculation._executor._max_workers)]
+    spec = Speculator("Do you have PainAway?", enabled=True, dispatch=lambda name, args: {"ok": True})
+    spec.observe("inventory_check", {"query": "PainAway", "language": "en"}, OUT_OF_STOCK)
+    prefetch = spec.claim(*EQUIVALENT)
+    t0 = time.perf_counter()
+    assert spec.result(EQUIVALENT[0], prefetch) is None and prefetch[1].cancelled()
+    assert time.perf_counter() - t0 < 0.5 and spec.late == 1
+    release.set()
+    for f in busy:
+        f.result()
+
+    # running but slow: waited for wait_s, or until the turn is cancelled
+    release.clear()
+    cancel = CancelToken()
+    for wait_s, cancel_after in ((0.1, None), (10, 0.1)):
+        spec = Speculator("Do you have PainAway?", enabled=True, cancel=cancel, wait_s=wait_s,
+                          dispatch=lambda name, args: release.wait(5) and {"ok": True})
+        spec.observe("inventory_check", {"query": "PainAway", "language": "en"}, OUT_OF_STOCK)
+        prefetch = spec.claim(*EQUIVALENT)
+        time.sleep(0.05)  # let it start
+        if cancel_after is not None:
+            threading.Timer(cancel_after, cancel.cancel).start()
+        t0 = time.perf_counter()
+        assert spec.result(EQUIVALENT[0], prefetch) is None
+        assert time.perf_counter() - t0 < 1 and spec.late == 1
+    release.set()
+
+
+@with_temp_db()
+def test_early_call_is_never_waited_on_unbounded():
+    release = threading.Event()
+    check = {"query": "PainAway", "language": "en"}
+
+    # queued behind other turns' work on the shared pool: cancelled, the caller dispatches inline
+    busy = [early._executor.submit(release.wait, 5) for _ in range(early._executor._max_workers)]
+    dispatch = early.EarlyDispatch(enabled=True)
+    assert dispatch.start("inventory_check", "c1", json.dumps(check))
+    t0 = time.perf_counter()
+    assert dispatch.take("inventory_check", "c1", check) is None
+    assert time.perf_counter() - t0 < 0.5 and dispatch.late == 1
+    release.set()
+    for f in busy:
+        f.result()
+
+    # running but slow: waited for wait_s, or until the turn is cancelled
+    release.clear()
+    run = early._run
+    early._run = lambda name, args: release.wait(5) and run(name, args)
+    try:
+        cancel = CancelToken()
+        for wait_s, cancel_after in ((0.1, None), (10, 0.1)):
+            dispatch = early.EarlyDispatch(enabled=True, cancel=cancel, wait_s=wait_s)
+            assert dispatch.start("inventory_check", "c1", json.dumps(check))
+            time.sleep(0.05)  # let it start
+            if cancel_after is not None:
+                threading.Timer(cancel_after, cancel.cancel).start()
+            t0 = time.perf_counter()
+            assert dispatch.take("inventory_check", "c1", check) is None
+            assert time.perf_counter() - t0 < 1 and dispatch.late == 1
+    finally:
+        release.set()
+        early._run = run
+
+
+def test_perf_event_breaks_down_the_turn():
+    events = list(run_turn_stream(user_text="Do you have PainAway?", client=ReplayClient(SCRIPT, event_delay_s=THINK_S),
+                                  perf=True))
+    assert [e["type"] for e in events][-3:] == ["metrics", "perf", "done"]
+    perf = events[-2]
+
+    assert perf["model_iterations"] == 3 and len(perf["iterations"]) == 3
+    assert perf["iterations"][-1]["ttft_ms"] is not None  # the answer streams text deltas
+    assert perf["input_tokens"] == events[-3]["input_tokens"] > 0
+    check, equivalent = perf["tools"]
+    assert check["name"] == "inventory_check" and check["db_queries"] > 0 and not check["prefetched"]
+    assert equivalent["prefetched"] and equivalent["db_queries"] == 0
+    assert perf["db_queries"] == check["db_queries"]
+
+    # off by default
+    assert "perf" not in [e["type"] for e in run_turn_stream(user_text="hi", client=ReplayClient([[message("hello")]]))]
+
+
+def test_budget_ends_turn_with_a_tool_free_answer():
+    looping = [[function_call("inventory_check", {"query": f"PainAway{i}", "language": "en"})] for i in range(5)]
+    client = ReplayClient(looping[:2] + [[message("I could only check part of that.")]])
+    events = list(run_turn_stream(user_text="Do you have PainAway?", client=client,
+                                  budget=TurnBudget(max_model_calls=3)))
+
+    exhausted = next(e for e in events if e["type"] == "budget_exhausted")
+    assert exhausted["budget"] == "model_calls" and exhausted["limit"] == 3
+    assert len(client.requests) == 3 and client.requests[-1]["tool_choice"] == "none"
+    assert client.requests[-1]["tools"] == client.requests[0]["tools"]  # cacheable prefix kept
+    assert any(isinstance(i, dict) and i.get("role") == "developer" for i in client.requests[-1]["input"])
+    assert [e["type"] for e in events][-2:] == ["metrics", "done"]
+    assert events[-2]["budget_exhausted"] == "model_calls"
+
+
+class _StalledClient:
+    """Streams one delta, then blocks until the stream is closed (an upstream that stopped sending)."""
+
+    def __init__(self):
+        self.responses = self
+        self.closed = threading.Event()
+
+    def create(self, **request):
+        return self
+
+    def __iter__(self):
+        yield SimpleNamespace(type="response.output_text.delta", delta="Checking")
+        self.closed.wait(5)
+        raise ConnectionError("stream closed")
+
+    def close(self):
+        self.closed.set()
+
+
+def test_wall_time_is_enforced_while_streaming():
+    t0 = time.perf_counter()
+    client = _StalledClient()
+    events = list(run_turn_stream(user_text="Do you have PainAway?", client=client,
+                                  budget=TurnBudget(max_wall_s=0.2)))
+    assert time.perf_counter() - t0 < 2 and client.closed.is_set()
+    assert [e["type"] for e in events] == ["text_delta", "budget_exhausted", "metrics", "error"]
+    assert events[1]["budget"] == "wall_s" and events[2]["budget_exhausted"] == "wall_s"
+
+    # a stream that keeps sending is cut off too
+    slow = ReplayClient([[message(" ".join(["word"] * 200))]], event_delay_s=0.01)
+    events = list(run_turn_stream(user_text="hi", client=slow, budget=TurnBudget(max_wall_s=0.2)))
+    assert [e["type"] for e in events][-3:] == ["budget_exhausted", "metrics", "error"]
+    assert len([e for e in events if e["type"] == "text_delta"]) < 100
+
+
+def test_tool_calls_over_budget_are_not_run():
+    calls = [function_call("inventory_check", {"query": q, "language": "en"}) for q in ("PainAway", "IbuTabs", "Zyrex")]
+    client = ReplayClient([calls, [message("Checked one of them.")]])
+    events = list(run_turn_stream(user_text="Stock of three meds?", client=client, budget=TurnBudget(max_tool_calls=1)))
+
+    assert len([e for e in events if e["type"] == "tool_result"]) == 1
+    outputs = [i for i in client.requests[1]["input"] if isinstance(i, dict) and i.get("type") == "function_call_output"]
+    assert len(outputs) == 3 and '"BUDGET_EXHAUSTED"' in outputs[-1]["output"]
+    metrics = next(e for e in events if e["type"] == "metrics")
+    assert metrics["budget_exhausted"] == "tool_calls" and metrics["tool_calls_skipped"] == 2
+
+
+@with_temp_db()
+def test_repeated_call_is_deduped_until_stock_changes():
+    check = {"query": "PainAway", "language": "en"}
+    script = [[function_call("inventory_check", check)] for _ in range(3)] + [[message("Still out of stock.")]]
+    gate_calls = []
+
+    def restock_before_third_call(name, args):
+        if name == "inventory_check":  # the gate also sees the find_equivalent prefetch
+            gate_calls.append(name)
+        if name == "inventory_check" and len(gate_calls) == 3:
+            conn = database.get_conn()
+            conn.execute("UPDATE inventory SET qty_on_hand = 7 WHERE med_id = 'MED001'")
+            conn.commit()
+            conn.close()
+        return None
+
+    events = list(run_turn_stream(user_text="Do you have PainAway?", client=ReplayClient(script),
+                                  tool_gate=restock_before_third_call))
+    first, repeat, after_restock = [e for e in events if e["type"] == "tool_result"]
+    assert repeat.get("deduped") and repeat["output"] == first["output"]
+    assert not after_restock.get("deduped")
+    assert after_restock["output"]["matches"][0]["qty_on_hand"] == 7
+    assert next(e for e in events if e["type"] == "metrics")["tool_calls_deduped"] == 1
+
+
+@with_temp_db()
+def test_memoized_stock_lapses_with_the_earliest_reservation():
+    check = {"query": "IbuTabs", "language": "en"}
+    conn = database.get_conn()
+    conn.execute(
+        "INSERT INTO inventory_reservations VALUES ('R1', 'MED002', 2, 'active', ?, ?)",
+        (time.time(), time.time() + 0.3),
+    )
+    conn.commit()
+    conn.close()
+
+    memo = ToolMemo()
+    version = memo.version()
+    held = inventory_check(check).model_dump()
+    memo.put("inventory_check", check, held, version)
+    assert memo.get("inventory_check", check) == held
+
+    # the hold lapses without any write: the data version is unchanged, but qty_available is not
+    time.sleep(0.35)
+    assert memo.version() == version
+    assert memo.get("inventory_check", check) is None and memo.stale == 1
+
+
+def test_tool_calls_start_before_response_completes():
+    checks = [{"query": q, "language": "en"} for q in ("PainAway", "Ibuprofen", "Aspirin")]
+    client = ReplayClient([[function_call("inventory_check", c) for c in checks], [message("Here is what we have.")]],
+                          event_delay_s=0.001)
+    events = list(run_turn_stream(user_text="Do you have these?", client=client, perf=True))
+
+    results = [e for e in events if e["type"] == "tool_result"]
+    assert [r["call_id"] for r in results] == [e["call_id"] for e in events if e["type"] == "tool_call"]
+    metrics = next(e for e in events if e["type"] == "metrics")
+    assert (metrics["early_started"], metrics["early_used"], metrics["early_wasted"]) == (3, 3, 0)
+    assert all(t["early"] for t in next(e for e in events if e["type"] == "perf")["tools"])
+
+    off = list(run_turn_stream(user_text="Do you have these?", early_dispatch=False,
+                               client=ReplayClient([[function_call("inventory_check", c) for c in checks],
+                                                    [message("Here is what we have.")]])))
+    assert [e["output"] for e in off if e["type"] == "tool_result"] == [r["output"] for r in results]
+    assert next(e for e in off if e["type"] == "metrics")["early_started"] == 0
+
+
+def test_throttled_calls_never_start_early():
+    checks = [{"query": q, "language": "en"} for q in ("PainAway", "Ibuprofen", "IbuTabs")]
+    asked = []
+
+    def refuse_second(name, args):
+        if name != "inventory_check":
+            return None  # the find_equivalent prefetch for out-of-stock PainAway
+        asked.append(args["query"])
+        if args["query"] == "Ibuprofen":
+            return {"ok": False, "error": {"code": "RATE_LIMITED", "message": "Too many requests."}}
+        return None
+
+    client = ReplayClient([[function_call("inventory_check", c) for c in checks], [message("Two of three.")]],
+                          event_delay_s=0.001)
+    events = list(run_turn_stream(user_text="Do you have these?", client=client, tool_gate=refuse_second))
+
+    assert asked == ["PainAway", "Ibuprofen", "IbuTabs"]  # one verdict per call, taken before it starts
+    outputs = [e["output"] for e in events if e["type"] == "tool_result"]
+    assert outputs[1]["error"]["code"] == "RATE_LIMITED" and outputs[0]["ok"] and outputs[2]["ok"]
+    metrics = next(e for e in events if e["type"] == "metrics")
+    assert (metrics["early_started"], metrics["early_used"], metrics["tool_calls_refused"]) == (2, 2, 1)
+
+
+class _Records(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def test_cancel_stops_turn_and_records_wasted_work():
+    handler = _Records()
+    agent_logger = logging.getLogger("pharmacy_agent.agent")
+    agent_logger.addHandler(handler)
+    level = agent_logger.level
+    agent_logger.setLevel(logging.INFO)
+    try:
+        client = ReplayClient(SCRIPT)
+        cancel = CancelToken()
+        gen = run_turn_stream(user_text="Do you have PainAway?", client=client, chain_responses=False, cancel=cancel)
+        seen = []
+        try:
+            while True:
+                ev = next(gen)
+                seen.append(ev["type"])
+                if ev["type"] == "tool_result":
+                    cancel.cancel("client disconnected")
+        except StopIteration:
+            pass
+    finally:
+        agent_logger.removeHandler(handler)
+        agent_logger.setLevel(level)
+
+    assert seen == ["tool_call", "tool_result"]  # nothing after the cancel
+    assert len(client.requests) == 1  # no further model call
+    rec = next(r for r in handler.records if r.getMessage() == "Turn cancelled")
+    assert rec.cancelled and rec.wasted_tool_calls == 1 and rec.prefetch_wasted == 1
+
+
+def test_cancel_closes_upstream_stream_mid_answer():
+    client = ReplayClient([[message("one two three four five six")]])
+    cancel = CancelToken()
+    gen = run_turn_stream(user_text="hello", client=client, chain_responses=False, cancel=cancel)
+    assert next(gen)["type"] == "text_delta"
+    cancel.cancel()
+    deltas = 0
+    try:
+        while True:
+            next(gen)
+            deltas += 1
+    except StopIteration:
+        pass
+    assert deltas == 0
+
+
+def test_failed_model_call_still_closes_background_work():
+    # the out-of-stock result schedules a prefetch; then the next model call fails in the stream / on create
+    for script, message_start in (
+        ([SCRIPT[0], [stream_error("The server had an error.")]], "The server had an error."),
+        ([SCRIPT[0]], "OpenAI call failed: Replay script exhausted."),
+    ):
+        events = list(run_turn_stream(user_text="Do you have PainAway?", client=ReplayClient(script),
+                                      chain_responses=False))
+        assert [e["type"] for e in events][-2:] == ["metrics", "error"]
+        assert events[-1]["message"].startswith(message_start)
+        metrics = events[-2]
+        assert (metrics["prefetch_submitted"], metrics["prefetch_wasted"]) == (1, 1)
+
+
+if __name__ == "__main__":
+    test_full_resend_and_chained_give_same_turn()
+    test_rejected_chain_falls_back_to_full_resend()
+    test_out_of_stock_follow_up_is_prefetched()
+    test_prefetch_goes_through_the_gate_once()
+    test_cancel_stops_turn_and_records_wasted_work()
+    test_cancel_closes_upstream_stream_mid_answer()
+    test_perf_event_breaks_down_the_turn()
+    test_budget_ends_turn_with_a_tool_free_answer()
+    test_wall_time_is_enforced_while_streaming()
+    test_tool_calls_over_budget_are_not_run()
+    test_repeated_call_is_deduped_until_stock_changes()
+    test_memoized_stock_lapses_with_the_earliest_reservation()
+    test_tool_calls_start_before_response_completes()
+    test_throttled_calls_never_start_early()
+    test_failed_model_call_still_closes_background_work()
+    test_claimed_prefetch_is_never_waited_on_unbounded()
+    test_early_call_is_never_waited_on_unbounded()
+    print("OK")
@@ -0,0 +1,29 @@
+"""
+Startup: entry points don't import the OpenAI SDK; warm-up loads it along with schemas, catalog and tool paths.
+
+    python -m pytest tests/run_startup_test.py -q
+    python -m tests.run_startup_test
+"""
+import subprocess
+import sys
+
+from app.web.warmup import warm_up
+
+
+def test_entry_points_defer_the_sdk_import():
+    for module in ("app.cli_chat", "app.web.server"):
+        code = f"import sys, {module}; sys.exit('openai' in sys.modules)"
+        assert subprocess.run([sys.executable, "-c", code]).returncode == 0, module
+
+
+def test_warm_up_reports_every_step():
+    report = warm_up()
+    assert set(report["steps_ms"]) == {"model_client", "request_prefix", "catalog", "tool_calls"}
+    assert set(report["failed"]) <= {"model_client"}  # no OPENAI_API_KEY in CI
+    assert "openai" in sys.modules
+
+
+if __name__ == "__main__":
+    test_entry_points_defer_the_sdk_import()
+    test_warm_up_reports_every_step()
+    print("OK")
@@ -0,0 +1,44 @@
+"""
+Strength parsing/normalization (app/db/strength.py): what same-strength equivalence compares.
+
+    python -m pytest tests/run_strength_test.py -q
+    python -m tests.run_strength_test
+"""
+from app.db.strength import normalize_strength, parse_strength
+
+
+def test_thousands_separators_are_not_decimals():
+    for text in ("1,000 mg", "1 000 mg", "1000 mg", "1,000mg", "1\u202f000 mg"):
+        assert normalize_strength(text) == (1000.0, "mg"), text
+    assert normalize_strength("1,000.5 mg") == (1000.5, "mg")
+    assert normalize_strength("1,000 mg") != normalize_strength("1 mg")
+
+
+def test_decimals():
+    assert normalize_strength("0.5 mg") == (0.5, "mg")
+    assert normalize_strength("0,5 mg") == (0.5, "mg")  # decimal comma
+    assert normalize_strength("2,5 mg") == (2.5, "mg")
+    assert normalize_strength("1,50 mg") == (1.5, "mg")  # not a group of three digits
+
+
+def test_ranges_have_no_single_strength():
+    for text in ("200-400 mg", "200 - 400 mg", "200–400mg", "200 mg - 400 mg", "200 to 400 mg"):
+        assert parse_strength(text) is None, text
+        assert normalize_strength(text) == (None, None), text
+
+
+def test_unit_conversion():
+    assert normalize_strength("0.2 g") == (200.0, "mg") == normalize_strength("200 mg")
+    assert normalize_strength("500 mcg") == (0.5, "mg")
+    assert normalize_strength("10 mg/5 mL") == (2.0, "mg/mL") == normalize_strength("2 mg/mL")
+    assert normalize_strength("1 g/L") == (1.0, "mg/mL")
+    assert normalize_strength("1,000 IU") == (1000.0, "IU")
+    assert normalize_strength("tablet") == (None, None)
+
+
+if __name__ == "__main__":
+    test_thousands_separators_are_not_decimals()
+    test_decimals()
+    test_ranges_have_no_single_strength()
+    test_unit_conversion()
+    print("OK")